@@ -0,0 +1,201 @@
+#Benchmark of the simulator and the optimizers across map sizes, population sizes and episodes per evaluation.
+#Writes the results as JSON and compares them against a stored baseline, a throughput drop larger than
+#the threshold is reported as a regression. Value iteration over the episode time limit gives the optimal expected
+#steps of every map, the PSO and GA are reported by the exact gap of their best policy to it and the time they took to
+#come within OPTIMAL_TOLERANCE of it. Runs offline on the CPU.
+#
+#python -m benchmark --output bench.json --baseline baseline.json
+
+import argparse
+import itertools
+import json
+import os
+import platform
+import sys
+import time
+
+import numpy as np
+
+from frozen_lake_openai import FrozenLakeFitness, make_env, max_sweeps, run_ga, run_pso
+from frozen_lake_sim import positions_to_policies, simulate_batch
+from reference_solvers import ValueIteration, horizon_policy_costs
+
+# metrics where a higher value is better, every other timed metric is better when lower
+THROUGHPUT_METRICS = ('episodes_per_sec', 'steps_per_sec', 'pso_evaluations_per_sec', 'ga_evaluations_per_sec')
+TIME_METRICS = ('pso_seconds_per_generation', 'ga_seconds_per_generation')
+
+# relative distance to the optimal average steps that counts as having found the optimum
+OPTIMAL_TOLERANCE = 0.05
+
+
+# best wall time of repeats calls of fn, the result of the last call is returned as well
+def _time_best(fn, repeats):
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+
+# runs an optimizer through run(callback) and returns its wall time, the time its best fitness first came within
+# OPTIMAL_TOLERANCE of the reference (None if it never did) and the finished optimizer
+def _time_to_reference(run, reference_score):
+    start = time.perf_counter()
+    reached = []
+
+    def callback(optimizer):
+        if not reached and min(optimizer.best_history) <= reference_score * (1 + OPTIMAL_TOLERANCE):
+            reached.append(time.perf_counter() - start)
+
+    optimizer = run(callback)
+    return time.perf_counter() - start, (reached or [None])[0], optimizer
+
+
+# value iteration over max_steps steps left, only the Bellman sweeps run and no policy is simulated
+def _solve_reference(fitness, max_steps):
+    solver = ValueIteration(fitness, fitness.transitions, horizon=max_steps)
+    solver.solve(max_sweeps)
+    return solver
+
+
+# function to measure one (env_size, population, episodes) case
+def benchmark_case(env_size, population, episodes, generations=3, repeats=3, seed=42):
+    env, desc = make_env(env_size, seed)
+    # no cache, every evaluation pays for the full simulation
+    fitness = FrozenLakeFitness(env, desc, num_episodes=episodes, seed=seed, cache_size=0)
+    try:
+        rng = np.random.default_rng(seed)
+        policies = rng.integers(0, fitness.num_actions, size=(population, fitness.num_dimensions), dtype=np.uint8)
+        max_steps = env.spec.max_episode_steps
+        sim_seconds, stats = _time_best(
+            lambda: simulate_batch(fitness.transitions, policies, episodes, max_steps=max_steps, rng=rng), repeats)
+
+        reference_seconds, reference = _time_best(lambda: _solve_reference(fitness, max_steps), repeats)
+        # the expected steps of the best policy within the time limit, no policy beats it on average
+        optimal_steps = reference.optimal_cost
+
+        # patience of generations + 1 so early stopping never cuts the timed run short
+        pso_seconds, pso_time_to_optimal, swarm = _time_to_reference(
+            lambda callback: run_pso(fitness, population, generations, seed, patience=generations + 1, callback=callback),
+            optimal_steps)
+        ga_seconds, ga_time_to_optimal, ga = _time_to_reference(
+            lambda callback: run_ga(fitness, population, generations, seed, patience=generations + 1, callback=callback),
+            optimal_steps)
+        # the gaps use the exact expected steps of the best policies, not the optimistic fitness they were selected on
+        pso_steps, ga_steps = horizon_policy_costs(
+            fitness.transitions, positions_to_policies(np.stack([swarm.global_best_position, ga.best_position]),
+                                                       fitness.num_actions), max_steps)
+    finally:
+        fitness.close()
+
+    return {
+        'env_size': env_size,
+        'population': population,
+        'episodes': episodes,
+        'generations': generations,
+        'simulate_seconds': sim_seconds,
+        'episodes_per_sec': population * episodes / sim_seconds,
+        'steps_per_sec': float(stats.steps.sum()) / sim_seconds,
+        'pso_seconds_per_generation': pso_seconds / generations,
+        'pso_evaluations_per_sec': population * generations / pso_seconds,
+        'ga_seconds_per_generation': ga_seconds / generations,
+        'ga_evaluations_per_sec': population * generations / ga_seconds,
+        'reference_seconds': reference_seconds,
+        'optimal_steps': float(optimal_steps),
+        'pso_gap_to_optimal': float(pso_steps - optimal_steps),
+        'ga_gap_to_optimal': float(ga_steps - optimal_steps),
+        'pso_time_to_optimal': pso_time_to_optimal,
+        'ga_time_to_optimal': ga_time_to_optimal,
+    }
+
+
+def machine_info():
+    return {
+        'python': platform.python_version(),
+        'numpy': np.__version__,
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+    }
+
+
+# function to run every combination of the sweep
+def run_benchmarks(env_sizes, populations, episodes_list, generations=3, repeats=3, seed=42, verbose=True):
+    results = []
+    for env_size, population, episodes in itertools.product(env_sizes, populations, episodes_list):
+        result = benchmark_case(env_size, population, episodes, generations, repeats, seed)
+        results.append(result)
+        if verbose:
+            print(f"size={env_size:3d} population={population:6d} episodes={episodes:6d}  "
+                  f"{result['episodes_per_sec']:12.0f} episodes/s  "
+                  f"PSO {result['pso_seconds_per_generation']:.4f} s/gen  "
+                  f"GA {result['ga_seconds_per_generation']:.4f} s/gen  "
+                  f"VI {result['reference_seconds'] * 1000:.1f} ms  "
+                  f"gap PSO {result['pso_gap_to_optimal']:+.3f} GA {result['ga_gap_to_optimal']:+.3f} steps")
+    return {'machine': machine_info(), 'results': results}
+
+
+def _case_key(result):
+    return result['env_size'], result['population'], result['episodes']
+
+
+# compares the results against a baseline, returns the metrics that got worse by more than threshold
+def compare(current, baseline, threshold=0.1):
+    baseline_cases = {_case_key(result): result for result in baseline['results']}
+    regressions = []
+    for result in current['results']:
+        base = baseline_cases.get(_case_key(result))
+        if base is None:
+            continue
+        for metric in THROUGHPUT_METRICS + TIME_METRICS:
+            if metric not in base:
+                continue
+            # ratio above 1 means faster than the baseline
+            if metric in THROUGHPUT_METRICS:
+                ratio = result[metric] / base[metric]
+            else:
+                ratio = base[metric] / result[metric]
+            if ratio < 1 - threshold:
+                regressions.append({'case': _case_key(result), 'metric': metric,
+                                    'baseline': base[metric], 'current': result[metric], 'ratio': ratio})
+    return regressions
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the FrozenLake simulator, PSO and GA.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=[4, 8, 16, 32, 64])
+    parser.add_argument('--populations', type=int, nargs='+', default=[10, 100])
+    parser.add_argument('--episodes', type=int, nargs='+', default=[100, 1000])
+    parser.add_argument('--generations', type=int, default=3, help="generations timed for PSO and GA")
+    parser.add_argument('--repeats', type=int, default=3, help="repeats of the simulator timing, the best is kept")
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--output', default='bench.json', help="JSON file the results are written to")
+    parser.add_argument('--baseline', help="JSON results of an earlier run to compare against")
+    parser.add_argument('--threshold', type=float, default=0.1, help="allowed relative slowdown before a regression")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    current = run_benchmarks(args.sizes, args.populations, args.episodes, args.generations, args.repeats, args.seed)
+    with open(args.output, 'w') as f:
+        json.dump(current, f, indent=2)
+    print("Results written to", args.output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold)
+        for regression in regressions:
+            print("REGRESSION {case} {metric}: {baseline:.4g} -> {current:.4g} ({ratio:.2f}x)".format(**regression))
+        if regressions:
+            return 1
+        print("No regressions against", args.baseline)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
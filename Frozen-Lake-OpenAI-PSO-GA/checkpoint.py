@@ -0,0 +1,38 @@
+#Checkpoints of a run in a single uncompressed .npz file. The state is a dict of sections, each a dict of arrays
+#and scalars, stored under "section/name" keys. Writes go to a temporary file that replaces the checkpoint in one
+#os.replace, so a crash mid-write never leaves a broken checkpoint behind.
+
+import json
+import os
+
+import numpy as np
+
+
+# JSON text of a numpy Generator's bit generator state, restored with restore_rng
+def rng_state(rng):
+    return json.dumps(rng.bit_generator.state)
+
+
+def restore_rng(rng, state):
+    rng.bit_generator.state = json.loads(str(state))
+
+
+def save_checkpoint(path, state):
+    arrays = {f'{section}/{name}': np.asarray(value)
+              for section, values in state.items() for name, value in values.items()}
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        np.savez(f, **arrays)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+
+def load_checkpoint(path):
+    state = {}
+    with np.load(path, allow_pickle=False) as data:
+        for key in data.files:
+            section, name = key.split('/', 1)
+            value = data[key]
+            state.setdefault(section, {})[name] = value[()] if value.ndim == 0 else value
+    return state
@@ -0,0 +1,134 @@
+#Fitness memoization keyed on the discretized policy. Many particle positions cast to the same action table,
+#so a policy that was already evaluated is looked up instead of being simulated again. An entry is the per-policy
+#summary the evaluation returns (average steps, falls, steps and a steps to goal histogram), its size does not grow
+#with the number of episodes or maps.
+
+import hashlib
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+# policies longer than this are keyed on a 16 byte digest of their action table instead of the table itself
+MAX_RAW_KEY_BYTES = 64
+
+
+# compact key of one policy, the raw bytes of its uint8 action table
+def policy_key(policy):
+    key = np.ascontiguousarray(policy, dtype=np.uint8).tobytes()
+    if len(key) > MAX_RAW_KEY_BYTES:
+        return hashlib.blake2b(key, digest_size=16).digest()
+    return key
+
+
+class PolicyCache:
+    '''Bounded LRU cache in front of a population evaluation function.'''
+
+    def __init__(self, evaluate, max_size=100000):
+        # evaluate takes a (num_policies x num_states) action table and returns a namedtuple of per-policy arrays
+        self.evaluate_fn = evaluate
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.stats_type = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def hit_rate(self):
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+    def _store(self, key, entry):
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+
+    # cached stats of a single policy as a one row namedtuple, or None when it was never evaluated
+    def lookup(self, policy):
+        key = policy_key(policy)
+        entry = self.entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return self.stats_type(*(np.asarray(field)[None] for field in entry))
+
+    # adds the one row stats of a policy evaluated outside evaluate
+    def store(self, policy, stats):
+        self.stats_type = type(stats)
+        self._store(policy_key(policy), tuple(field[0] for field in stats))
+
+    # same result as evaluate_fn(policies), only the policies never seen before are simulated
+    def evaluate(self, policies):
+        policies = np.atleast_2d(policies).astype(np.uint8, copy=False)
+        keys = [policy_key(policy) for policy in policies]
+
+        rows = {}
+        missing = {}
+        for i, key in enumerate(keys):
+            if key in rows or key in missing:
+                # duplicate inside the same population, evaluated only once
+                self.hits += 1
+            elif key in self.entries:
+                self.entries.move_to_end(key)
+                rows[key] = self.entries[key]
+                self.hits += 1
+            else:
+                missing[key] = i
+                self.misses += 1
+
+        if missing:
+            stats = self.evaluate_fn(policies[list(missing.values())])
+            self.stats_type = type(stats)
+            for j, key in enumerate(missing):
+                entry = tuple(field[j] for field in stats)
+                rows[key] = entry
+                self._store(key, entry)
+
+        ordered = [rows[key] for key in keys]
+        return self.stats_type(*(np.stack(field) for field in zip(*ordered)))
+
+    # entries in LRU order and counters, as arrays so they can go into a checkpoint. the entries decide which
+    # policies are simulated again, and so the random streams, after a resume. per-policy rows like the steps to goal
+    # histograms are mostly zeros and are stored as their nonzero values only
+    def state_dict(self):
+        state = {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                 'keys': np.array([np.frombuffer(key, dtype=np.uint8) for key in self.entries], dtype=np.uint8)}
+        if self.stats_type is not None:
+            state['fields'] = ','.join(self.stats_type._fields)
+            for i, field in enumerate(self.stats_type._fields):
+                column = np.array([entry[i] for entry in self.entries.values()])
+                if column.ndim == 2:
+                    nonzero = np.nonzero(column)
+                    state[f'shape_{field}'] = np.array(column.shape)
+                    state[f'index_{field}'] = np.stack(nonzero).astype(np.int32)
+                    column = column[nonzero]
+                state[f'field_{field}'] = column
+        return state
+
+    def load_state_dict(self, state):
+        self.hits = int(state['hits'])
+        self.misses = int(state['misses'])
+        self.evictions = int(state['evictions'])
+        self.entries = OrderedDict()
+        if 'fields' not in state:
+            return
+        fields = str(state['fields']).split(',')
+        if self.stats_type is None:
+            self.stats_type = namedtuple('Stats', fields)
+        columns = []
+        for field in fields:
+            column = state[f'field_{field}']
+            if f'shape_{field}' in state:
+                dense = np.zeros(tuple(state[f'shape_{field}']), dtype=column.dtype)
+                dense[tuple(state[f'index_{field}'])] = column
+                column = dense
+            columns.append(column)
+        for i, key in enumerate(state['keys']):
+            self.entries[key.tobytes()] = tuple(column[i] for column in columns)
+
+    def summary(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                'hit_rate': self.hit_rate, 'size': len(self.entries)}
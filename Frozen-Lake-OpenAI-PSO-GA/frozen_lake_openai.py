@@ -1,4 +1,3 @@
-
 #References
 #https://machinelearningmastery.com/a-gentle-introduction-to-particle-swarm-optimization/
 #https://nathanrooy.github.io/posts/2016-08-17/simple-particle-swarm-optimization-with-python/
@@ -6,258 +5,518 @@
 #https://pypi.org/project/geneticalgorithm/
 #https://towardsdatascience.com/genetic-algorithm-implementation-in-python-5ab67bb124a6
 
-import gym
-import numpy as np
-from gym.envs.toy_text.frozen_lake import generate_random_map
-import matplotlib.pyplot as plt
-
-np.random.seed(42)
-
-env_size = 4  # Set the size of the map
-env = gym.make('FrozenLake-v1', desc=generate_random_map(size=env_size), is_slippery=True, render_mode='rgb_array')
-
-def fitness_function(X):
-    total_reward = 0
-    total_falls = 0  
-    total_steps = 0
-    for _ in range(maxIteration):
-        state = env.reset()[0]
-        curr_reward = 0  # reward when the agent reaches the goal counter
-        done = False  # checks if the agent reaches the goal
-        steps_per_goals = []  # steps taken to reach goal
-        fail_list = set()  # check the position every time the agent falls
-        
-        #main game loop
-        while not done:
-            action = best_position[np.random.choice(num_particles)][state]  # chooses what action the agent takes Left(0) Right(1) Up(2) or Down(3) based on particle position
-            try:
-                next_state, reward, done, _ = env.step(int(action))[:4]
-                
-                # checks if the next state is a hole(H)
-                if env.desc.flatten()[next_state] == b'H':
-                    reward -= 1
-                    total_falls += 1
-
-                    # checks and adds the hole position to the fail_list
-                    if next_state not in fail_list:
-                        fail_list.add(next_state)
-
-                # check if the agent next step is the goal state
-                if next_state == goal_state:
-                    reward += 20  # add reward
-                    done = True  # reset position if true
-                    steps_per_goals.append(env._elapsed_steps)
-                    
-                curr_reward += reward
-                state = next_state
-                total_steps += 1
-            except KeyError:
-                continue
-
-        total_reward += curr_reward
-        print("Running through iteration")
-        average_steps = total_steps / maxIteration
-    return average_steps, total_falls, total_steps, steps_per_goals
-
-# population for Genetic Algorithm and Iteration for PSO
-maxIteration = 1000
-
-# particles for PSO
-num_particles = 100
-
-# dimension is bound the search space of the game
-num_dimensions = env.observation_space.n
-
-# upper bound is the max that the agent can take in the action space
-upper_bound = env.action_space.n - 1
-
-# lower bound is [0,0] but set as an int 0.
-lower_bound = 0
-
-# function to try to move the particle from the start position to the goal state
-def generate_initial_positions(num_particles, num_dimensions, starting_point, goal_position, deviation=1.0):
-    initial_positions = np.zeros((num_particles, num_dimensions))
-    for i in range(num_particles):
-        initial_positions[i] = starting_point + np.random.uniform(-deviation, deviation, size=num_dimensions)
-    return initial_positions
-
-deviation = 0.5
+#Importing this module is cheap: gym is only imported when an env is built and matplotlib only when plotting.
+#Run it with python -m frozen_lake_openai --help
 
-# Set the goal position (assuming the goal is at the bottom-right corner)
-goal_state = env_size * env_size - 1
+import argparse
+import json
+import os
+from concurrent.futures import Future
+from contextlib import nullcontext
 
-# settiing the position of the particles to be at the starting position
-position = generate_initial_positions(num_particles, num_dimensions, starting_point=0, goal_position=goal_state, deviation=deviation)
-
-# initial velocity of the particle
-velocities = np.random.uniform(lower_bound, upper_bound, size=(num_particles, num_dimensions))
-
-# best position after each iteration. initially set to the initial position
-best_position = position.copy()
-
-#stores the best particle score throughout the iteration
-best_score = np.full(num_particles, fitness_function(position[0])[0])
-
-# initial global best position
-global_best_position = position[0].copy() 
-
-#stores the global best particle score throughout the iteration
-global_best_score = fitness_function(position[0])[0]
-
-# holds steps taken each iteration
-steps_per_iteration = []
-
-# hold steps taken each time the agent reaches the goal
-steps_per_goals = []
+import numpy as np
 
-#amount of times the agents fall in the hole
-total_falls = 0
+from frozen_lake_sim import (BatchStats, build_transitions, horizon_expected_costs, positions_to_policies,
+                            simulate_episodes)
+from large_map import build_grid_transitions, generate_map_batch, generate_map_grid
+from metrics import ProgressReporter, RunMetrics, open_sink
+from checkpoint import load_checkpoint, save_checkpoint
+from parallel_fitness import ParallelEvaluator
+from racing import RacingEvaluator
+from fitness_cache import PolicyCache
+from optimizers import AsyncParticleSwarm, GeneticAlgorithm, ParticleSwarm
+from plotting import plot_results
+from profiling import profiled, timers
+from reference_solvers import OBJECTIVES, QLearning, ValueIteration
+from surrogate import SURROGATES, make_surrogate
+from trajectory import TrajectoryRecorder
 
-# total steps throughout the iteration counter
-total_steps = 0
+# population for Genetic Algorithm and Iteration for PSO
+maxIteration = 1000
 
 # PSO formula
 inertia_weight = 0.8
 cognitive_weight = 1.5
 social_weight = 2.5
 
-best_steps = float("inf")
-
-# PSO initialization
-for i in range(num_particles):
-    r1 = np.random.random(size=num_dimensions)
-    r2 = np.random.random(size=num_dimensions)
-    updated_velocities = (inertia_weight * velocities[i]) + \
-        (cognitive_weight * r1 * (best_position[i] - position[i])) + \
-            (social_weight * r2 * (global_best_position - position[i]))
-
-    velocities[i] = updated_velocities
-    position[i] += velocities[i]
-    average_steps, falls, steps, steps_reached_goal = fitness_function(position[i])
-    
-    if average_steps < best_score[i]:
-        best_score[i] = average_steps
-        best_position[i] = position[i].copy()
-
-    if average_steps < global_best_score:
-        global_best_score = average_steps
-        global_best_position = position[i].copy()
-
-    if average_steps < best_steps:
-        best_steps = average_steps
-  
-    total_falls += falls
-    total_steps += steps
-    steps_per_iteration.append(average_steps)
-    steps_per_goals.append(steps_reached_goal)
-
-steps_when_reached_goal = [steps for sublist in steps_per_goals for steps in sublist]
-
-#crossover
-def crossover(parent1, parent2):
-    crossover_point = np.random.randint(1, len(parent1))
-    child1 = np.concatenate((parent1[:crossover_point], parent2[crossover_point:]))
-    child2 = np.concatenate((parent2[:crossover_point], parent1[crossover_point:]))
-    return child1, child2
-
-#mutation
-def mutate(individual, mutation_rate=0.1):
-    mutation_mask = np.random.rand(*individual.shape) < mutation_rate
-    mutation_values = np.random.uniform(lower_bound, upper_bound, size=individual.shape)
-    individual[mutation_mask] = mutation_values[mutation_mask]
-    return individual
+# spread of the initial particle positions around the start
+deviation = 0.5
 
 mutation_rate = 0.1
 
-total_falls_g = 0
-total_steps_g = 0
-steps_per_iteration_g = []
-steps_per_goals_g = []
-
-
-fitness_scores = []
-
-#Genetic Algorithm
-for i in range(num_particles):
-    average_steps, falls, steps, steps_reached_goal = fitness_function(position[i])
-    fitness_scores.append(average_steps)
-    selected_indices = np.argsort(fitness_scores)[:num_particles]
-    selected_population = position[selected_indices]
-    global_best_index = np.argmin(fitness_scores)
-    
-    if fitness_scores[global_best_index] < global_best_score:
-        global_best_score = fitness_scores[global_best_index]
-        global_best_position = position[global_best_index].copy()   
-
-    total_falls_g += falls
-    total_steps_g += steps
-    steps_per_iteration_g.append(average_steps)
-    steps_per_goals_g.append(steps_reached_goal)
-
-#holds the new population after the iteration    
-new_population = []
-for i in range(num_particles):
-    #single-point crossover
-    parent_indices = np.random.choice(len(selected_population), size=2, replace=True)
-    parent1, parent2 = selected_population[parent_indices]
-    child1, child2 = crossover(parent1, parent2)
-    child1 = mutate(child1, mutation_rate)
-    child2 = mutate(child2, mutation_rate)
-    new_population.extend([child1, child2])
-
-steps_when_reached_goal_g = [steps for sublist in steps_per_goals_g for steps in sublist]
-
-population = np.array(new_population)
-best_index_value = np.argmin(steps_per_iteration)
-best_index_value_g = np.argmin(steps_per_iteration_g)
-
-print("Best Score:", best_score)
-print("Global Best Position:", global_best_position)
-print("Global Best steps:", best_steps)
-
-print("Steps to reach the goal PSO: ",steps_when_reached_goal)
-print("Steps to reach the goal GA: ", steps_when_reached_goal_g)
-
-print("Worst Index Value:", np.argmax(population))
-print("Fitness Score:", fitness_scores)
-print("Worst Fitness Score:", np.argmax(fitness_scores))
-print("Best Fitness Score:", np.argmin(fitness_scores))
-
-
-plt.figure(figsize=(12, 6))
-plt.subplot(1, 2, 1)
-plt.plot(steps_per_iteration, label='Best Fitness per Generation')
-plt.xlabel('Generation')
-plt.ylabel('Best Fitness')
-plt.title('Best Fitness over Generations')
-plt.legend()
-plt.grid(True)
-plt.subplot(1, 2, 2)
-plt.plot(global_best_position, color='orange')
-plt.xlabel('Generation')
-plt.ylabel('Global Best Position')
-plt.title('Best Global Position over Generations')
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-plt.close()
-
-plt.figure(figsize=(12, 6))
-plt.subplot(1, 2, 1)
-plt.plot(fitness_scores, label='Best Fitness per Generation')
-plt.xlabel('Generation')
-plt.ylabel('Best Fitness')
-plt.title('Best Fitness over Generations')
-plt.legend()
-plt.grid(True)
-plt.subplot(1, 2, 2)
-plt.plot(population, color='orange')
-plt.xlabel('Generation')
-plt.ylabel('Global Best Position')
-plt.title('Best Global Position over Generations')
-plt.legend()
-plt.grid(True)
-plt.tight_layout()
-plt.show()
-plt.close()
\ No newline at end of file
+# best individuals copied unchanged into the next generation and size of the selection tournaments
+num_elites = 2
+tournament_size = 3
+
+# generations without improvement before a run stops
+patience = 10
+
+# most Bellman sweeps of value iteration, it normally converges long before
+max_sweeps = 1000
+
+# function to build a random FrozenLake map of env_size x env_size and its env
+def make_env(env_size=4, seed=42, is_slippery=True):
+    import gym
+    from gym.envs.toy_text.frozen_lake import generate_random_map
+
+    # generate_random_map draws from the global numpy generator
+    np.random.seed(seed)
+    desc = generate_random_map(size=env_size)
+    env = gym.make('FrozenLake-v1', desc=desc, is_slippery=is_slippery, render_mode='rgb_array')
+    return env, desc
+
+
+class FrozenLakeFitness:
+    '''Population fitness of one FrozenLake map, cached on the discretized policy.'''
+
+    def __init__(self, env, desc, num_episodes=maxIteration, fitness_mode='sample', seed=42, num_workers=1,
+                 cache_size=100000, common_random_numbers=False, racing_rounds=0):
+        # longest episode before it is cut off, same as the gym time limit
+        self._setup(build_transitions(env), env.action_space.n, env.spec.max_episode_steps, desc, None,
+                    num_episodes, fitness_mode, seed, num_workers, cache_size, common_random_numbers, racing_rounds, None)
+
+    # fitness of a large map given as a uint8 tile grid, built without gym
+    @classmethod
+    def from_grid(cls, grid, num_episodes=maxIteration, max_steps=100, fitness_mode='sample', seed=42, num_workers=1,
+                  cache_size=100000, common_random_numbers=False, racing_rounds=0):
+        fitness = cls.__new__(cls)
+        fitness._setup(build_grid_transitions(grid), 4, max_steps, None, grid,
+                       num_episodes, fitness_mode, seed, num_workers, cache_size, common_random_numbers, racing_rounds,
+                       None)
+        return fitness
+
+    # fitness of one policy over a (num_maps x size x size) batch of maps simulated together, num_episodes per map
+    # the fitness is the mean steps over all the maps, or the map_quantile of the per-map average steps
+    @classmethod
+    def from_maps(cls, grids, num_episodes=maxIteration, max_steps=100, seed=42, num_workers=1, cache_size=100000,
+                  common_random_numbers=False, map_quantile=None):
+        fitness = cls.__new__(cls)
+        fitness._setup(build_grid_transitions(grids), 4, max_steps, None, grids,
+                       num_episodes, 'sample', seed, num_workers, cache_size, common_random_numbers, 0, map_quantile)
+        return fitness
+
+    # common_random_numbers makes every particle of a generation replay the same slip noise. racing_rounds > 0 plays
+    # the episodes in that many rounds and stops the particles that are clearly worse than the best one early
+    def _setup(self, transitions, num_actions, max_steps, desc, grid, num_episodes, fitness_mode, seed, num_workers,
+               cache_size, common_random_numbers, racing_rounds, map_quantile):
+        self.transitions = transitions
+        self.num_actions = num_actions
+        # a batch of maps shares one policy, one action per state of a single map
+        self.num_maps = np.size(transitions.start_state)
+        self.num_dimensions = len(transitions.holes) // self.num_maps
+        self.num_episodes = num_episodes
+        self.max_steps = max_steps
+        # 'sample' plays num_episodes per particle, 'exact' computes the expected steps and falls of the policy within
+        # the same max_steps time limit directly
+        self.fitness_mode = fitness_mode
+
+        self.evaluator = None
+        self.racing = None
+        if fitness_mode == 'sample':
+            self.evaluator = ParallelEvaluator(desc, num_episodes, max_steps, seed=seed, num_workers=num_workers, grid=grid,
+                                               common_random_numbers=common_random_numbers, map_quantile=map_quantile,
+                                               transitions=transitions)
+            if racing_rounds:
+                self.racing = RacingEvaluator(self.evaluator, num_rounds=racing_rounds)
+        # a cache_size of 0 evaluates every policy, repeated or not
+        self.cache = PolicyCache(self.evaluate_policies, max_size=cache_size) if cache_size else None
+
+        # per-generation falls, steps, goal hits and best fitness. progress is an optional ProgressReporter
+        self.metrics = RunMetrics(max_steps=max_steps)
+        self.progress = None
+
+    # starts a new run in the metrics, the falls, steps and steps to goal are counted from here
+    def reset_counters(self, label='run'):
+        self.metrics.reset(label)
+
+    # evaluates the policies that are not in the cache with the selected fitness mode
+    def evaluate_policies(self, policies):
+        if self.fitness_mode == 'exact':
+            return self.exact_population_fitness(policies)
+        if self.racing is not None:
+            return self.racing.evaluate(policies)
+        return self.evaluator.evaluate(policies)
+
+    # exact version of population_fitness, what the sampled fitness converges to. falls and steps are the expected
+    # values over num_episodes episodes cut off at max_steps, no episode is played so the steps to goal histogram is empty
+    def exact_population_fitness(self, policies):
+        with timers.phase('exact_solve'):
+            # one step per move and one fall per move into a hole
+            arrival_costs = np.stack([np.ones(len(self.transitions.holes)), self.transitions.holes], axis=1)
+            expected_steps, fall_prob = horizon_expected_costs(self.transitions, policies, self.max_steps,
+                                                               arrival_costs).T
+        return BatchStats(average_steps=expected_steps,
+                          falls=fall_prob * self.num_episodes,
+                          steps=expected_steps * self.num_episodes,
+                          goal_step_counts=np.zeros((len(expected_steps), 0), dtype=np.int32))
+
+    # fitness of the whole population in one call. returns the average steps, falls, steps and steps to goal per particle
+    # positions that cast to an already evaluated policy are served from the cache
+    def population_fitness(self, positions):
+        with timers.phase('policy_cast'):
+            policies = positions_to_policies(positions, self.num_actions)
+        with timers.phase('fitness_evaluate'):
+            stats = self.cache.evaluate(policies) if self.cache is not None else self.evaluate_policies(policies)
+        with timers.phase('metrics'):
+            self.metrics.record(stats)
+            if self.progress is not None:
+                self.progress(self.metrics)
+        return stats
+
+    # starts the evaluation of one position for the asynchronous PSO and returns a Future of its BatchStats
+    # every call gets its own random streams. cached policies and exact mode give a Future that is already done
+    def submit(self, position):
+        policy = positions_to_policies(position, self.num_actions)
+        stats = self.cache.lookup(policy[0]) if self.cache is not None else None
+        if stats is None and self.evaluator is None:
+            stats = self.exact_population_fitness(policy)
+        if stats is None:
+            return self.evaluator.submit(policy, self.evaluator.next_call_index())
+        future = Future()
+        future.set_result(stats)
+        return future
+
+    # fitness of a finished submit of position, recorded in the metrics as one row
+    def result(self, future, position):
+        stats = future.result()
+        if self.cache is not None:
+            self.cache.store(positions_to_policies(position, self.num_actions)[0], stats)
+        self.metrics.record(stats)
+        if self.progress is not None:
+            self.progress(self.metrics)
+        return float(stats.average_steps[0])
+
+    # fitness of a single particle. plays num_episodes episodes with the particle position as the policy
+    def fitness_function(self, X):
+        stats = self.population_fitness(X)
+        counts = stats.goal_step_counts[0]
+        steps_per_goals = np.repeat(np.arange(len(counts)), counts).tolist()
+        return stats.average_steps[0], stats.falls[0], stats.steps[0], steps_per_goals
+
+    # the optimizers minimise the average steps
+    def __call__(self, positions):
+        return self.population_fitness(positions).average_steps
+
+    # plays num_episodes of the policy of one position outside the optimization and records every step
+    def record_episodes(self, position, recorder, num_episodes, seed=42):
+        policies = positions_to_policies(position, self.num_actions)
+        return simulate_episodes(self.transitions, policies, num_episodes, self.max_steps,
+                                 rng=np.random.default_rng(seed), recorder=recorder)
+
+    # checkpoint sections of the evaluation state: random stream counter, cache and metrics
+    def state_dict(self):
+        state = {'fitness': {'call_index': self.evaluator.call_index if self.evaluator is not None else 0},
+                 'metrics': self.metrics.state_dict()}
+        if self.racing is not None:
+            state['fitness'].update(self.racing.summary())
+        if self.cache is not None:
+            state['cache'] = self.cache.state_dict()
+        return state
+
+    def load_state_dict(self, state):
+        if self.evaluator is not None:
+            self.evaluator.call_index = int(state['fitness']['call_index'])
+        if self.racing is not None:
+            self.racing.episodes_played = int(state['fitness']['episodes_played'])
+            self.racing.episodes_budget = int(state['fitness']['episodes_budget'])
+        if self.cache is not None and 'cache' in state:
+            self.cache.load_state_dict(state['cache'])
+        self.metrics.load_state_dict(state['metrics'])
+
+    def close(self):
+        if self.evaluator is not None:
+            self.evaluator.close()
+        if self.metrics.sink is not None:
+            self.metrics.sink.close()
+
+
+# function to build a swarm over the policies of a fitness with the module settings, the sweep overrides the weights
+def make_pso(fitness, num_particles=100, seed=42, patience=patience, dtype=np.float64, inertia_weight=inertia_weight,
+             cognitive_weight=cognitive_weight, social_weight=social_weight):
+    return ParticleSwarm(fitness, num_particles, fitness.num_dimensions, 0, fitness.num_actions - 1,
+                         inertia_weight=inertia_weight, cognitive_weight=cognitive_weight, social_weight=social_weight,
+                         starting_point=0, deviation=deviation, patience=patience,
+                         rng=np.random.default_rng(seed), dtype=dtype)
+
+
+# function to run the asynchronous PSO, max_in_flight evaluations are kept running on the fitness workers
+# (two per worker by default) and deterministic makes the result independent of the worker timing
+def run_async_pso(fitness, num_particles=100, num_generations=50, seed=42, max_in_flight=None, deterministic=False,
+                  patience=patience, dtype=np.float64, callback=None):
+    if max_in_flight is None:
+        max_in_flight = 2 * fitness.evaluator.num_workers if fitness.evaluator is not None else 1
+    swarm = AsyncParticleSwarm(fitness, num_particles, fitness.num_dimensions, 0, fitness.num_actions - 1,
+                               max_in_flight=max_in_flight, deterministic=deterministic,
+                               inertia_weight=inertia_weight, cognitive_weight=cognitive_weight,
+                               social_weight=social_weight, starting_point=0, deviation=deviation, patience=patience,
+                               rng=np.random.default_rng(seed), dtype=dtype)
+    swarm.run(num_generations, callback)
+    return swarm
+
+
+# function to build a GA over the policies of a fitness with the module settings
+# surrogate names a model ('knn' or 'linear') that screens the children, only screen_fraction of them are simulated
+def make_ga(fitness, population_size=100, seed=42, crossover_method='single_point', initial_population=None,
+            patience=patience, dtype=np.float64, surrogate=None, screen_fraction=0.25, mutation_rate=mutation_rate):
+    if surrogate is not None:
+        surrogate = make_surrogate(surrogate, fitness.num_actions, fitness.num_dimensions, min_samples=2 * population_size)
+    return GeneticAlgorithm(fitness, population_size, fitness.num_dimensions, 0, fitness.num_actions - 1,
+                            mutation_rate=mutation_rate, crossover_method=crossover_method, num_elites=num_elites,
+                            tournament_size=tournament_size, initial_population=initial_population, patience=patience,
+                            rng=np.random.default_rng(seed), dtype=dtype, surrogate=surrogate,
+                            screen_fraction=screen_fraction)
+
+
+# function to run the PSO on a fitness, returns the finished swarm
+# state continues a checkpointed swarm, callback is called after every generation
+def run_pso(fitness, num_particles=100, num_generations=50, seed=42, patience=patience, dtype=np.float64,
+            state=None, callback=None):
+    swarm = make_pso(fitness, num_particles, seed, patience, dtype)
+    if state is not None:
+        swarm.load_state_dict(state)
+    swarm.run(num_generations, callback)
+    return swarm
+
+
+# function to run the GA on a fitness, returns the finished GA. starts from initial_population when given
+# state continues a checkpointed GA, callback is called after every generation
+def run_ga(fitness, population_size=100, num_generations=50, seed=42, crossover_method='single_point',
+           initial_population=None, patience=patience, dtype=np.float64, state=None, callback=None, surrogate=None,
+           screen_fraction=0.25):
+    ga = make_ga(fitness, population_size, seed, crossover_method, initial_population, patience, dtype, surrogate,
+                 screen_fraction)
+    if state is not None:
+        ga.load_state_dict(state)
+    ga.run(num_generations, callback)
+    return ga
+
+
+# function to solve the map of a fitness with value iteration, the reference optimum for the PSO and GA
+# it solves for episodes cut off at the fitness time limit, the same episodes the optimizers are scored on
+def run_value_iteration(fitness, objective='steps', num_generations=max_sweeps, state=None, callback=None):
+    solver = ValueIteration(fitness, fitness.transitions, objective, horizon=fitness.max_steps)
+    if state is not None:
+        solver.load_state_dict(state)
+    solver.run(num_generations, callback)
+    return solver
+
+
+# function to learn a policy with tabular Q-learning, num_agents episodes per generation
+def run_qlearning(fitness, num_agents=100, num_generations=50, seed=42, objective='steps', patience=patience,
+                  state=None, callback=None):
+    solver = QLearning(fitness, fitness.transitions, num_agents, fitness.max_steps, objective=objective,
+                       patience=patience, rng=np.random.default_rng(seed))
+    if state is not None:
+        solver.load_state_dict(state)
+    solver.run(num_generations, callback)
+    return solver
+
+
+# prints the outcome of a run and the counters collected while it ran
+def report(name, best_position, best_score, generations, fitness):
+    metrics = fitness.metrics
+    print(f"{name} generations:", generations)
+    print(f"{name} Global Best Position:", best_position)
+    print(f"{name} Global Best steps:", best_score)
+    print(f"{name} falls: {metrics.total_falls:.0f} steps: {metrics.total_steps:.0f}")
+    if metrics.total_goal_hits:
+        print(f"{name} average steps to reach the goal:", metrics.mean_steps_to_goal,
+              "over", metrics.total_goal_hits, "episodes")
+
+
+# settings that change the outcome of a run, a checkpoint is only resumed with the same ones
+def run_config(args):
+    ignored = ('workers', 'no_plot', 'plot_dir', 'plot_format', 'record_episodes', 'trajectory_dir',
+               'trajectory_capacity', 'timers', 'profile', 'trace_memory', 'checkpoint', 'checkpoint_every', 'resume',
+               'metrics_file', 'progress_interval')
+    return json.dumps({name: value for name, value in sorted(vars(args).items()) if name not in ignored})
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Optimize FrozenLake policies with PSO and a Genetic Algorithm.")
+    parser.add_argument('--env-size', type=int, default=4, help="size of the square map")
+    parser.add_argument('--algorithm', choices=['pso', 'ga', 'both', 'vi', 'qlearning'], default='both',
+                        help="'both' runs the PSO and starts the GA from the final swarm, 'vi' and 'qlearning' "
+                             "run the reference solvers")
+    parser.add_argument('--objective', choices=OBJECTIVES, default='steps',
+                        help="what 'vi' and 'qlearning' optimize: the expected steps or the chance to reach the goal")
+    parser.add_argument('--population', type=int, default=100, help="particles of the PSO and individuals of the GA")
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--episodes', type=int, default=maxIteration, help="episodes per fitness evaluation")
+    parser.add_argument('--fitness-mode', choices=['sample', 'exact'], default='sample')
+    parser.add_argument('--crossover', choices=['single_point', 'two_point', 'uniform'], default='single_point')
+    parser.add_argument('--workers', type=int, default=1, help="processes used to evaluate the population")
+    parser.add_argument('--cache-size', type=int, default=100000, help="policies kept in the fitness cache, 0 disables it")
+    parser.add_argument('--no-plot', action='store_true', help="skip the matplotlib figures")
+    parser.add_argument('--plot-dir', help="save the figures to this directory without a display instead of showing them")
+    parser.add_argument('--plot-format', choices=['png', 'svg'], default='png')
+    parser.add_argument('--record-episodes', type=int, default=0,
+                        help="replay the best policy of each algorithm for this many episodes and record every step")
+    parser.add_argument('--trajectory-dir',
+                        help="memory-map the recorded steps to <dir>/<algorithm>/<column>.npy instead of keeping them in memory")
+    parser.add_argument('--trajectory-capacity', type=int, default=1000000, help="recorded steps kept per algorithm")
+    parser.add_argument('--large-map', action='store_true',
+                        help="generate the map as a uint8 grid without gym and keep the swarm in float32")
+    parser.add_argument('--max-steps', type=int, default=100, help="episode time limit of --large-map runs")
+    parser.add_argument('--maps', type=int, default=0,
+                        help="score every policy on this many random maps of --env-size together, 0 uses one map")
+    parser.add_argument('--map-quantile', type=float,
+                        help="with --maps, score a policy by this quantile of its per-map average steps instead of the mean")
+    parser.add_argument('--surrogate', choices=SURROGATES,
+                        help="screen the GA children with this model and simulate only the most promising ones")
+    parser.add_argument('--screen-fraction', type=float, default=0.25,
+                        help="fraction of the GA children simulated per generation with --surrogate")
+    parser.add_argument('--async-pso', action='store_true',
+                        help="asynchronous PSO, every particle moves on as soon as its own fitness is back")
+    parser.add_argument('--max-in-flight', type=int, help="evaluations running at once with --async-pso, 2 per worker by default")
+    parser.add_argument('--deterministic', action='store_true',
+                        help="with --async-pso, handle the results in submission order so runs are repeatable, "
+                             "for any number of workers when --max-in-flight is given")
+    parser.add_argument('--crn', action='store_true',
+                        help="common random numbers, every particle of a generation replays the same slip noise")
+    parser.add_argument('--racing-rounds', type=int, default=0,
+                        help="play the episodes in rounds and stop clearly worse particles early, 0 disables racing")
+    parser.add_argument('--checkpoint', help="npz file the optimizer state is saved to")
+    parser.add_argument('--checkpoint-every', type=int, default=1, help="generations between checkpoints")
+    parser.add_argument('--resume', action='store_true', help="continue the run saved in --checkpoint")
+    parser.add_argument('--timers', action='store_true',
+                        help="time the phases of the simulator, fitness and optimizers and print a table after each run")
+    parser.add_argument('--profile', nargs='?', const='', metavar='PATH',
+                        help="run under cProfile, the stats go to PATH and a sorted report to PATH.txt, "
+                             "or the report is printed when no PATH is given")
+    parser.add_argument('--trace-memory', action='store_true', help="with --profile, also report the top allocations")
+    parser.add_argument('--metrics-file', help="per-generation metrics, written as CSV for a .csv path and JSONL otherwise")
+    parser.add_argument('--progress-interval', type=float, default=5.0,
+                        help="seconds between progress lines, 0 prints every generation")
+    args = parser.parse_args(argv)
+    if args.maps and (args.fitness_mode == 'exact' or args.racing_rounds):
+        parser.error("--maps only works with sampled fitness and without racing")
+    if args.maps and args.algorithm in ('vi', 'qlearning'):
+        parser.error("the reference solvers work on a single map")
+    if args.async_pso and (args.checkpoint or args.racing_rounds):
+        parser.error("--async-pso does not support --checkpoint or --racing-rounds")
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.maps:
+        grids = generate_map_batch(args.maps, args.env_size, rng=np.random.default_rng(args.seed))
+        fitness = FrozenLakeFitness.from_maps(grids, num_episodes=args.episodes, max_steps=args.max_steps, seed=args.seed,
+                                              num_workers=args.workers, cache_size=args.cache_size,
+                                              common_random_numbers=args.crn, map_quantile=args.map_quantile)
+        dtype = np.float64
+    elif args.large_map:
+        grid = generate_map_grid(args.env_size, rng=np.random.default_rng(args.seed))
+        fitness = FrozenLakeFitness.from_grid(grid, num_episodes=args.episodes, max_steps=args.max_steps,
+                                              fitness_mode=args.fitness_mode, seed=args.seed, num_workers=args.workers,
+                                              cache_size=args.cache_size, common_random_numbers=args.crn,
+                                              racing_rounds=args.racing_rounds)
+        dtype = np.float32
+    else:
+        env, desc = make_env(args.env_size, args.seed)
+        fitness = FrozenLakeFitness(env, desc, num_episodes=args.episodes, fitness_mode=args.fitness_mode,
+                                    seed=args.seed, num_workers=args.workers, cache_size=args.cache_size,
+                                    common_random_numbers=args.crn, racing_rounds=args.racing_rounds)
+        dtype = np.float64
+    checkpoint = None
+    if args.resume:
+        if not args.checkpoint:
+            raise SystemExit("--resume needs --checkpoint")
+        checkpoint = load_checkpoint(args.checkpoint)
+        if str(checkpoint['run']['config']) != run_config(args):
+            raise SystemExit(f"{args.checkpoint} was written by a run with different settings")
+        fitness.load_state_dict(checkpoint)
+    phase = str(checkpoint['run']['phase']) if checkpoint is not None else None
+
+    fitness.metrics.sink = open_sink(args.metrics_file, append=checkpoint is not None)
+    fitness.progress = ProgressReporter(args.progress_interval)
+
+    # saves the whole run every checkpoint_every generations of the optimizer in the given phase
+    def checkpoint_callback(phase_name):
+        def save(optimizer):
+            if optimizer.generation % args.checkpoint_every == 0:
+                state = fitness.state_dict()
+                state['run'] = {'phase': phase_name, 'config': run_config(args)}
+                state[phase_name] = optimizer.state_dict()
+                with timers.phase('checkpoint'):
+                    save_checkpoint(args.checkpoint, state)
+        return save if args.checkpoint else None
+
+    timers.enabled = args.timers
+
+    # prints the phase timers, plots the run and records episodes of its best policy
+    def finish_run(name, best_history, best_position):
+        if args.timers:
+            print(timers.table(f"{name} phase timers"))
+            timers.reset()
+        if args.plot_dir:
+            os.makedirs(args.plot_dir, exist_ok=True)
+            path = plot_results(name, best_history, best_position,
+                                os.path.join(args.plot_dir, f'{name.lower()}.{args.plot_format}'))
+            print(f"{name} plot saved to {path}")
+        elif not args.no_plot:
+            plot_results(name, best_history, best_position)
+        if args.record_episodes:
+            directory = os.path.join(args.trajectory_dir, name.lower()) if args.trajectory_dir else None
+            recorder = TrajectoryRecorder(args.trajectory_capacity, directory)
+            fitness.record_episodes(best_position, recorder, args.record_episodes, args.seed)
+            recorder.flush()
+            print(f"{name} recorded episodes:", recorder.summary())
+
+    profile = profiled(args.profile or None, args.trace_memory) if args.profile is not None else nullcontext()
+    try:
+        with profile:
+            initial_population = None
+            if args.algorithm in ('pso', 'both') and phase != 'GA':
+                if phase is None:
+                    fitness.reset_counters("PSO")
+                if args.async_pso:
+                    swarm = run_async_pso(fitness, args.population, args.generations, args.seed, args.max_in_flight,
+                                          args.deterministic, dtype=dtype)
+                else:
+                    swarm = run_pso(fitness, args.population, args.generations, args.seed, dtype=dtype,
+                                    state=checkpoint['PSO'] if phase == 'PSO' else None,
+                                    callback=checkpoint_callback('PSO'))
+                report("PSO", swarm.global_best_position, swarm.global_best_score, swarm.generation, fitness)
+                initial_population = swarm.position
+                finish_run("PSO", swarm.best_history, swarm.global_best_position)
+
+            if args.algorithm in ('ga', 'both'):
+                if phase != 'GA':
+                    fitness.reset_counters("GA")
+                ga = run_ga(fitness, args.population, args.generations, args.seed + 1, args.crossover, initial_population,
+                            dtype=dtype, state=checkpoint['GA'] if phase == 'GA' else None,
+                            callback=checkpoint_callback('GA'), surrogate=args.surrogate,
+                            screen_fraction=args.screen_fraction)
+                report("GA", ga.best_position, ga.best_score, ga.generation, fitness)
+                if ga.surrogate is not None:
+                    print(f"GA surrogate: {ga.evaluations} policies simulated for {ga.children_bred} children bred,",
+                          ga.surrogate.summary())
+                finish_run("GA", ga.best_history, ga.best_position)
+
+            if args.algorithm in ('vi', 'qlearning'):
+                name = 'VI' if args.algorithm == 'vi' else 'QL'
+                if phase is None:
+                    fitness.reset_counters(name)
+                solver_state = checkpoint[name] if phase == name else None
+                if args.algorithm == 'vi':
+                    solver = run_value_iteration(fitness, args.objective, state=solver_state,
+                                                 callback=checkpoint_callback(name))
+                else:
+                    solver = run_qlearning(fitness, args.population, args.generations, args.seed, args.objective,
+                                           state=solver_state, callback=checkpoint_callback(name))
+                report(name, solver.best_position, solver.best_score, solver.generation, fitness)
+                finish_run(name, solver.best_history, solver.best_position)
+
+            if fitness.cache is not None:
+                print("Fitness cache:", fitness.cache.summary())
+            if fitness.racing is not None:
+                print("Racing:", fitness.racing.summary())
+    finally:
+        fitness.close()
+
+
+if __name__ == "__main__":
+    main()
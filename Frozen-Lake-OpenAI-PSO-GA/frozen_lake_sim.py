@@ -0,0 +1,195 @@
+#Vectorized FrozenLake simulator, the FrozenLake backend of the shared tabular simulator. Steps every episode of every
+#policy at once as numpy array operations instead of calling env.step one move at a time.
+
+from collections import namedtuple
+
+import numpy as np
+
+from profiling import timers
+from tabular_sim import compile_table, play_episodes
+
+# Transition table compiled from env.unwrapped.P
+# next_states[s, a, k] is the k-th possible outcome of taking action a in state s and cum_probs[s, a, k] its cumulative probability
+Transitions = namedtuple('Transitions', ['next_states', 'cum_probs', 'holes', 'goals', 'start_state'])
+
+# Per-policy statistics, the same ones fitness_function reports
+# goal_step_counts[p, n] is the number of episodes of policy p that reached the goal in n steps, a (max_steps + 1)
+# histogram per policy whatever the number of episodes. bin 0 is always empty
+BatchStats = namedtuple('BatchStats', ['average_steps', 'falls', 'steps', 'goal_step_counts'])
+
+# Outcome of every single episode, (num_policies x num_episodes) arrays
+EpisodeResults = namedtuple('EpisodeResults', ['steps', 'fell', 'reached_goal'])
+
+
+# function to turn the gym transition dict into dense arrays, the holes and the goal are read off the map
+def build_transitions(env):
+    model = compile_table(env.unwrapped.P)
+    desc = np.asarray(env.unwrapped.desc).flatten()
+    return Transitions(next_states=model.next_states,
+                       cum_probs=model.cum_probs,
+                       holes=desc == b'H',
+                       goals=desc == b'G',
+                       start_state=int(np.flatnonzero(desc == b'S')[0]))
+
+
+# function to turn particle positions into discrete actions, the same as int(action) for positions inside the bounds
+def positions_to_policies(positions, num_actions):
+    return np.clip(np.atleast_2d(positions), 0, num_actions - 1).astype(np.uint8)
+
+
+# function to play num_episodes of every policy together. policies is a (num_policies x num_states) action table
+# rng is either one generator shared by all the policies or a list with one generator per policy. with one generator
+# per policy the episodes of a policy do not depend on which other policies are simulated in the same batch
+# noise is an optional (max_steps x num_episodes) tape of uniform draws replayed by every policy, step t of episode e
+# always uses noise[t, e] so all the policies face the same slips (common random numbers)
+# with the transitions of a batch of maps every policy plays num_episodes on each map, the results then have
+# num_maps * num_episodes columns, map by map. recorder is an optional TrajectoryRecorder that gets every step
+def simulate_episodes(transitions, policies, num_episodes, max_steps=100, rng=None, noise=None, recorder=None):
+    policies = np.atleast_2d(policies)
+    num_policies = len(policies)
+    start_states = np.atleast_1d(transitions.start_state)
+
+    # one flat run per (policy, map, episode), falling in a hole or reaching the goal ends it
+    runs_per_policy = len(start_states) * num_episodes
+    starts = np.tile(np.repeat(start_states, num_episodes), num_policies)
+    terminal = transitions.holes | transitions.goals
+    on_step = None
+    if recorder is not None:
+        first_episode = recorder.new_episodes(len(starts))
+
+        def on_step(live, t, s, a, next_state):
+            recorder.record_step(first_episode + live, t, s, a, transitions.holes[next_state],
+                                 transitions.goals[next_state], t == max_steps - 1)
+
+    runs = play_episodes(transitions.next_states, transitions.cum_probs, terminal[transitions.next_states], policies,
+                         starts, num_episodes, max_steps, rng, noise, on_step=on_step)
+
+    shape = (num_policies, runs_per_policy)
+    return EpisodeResults(steps=runs.steps.reshape(shape),
+                          fell=(runs.terminated & transitions.holes[runs.state]).reshape(shape),
+                          reached_goal=(runs.terminated & transitions.goals[runs.state]).reshape(shape))
+
+
+# function to count the episodes of every policy that reached the goal by their steps, (num_policies x max_steps + 1)
+def goal_step_histogram(steps, reached_goal, max_steps):
+    num_policies = len(steps)
+    bins = np.arange(num_policies)[:, None] * (max_steps + 1) + steps
+    counts = np.bincount(bins[reached_goal], minlength=num_policies * (max_steps + 1))
+    return counts.reshape(num_policies, max_steps + 1).astype(np.int32)
+
+
+# function to reduce per-episode results to the per-policy statistics, max_steps is the time limit they were played with
+# with map_quantile the average steps are that quantile of the per-map averages of num_maps maps instead of
+# the mean over all the episodes, e.g. 0.9 scores a policy by how it does on its worst maps
+def summarize_episodes(episodes, max_steps, num_maps=1, map_quantile=None):
+    with timers.phase('fitness_aggregate'):
+        total_steps = episodes.steps.sum(axis=1)
+        if map_quantile is None:
+            average_steps = total_steps / episodes.steps.shape[1]
+        else:
+            map_steps = episodes.steps.reshape(len(total_steps), num_maps, -1).mean(axis=2)
+            average_steps = np.quantile(map_steps, map_quantile, axis=1)
+        return BatchStats(average_steps=average_steps,
+                          falls=episodes.fell.sum(axis=1),
+                          steps=total_steps,
+                          goal_step_counts=goal_step_histogram(episodes.steps, episodes.reached_goal, max_steps))
+
+
+# function to play num_episodes of every policy together and return the per-policy statistics
+def simulate_batch(transitions, policies, num_episodes, max_steps=100, rng=None, noise=None):
+    return summarize_episodes(simulate_episodes(transitions, policies, num_episodes, max_steps, rng, noise), max_steps)
+
+
+# function to compute the exact expected cost of every stationary policy from the start state when the episodes are
+# cut off after horizon steps, like the simulated ones, by backward induction over each policy's own transitions.
+# arrival_costs[s] is paid on every move into state s, a (num_states x num_costs) array gives one column per cost
+def horizon_expected_costs(transitions, policies, horizon, arrival_costs):
+    policies = np.atleast_2d(policies).astype(np.intp)
+    num_policies, num_states = policies.shape
+    arrival_costs = np.asarray(arrival_costs, dtype=float)
+    costs = arrival_costs.reshape(num_states, -1)
+    s = np.arange(num_states)
+    probs = np.diff(transitions.cum_probs, axis=2, prepend=0.0)[s, policies][..., None]
+    next_states = transitions.next_states[s, policies]
+    step_costs = np.sum(probs * costs[next_states], axis=2)
+    terminal = transitions.holes | transitions.goals
+
+    rows = np.arange(num_policies)[:, None, None]
+    values = np.zeros((num_policies, num_states, costs.shape[1]))
+    for _ in range(horizon):
+        values = step_costs + np.sum(probs * values[rows, next_states], axis=2)
+        values[:, terminal] = 0.0
+    start_values = values[:, transitions.start_state]
+    return start_values[:, 0] if arrival_costs.ndim == 1 else start_values
+
+
+# Exact statistics of a fixed policy from the start state, solved as an absorbing Markov chain
+# expected_steps is the expected episode length, goal_steps the expected steps of the episodes that reach the goal
+ExactStats = namedtuple('ExactStats', ['expected_steps', 'fall_prob', 'goal_prob', 'goal_steps'])
+
+
+# function to build the state to state transition matrix of every policy, shape (num_policies x num_states x num_states)
+def policy_transition_matrices(transitions, policies):
+    policies = np.atleast_2d(policies)
+    num_policies, num_states = policies.shape
+    probs = np.diff(transitions.cum_probs, axis=2, prepend=0.0)
+
+    s = np.arange(num_states)
+    next_states = transitions.next_states[s, policies]
+    outcome_probs = probs[s, policies]
+    flat_index = (np.arange(num_policies)[:, None, None] * num_states + s[None, :, None]) * num_states + next_states
+    matrices = np.bincount(flat_index.ravel(), weights=outcome_probs.ravel(), minlength=num_policies * num_states * num_states)
+    return matrices.reshape(num_policies, num_states, num_states)
+
+
+# function to find the states that can reach any of the target states through the transition matrices Q
+def _can_reach(Q, targets):
+    edges = Q > 0
+    reached = targets.copy()
+    while True:
+        new_reached = reached | (edges & reached[:, None, :]).any(axis=2)
+        if (new_reached == reached).all():
+            return reached
+        reached = new_reached
+
+
+# function to solve (I - Q) x = rhs on the masked states only, the other states are pinned to 0
+def _solve_masked(Q, rhs, mask):
+    num_transient = Q.shape[1]
+    A = np.eye(num_transient) - Q
+    A[~mask] = 0.0
+    diagonal = np.arange(num_transient)
+    A[:, diagonal, diagonal] += ~mask
+    return np.linalg.solve(A, np.where(mask[:, :, None], rhs, 0.0))
+
+
+# function to compute the expected steps and hole/goal probabilities of every policy exactly, without playing any episode
+# holes and goals are the absorbing states, every other state is transient. episodes are not cut off by a time limit
+def exact_policy_stats(transitions, policies):
+    policies = np.atleast_2d(policies)
+    T = policy_transition_matrices(transitions, policies)
+    transient = ~(transitions.holes | transitions.goals)
+    start = np.flatnonzero(transient).tolist().index(transitions.start_state)
+
+    Q = T[:, transient][:, :, transient]
+    to_hole = T[:, transient][:, :, transitions.holes].sum(axis=2)
+    to_goal = T[:, transient][:, :, transitions.goals].sum(axis=2)
+
+    # states that can never reach a hole or the goal are trapped, states that can reach a trapped state never finish for sure
+    can_finish = _can_reach(Q, (to_hole + to_goal) > 0)
+    always_finishes = ~_can_reach(Q, ~can_finish)
+
+    # absorption probabilities are well defined for every state, trapped states have probability 0
+    absorb = _solve_masked(Q, np.stack([to_hole, to_goal], axis=2), can_finish)
+    fall_prob = absorb[:, start, 0]
+    goal_prob = absorb[:, start, 1]
+
+    # expected steps from the fundamental matrix N = (I - Q)^-1: N 1 is the episode length, N g the steps weighted by reaching the goal
+    ones = np.ones_like(to_goal)
+    visits = _solve_masked(Q, np.stack([ones, absorb[:, :, 1]], axis=2), always_finishes)
+    finite = always_finishes[:, start]
+    expected_steps = np.where(finite, visits[:, start, 0], np.inf)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        goal_steps = np.where(finite & (goal_prob > 0), visits[:, start, 1] / goal_prob, np.inf)
+
+    return ExactStats(expected_steps=expected_steps, fall_prob=fall_prob, goal_prob=goal_prob, goal_steps=goal_steps)
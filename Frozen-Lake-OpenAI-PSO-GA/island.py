@@ -0,0 +1,202 @@
+#Island model. K independent PSO or GA populations run in their own processes on the same map and every
+#migration_interval generations send their best individuals to their neighbours through one shared memory block.
+#The islands meet at a barrier around every exchange, so a run gives the same result however the processes are
+#scheduled. Each island evaluates its own population in its process, use one island per core.
+#
+#python -m island --islands 4 --algorithm pso --topology ring --migration-interval 5
+
+import argparse
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from frozen_lake_openai import FrozenLakeFitness, make_env, make_ga, make_pso, patience
+from large_map import generate_map_grid, grid_from_desc
+
+TOPOLOGIES = ('ring', 'full')
+
+IslandResult = namedtuple('IslandResult', ['island', 'best_position', 'best_score', 'generations', 'best_history'])
+
+
+# islands whose emigrants island k receives. ring passes them on to the next island, full sends them to every island
+def migration_sources(topology, island, num_islands):
+    if topology == 'ring':
+        return [(island - 1) % num_islands] if num_islands > 1 else []
+    if topology == 'full':
+        return [other for other in range(num_islands) if other != island]
+    raise ValueError(f"unknown topology {topology!r}, use one of {TOPOLOGIES}")
+
+
+# views of the shared block: emigrant positions, their scores and the converged flag of every island
+def _shared_arrays(buffer, num_islands, num_migrants, num_dimensions):
+    positions = np.ndarray((num_islands, num_migrants, num_dimensions), dtype=np.float64, buffer=buffer)
+    offset = positions.nbytes
+    scores = np.ndarray((num_islands, num_migrants), dtype=np.float64, buffer=buffer, offset=offset)
+    offset += scores.nbytes
+    converged = np.ndarray(num_islands, dtype=np.float64, buffer=buffer, offset=offset)
+    return positions, scores, converged
+
+
+def _shared_size(num_islands, num_migrants, num_dimensions):
+    return 8 * num_islands * (num_migrants * (num_dimensions + 1) + 1)
+
+
+# one island: builds its own fitness and optimizer, runs migration_interval generations between exchanges and
+# stops after num_generations or once every island has converged
+def _run_island(island, config, shm_name, barrier, results):
+    shm = shared_memory.SharedMemory(name=shm_name)
+    fitness = None
+    try:
+        num_islands = config['num_islands']
+        num_migrants = config['num_migrants']
+        optimizer_seed, fitness_seed = np.random.SeedSequence(config['seed']).spawn(num_islands)[island].generate_state(2)
+        fitness = FrozenLakeFitness.from_grid(config['grid'], num_episodes=config['num_episodes'],
+                                              max_steps=config['max_steps'], fitness_mode=config['fitness_mode'],
+                                              seed=int(fitness_seed), cache_size=config['cache_size'],
+                                              common_random_numbers=config['common_random_numbers'],
+                                              racing_rounds=config['racing_rounds'])
+        if config['algorithm'] == 'pso':
+            optimizer = make_pso(fitness, config['population'], int(optimizer_seed), config['patience'], config['dtype'])
+        else:
+            optimizer = make_ga(fitness, config['population'], int(optimizer_seed), config['crossover_method'],
+                                patience=config['patience'], dtype=config['dtype'])
+        positions, scores, converged = _shared_arrays(shm.buf, num_islands, num_migrants, fitness.num_dimensions)
+        sources = migration_sources(config['topology'], island, num_islands)
+
+        num_generations = config['num_generations']
+        while optimizer.generation < num_generations:
+            target = min(optimizer.generation + config['migration_interval'], num_generations)
+            while optimizer.generation < target:
+                optimizer.step()
+            if optimizer.generation == num_generations:
+                break
+
+            positions[island], scores[island] = optimizer.emigrants(num_migrants)
+            converged[island] = optimizer.converged
+            barrier.wait()
+            if converged.all():
+                break
+            # the best num_migrants of everything received replace the worst individuals of the island
+            incoming_positions = positions[sources].reshape(-1, fitness.num_dimensions).copy()
+            incoming_scores = scores[sources].ravel().copy()
+            barrier.wait()
+            if len(incoming_scores):
+                best = np.argsort(incoming_scores, kind='stable')[:num_migrants]
+                optimizer.immigrate(incoming_positions[best], incoming_scores[best])
+
+        if config['algorithm'] == 'pso':
+            best_position, best_score = optimizer.global_best_position, optimizer.global_best_score
+        else:
+            best_position, best_score = optimizer.best_position, optimizer.best_score
+        results.put(IslandResult(island, best_position, float(best_score), optimizer.generation,
+                                 np.asarray(optimizer.best_history)))
+    except BaseException as error:
+        # the other islands would wait at the barrier forever
+        barrier.abort()
+        results.put((island, repr(error)))
+    finally:
+        if fitness is not None:
+            fitness.close()
+        shm.close()
+
+
+# function to run the island model on a uint8 tile grid, returns the result of every island ordered by island
+def run_islands(grid, algorithm='pso', num_islands=4, population=100, num_generations=50, migration_interval=5,
+                num_migrants=2, topology='ring', seed=42, num_episodes=1000, max_steps=100, fitness_mode='sample',
+                crossover_method='single_point', patience=patience, cache_size=100000, common_random_numbers=False,
+                racing_rounds=0, dtype=np.float64):
+    if algorithm not in ('pso', 'ga'):
+        raise ValueError(f"unknown algorithm {algorithm!r}, use 'pso' or 'ga'")
+    migration_sources(topology, 0, num_islands)
+    num_migrants = min(num_migrants, population)
+    config = {'grid': grid, 'algorithm': algorithm, 'num_islands': num_islands, 'population': population,
+              'num_generations': num_generations, 'migration_interval': max(1, migration_interval),
+              'num_migrants': num_migrants, 'topology': topology, 'seed': seed, 'num_episodes': num_episodes,
+              'max_steps': max_steps, 'fitness_mode': fitness_mode, 'crossover_method': crossover_method,
+              'patience': patience, 'cache_size': cache_size, 'common_random_numbers': common_random_numbers,
+              'racing_rounds': racing_rounds, 'dtype': dtype}
+
+    shm = shared_memory.SharedMemory(create=True, size=_shared_size(num_islands, num_migrants, grid.size))
+    barrier = multiprocessing.Barrier(num_islands)
+    results = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=_run_island, args=(island, config, shm.name, barrier, results))
+                 for island in range(num_islands)]
+    try:
+        for process in processes:
+            process.start()
+        finished = [results.get() for _ in processes]
+        for process in processes:
+            process.join()
+    finally:
+        for process in processes:
+            if process.is_alive():
+                process.terminate()
+        shm.close()
+        shm.unlink()
+
+    errors = [result for result in finished if not isinstance(result, IslandResult)]
+    if errors:
+        raise RuntimeError(f"island {errors[0][0]} failed: {errors[0][1]}")
+    return sorted(finished, key=lambda result: result.island)
+
+
+# the island with the lowest best fitness
+def global_best(island_results):
+    return min(island_results, key=lambda result: result.best_score)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Island model PSO or GA on FrozenLake with periodic migration.")
+    parser.add_argument('--env-size', type=int, default=4, help="side length of the random map")
+    parser.add_argument('--large-map', action='store_true', help="generate the map as a uint8 grid without gym")
+    parser.add_argument('--algorithm', choices=('pso', 'ga'), default='pso')
+    parser.add_argument('--islands', type=int, default=os.cpu_count(), help="number of populations, one process each")
+    parser.add_argument('--population', type=int, default=100, help="particles or individuals per island")
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--migration-interval', type=int, default=5, help="generations between migrations")
+    parser.add_argument('--migrants', type=int, default=2, help="best individuals each island sends per migration")
+    parser.add_argument('--topology', choices=TOPOLOGIES, default='ring')
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--episodes', type=int, default=1000, help="episodes played per policy evaluation")
+    parser.add_argument('--max-steps', type=int, default=100, help="time limit of an episode on a --large-map")
+    parser.add_argument('--fitness-mode', choices=('sample', 'exact'), default='sample')
+    parser.add_argument('--crossover', choices=('single_point', 'two_point', 'uniform'), default='single_point')
+    parser.add_argument('--cache-size', type=int, default=100000, help="cached policy fitnesses per island, 0 disables")
+    parser.add_argument('--crn', action='store_true', help="common random numbers within a generation")
+    parser.add_argument('--racing-rounds', type=int, default=0, help="rounds of racing evaluation, 0 disables it")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.large_map:
+        grid = generate_map_grid(args.env_size, rng=np.random.default_rng(args.seed))
+        max_steps = args.max_steps
+        dtype = np.float32
+    else:
+        env, desc = make_env(args.env_size, args.seed)
+        grid = grid_from_desc(desc)
+        max_steps = env.spec.max_episode_steps
+        dtype = np.float64
+
+    start = time.perf_counter()
+    island_results = run_islands(grid, args.algorithm, args.islands, args.population, args.generations,
+                                 args.migration_interval, args.migrants, args.topology, args.seed, args.episodes,
+                                 max_steps, args.fitness_mode, args.crossover, cache_size=args.cache_size,
+                                 common_random_numbers=args.crn, racing_rounds=args.racing_rounds, dtype=dtype)
+    elapsed = time.perf_counter() - start
+
+    for result in island_results:
+        print(f"Island {result.island}: best steps {result.best_score:.4f} after {result.generations} generations")
+    best = global_best(island_results)
+    print(f"Global best steps: {best.best_score:.4f} (island {best.island})")
+    print("Global Best Position:", best.best_position)
+    print(f"{args.islands} islands in {elapsed:.2f} s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+#Large map mode. The map is a uint8 tile grid and the transition table is computed from it with array
+#operations, so no gym env and no dict-of-lists P is ever built. Used for maps up to 512x512 and beyond.
+
+import numpy as np
+
+from frozen_lake_sim import Transitions
+
+# tile codes of the uint8 grid
+FROZEN = 0
+HOLE = 1
+START = 2
+GOAL = 3
+
+_TILE_CODES = {b'F': FROZEN, b'H': HOLE, b'S': START, b'G': GOAL}
+_TILE_LETTERS = np.array([b'F', b'H', b'S', b'G'])
+
+# row and column change of the FrozenLake actions Left(0) Down(1) Right(2) Up(3)
+_ACTION_ROW = np.array([0, 1, 0, -1])
+_ACTION_COL = np.array([-1, 0, 1, 0])
+
+
+# function to turn a gym map description (list of strings) into a uint8 tile grid
+def grid_from_desc(desc):
+    letters = np.asarray([list(row) for row in desc], dtype='c')
+    grid = np.zeros(letters.shape, dtype=np.uint8)
+    for letter, code in _TILE_CODES.items():
+        grid[letters == letter] = code
+    return grid
+
+
+# function to turn a uint8 tile grid back into a gym map description
+def desc_from_grid(grid):
+    return [b''.join(row).decode() for row in _TILE_LETTERS[grid]]
+
+
+# checks that the goal can be reached from the start without stepping on a hole, by flood filling the frozen tiles
+def is_valid_grid(grid):
+    walkable = grid != HOLE
+    reached = grid == START
+    while True:
+        grown = reached.copy()
+        grown[1:] |= reached[:-1]
+        grown[:-1] |= reached[1:]
+        grown[:, 1:] |= reached[:, :-1]
+        grown[:, :-1] |= reached[:, 1:]
+        grown &= walkable
+        if grown[grid == GOAL].any():
+            return True
+        if (grown == reached).all():
+            return False
+        reached = grown
+
+
+# function to generate a random valid size x size map, p is the probability that a tile is frozen
+def generate_map_grid(size, p=0.8, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    while True:
+        grid = np.where(rng.random((size, size)) < p, FROZEN, HOLE).astype(np.uint8)
+        grid[0, 0] = START
+        grid[-1, -1] = GOAL
+        if is_valid_grid(grid):
+            return grid
+
+
+# function to generate a (num_maps x size x size) batch of random valid maps
+def generate_map_batch(num_maps, size, p=0.8, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    return np.stack([generate_map_grid(size, p, rng) for _ in range(num_maps)])
+
+
+# function to compute the transition table of a tile grid with the same rules as the gym FrozenLake env
+# a slippery move goes in the intended direction or one of the two perpendicular ones, each with probability 1/3
+# a (num_maps x rows x cols) batch of grids is compiled into one table where state m * rows * cols + s is state s of
+# map m, its start_state is then the array of the start state of every map
+def build_grid_transitions(grid, is_slippery=True):
+    grids = grid.reshape((-1,) + grid.shape[-2:])
+    num_maps, num_rows, num_cols = grids.shape
+    num_states = num_rows * num_cols
+    tiles = grids.ravel()
+    rows, cols = np.divmod(np.arange(num_states, dtype=np.int32), num_cols)
+
+    actions = np.arange(4)
+    if is_slippery:
+        moves = np.stack([(actions - 1) % 4, actions, (actions + 1) % 4], axis=1)
+    else:
+        moves = actions[:, None]
+
+    # (num_states x num_actions x num_outcomes) next state of every move, clamped at the edges of the map
+    # the maps share their shape so the moves are the same in every map, only shifted to the map's own states
+    next_rows = np.clip(rows[:, None, None] + _ACTION_ROW[moves], 0, num_rows - 1)
+    next_cols = np.clip(cols[:, None, None] + _ACTION_COL[moves], 0, num_cols - 1)
+    next_states = (next_rows * num_cols + next_cols).astype(np.int32)
+    if num_maps > 1:
+        map_offsets = np.arange(0, num_maps * num_states, num_states, dtype=np.int32)
+        next_states = (map_offsets[:, None, None, None] + next_states).reshape((-1,) + next_states.shape[1:])
+
+    # holes and the goal end the episode, the agent stays where it is
+    terminal = (tiles == HOLE) | (tiles == GOAL)
+    next_states[terminal] = np.flatnonzero(terminal)[:, None, None]
+
+    num_outcomes = moves.shape[1]
+    cum_probs = np.broadcast_to(np.cumsum(np.full(num_outcomes, 1.0 / num_outcomes)), next_states.shape).copy()
+    cum_probs[:, :, -1] = 1.0
+
+    start_states = np.flatnonzero(tiles == START)
+    return Transitions(next_states=next_states,
+                       cum_probs=cum_probs,
+                       holes=tiles == HOLE,
+                       goals=tiles == GOAL,
+                       start_state=int(start_states[0]) if grid.ndim == 2 else start_states)
@@ -0,0 +1,166 @@
+#Run metrics with a fixed memory footprint. Every population evaluation adds one row of per-generation
+#counters to preallocated ring buffers, the steps to goal go into a histogram instead of a growing list.
+#Rows can be streamed to a JSONL or CSV file and a rate-limited reporter prints the progress.
+
+import csv
+import json
+import os
+import sys
+import time
+
+import numpy as np
+
+# per-generation columns kept by RunMetrics
+COLUMNS = ('generation', 'evaluations', 'falls', 'steps', 'goal_hits', 'best_fitness', 'mean_fitness')
+
+
+class RunMetrics:
+    '''Per-generation counters in preallocated ring buffers plus running totals for the whole run.'''
+
+    def __init__(self, capacity=10000, max_steps=100, sink=None):
+        self.capacity = capacity
+        self.sink = sink
+        self.buffers = {column: np.zeros(capacity, dtype=np.int64 if column in ('generation', 'evaluations', 'goal_hits')
+                                         else np.float64) for column in COLUMNS}
+        self.goal_step_counts = np.zeros(max_steps + 1, dtype=np.int64)
+        self.reset()
+
+    # clears the counters for a new run, the buffers are reused
+    def reset(self, label='run'):
+        self.label = label
+        self.generation = 0
+        self.total_evaluations = 0
+        self.total_falls = 0
+        self.total_steps = 0
+        self.total_goal_hits = 0
+        self.best_fitness = np.inf
+        self.goal_step_counts[:] = 0
+
+    # records one population evaluation, stats is a BatchStats of per-policy arrays
+    def record(self, stats):
+        # the per-policy histograms of the steps to goal add up to the one of the generation
+        counts = np.sum(stats.goal_step_counts, axis=0, dtype=np.int64)
+        if len(counts) > len(self.goal_step_counts):
+            self.goal_step_counts = np.concatenate((self.goal_step_counts,
+                                                    np.zeros(len(counts) - len(self.goal_step_counts), dtype=np.int64)))
+        self.goal_step_counts[:len(counts)] += counts
+
+        row = {
+            'run': self.label,
+            'generation': self.generation,
+            'evaluations': len(stats.average_steps),
+            'falls': float(np.sum(stats.falls)),
+            'steps': float(np.sum(stats.steps)),
+            'goal_hits': int(counts.sum()),
+            'best_fitness': float(np.min(stats.average_steps)),
+            'mean_fitness': float(np.mean(stats.average_steps)),
+        }
+        slot = self.generation % self.capacity
+        for column in COLUMNS:
+            self.buffers[column][slot] = row[column]
+
+        self.total_evaluations += row['evaluations']
+        self.total_falls += row['falls']
+        self.total_steps += row['steps']
+        self.total_goal_hits += row['goal_hits']
+        self.best_fitness = min(self.best_fitness, row['best_fitness'])
+        self.generation += 1
+
+        if self.sink is not None:
+            self.sink.write(row)
+        return row
+
+    def state_dict(self):
+        state = {f'buffer_{column}': buffer for column, buffer in self.buffers.items()}
+        state.update({'label': self.label, 'generation': self.generation, 'total_evaluations': self.total_evaluations,
+                      'total_falls': self.total_falls, 'total_steps': self.total_steps,
+                      'total_goal_hits': self.total_goal_hits, 'best_fitness': self.best_fitness,
+                      'goal_step_counts': self.goal_step_counts})
+        return state
+
+    def load_state_dict(self, state):
+        for column in COLUMNS:
+            self.buffers[column] = np.array(state[f'buffer_{column}'])
+        self.capacity = len(self.buffers['generation'])
+        self.label = str(state['label'])
+        self.generation = int(state['generation'])
+        self.total_evaluations = int(state['total_evaluations'])
+        self.total_falls = float(state['total_falls'])
+        self.total_steps = float(state['total_steps'])
+        self.total_goal_hits = int(state['total_goal_hits'])
+        self.best_fitness = float(state['best_fitness'])
+        self.goal_step_counts = np.array(state['goal_step_counts'])
+
+    # the last min(generation, capacity) rows of a column, oldest first
+    def history(self, column):
+        buffer = self.buffers[column]
+        if self.generation <= self.capacity:
+            return buffer[:self.generation].copy()
+        slot = self.generation % self.capacity
+        return np.concatenate((buffer[slot:], buffer[:slot]))
+
+    @property
+    def mean_steps_to_goal(self):
+        if not self.total_goal_hits:
+            return float('nan')
+        return float(np.dot(np.arange(len(self.goal_step_counts)), self.goal_step_counts) / self.total_goal_hits)
+
+    def summary(self):
+        return {'generations': self.generation, 'evaluations': self.total_evaluations, 'falls': self.total_falls,
+                'steps': self.total_steps, 'goal_hits': self.total_goal_hits, 'best_fitness': self.best_fitness,
+                'mean_steps_to_goal': self.mean_steps_to_goal}
+
+
+class JsonlSink:
+    '''Writes one JSON object per generation.'''
+
+    def __init__(self, path, append=False):
+        self.file = open(path, 'a' if append else 'w')
+
+    def write(self, row):
+        self.file.write(json.dumps(row) + '\n')
+
+    def close(self):
+        self.file.close()
+
+
+class CsvSink:
+    '''Writes one CSV row per generation.'''
+
+    def __init__(self, path, append=False):
+        write_header = not (append and os.path.exists(path) and os.path.getsize(path) > 0)
+        self.file = open(path, 'a' if append else 'w', newline='')
+        self.writer = csv.DictWriter(self.file, fieldnames=('run',) + COLUMNS)
+        if write_header:
+            self.writer.writeheader()
+
+    def write(self, row):
+        self.writer.writerow(row)
+
+    def close(self):
+        self.file.close()
+
+
+# function to pick the sink from the file extension, .csv writes CSV and anything else JSONL
+# append keeps the rows already written, used when a run is resumed from a checkpoint
+def open_sink(path, append=False):
+    if path is None:
+        return None
+    return CsvSink(path, append) if path.endswith('.csv') else JsonlSink(path, append)
+
+
+class ProgressReporter:
+    '''Prints a progress line at most once every interval seconds.'''
+
+    def __init__(self, interval=1.0, stream=None):
+        self.interval = interval
+        self.stream = sys.stderr if stream is None else stream
+        self.last_report = -np.inf
+
+    def __call__(self, metrics, force=False):
+        now = time.perf_counter()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        print(f"{metrics.label} generation {metrics.generation}: best {metrics.best_fitness:.4f} "
+              f"falls {metrics.total_falls:.0f} goal hits {metrics.total_goal_hits}", file=self.stream)
@@ -0,0 +1,458 @@
+#Population based optimizers for the FrozenLake policies. The whole population is updated as
+#(particles x dimensions) arrays and evaluated with one batched fitness call per generation.
+#evaluate takes a (population x dimensions) array of positions and returns one fitness per row, lower is better.
+#AsyncParticleSwarm drops the generation barrier and keeps a bounded number of single particle evaluations in flight.
+
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, wait
+
+import numpy as np
+
+from checkpoint import restore_rng, rng_state
+from profiling import timers
+
+
+# function to try to move the particle from the start position to the goal state
+def generate_initial_positions(num_particles, num_dimensions, starting_point, deviation=1.0, rng=None):
+    rng = np.random if rng is None else rng
+    return starting_point + rng.uniform(-deviation, deviation, size=(num_particles, num_dimensions))
+
+
+class ParticleSwarm:
+    '''Multi-generation particle swarm that stops once the global best stops improving.'''
+
+    def __init__(self, evaluate, num_particles, num_dimensions, lower_bound, upper_bound,
+                 inertia_weight=0.8, cognitive_weight=1.5, social_weight=2.5,
+                 starting_point=0, deviation=0.5, patience=10, tolerance=1e-6, rng=None, dtype=np.float64):
+        self.evaluate = evaluate
+        self.num_particles = num_particles
+        self.num_dimensions = num_dimensions
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.inertia_weight = inertia_weight
+        self.cognitive_weight = cognitive_weight
+        self.social_weight = social_weight
+        # generations without an improvement larger than tolerance before the run stops
+        self.patience = patience
+        self.tolerance = tolerance
+        self.rng = np.random.default_rng() if rng is None else rng
+        # float32 halves the memory of the swarm state on large maps
+        self.dtype = np.dtype(dtype)
+
+        self.position = np.clip(generate_initial_positions(num_particles, num_dimensions, starting_point, deviation, self.rng),
+                                lower_bound, upper_bound).astype(self.dtype, copy=False)
+        self.velocities = self.rng.uniform(lower_bound, upper_bound, size=(num_particles, num_dimensions)).astype(self.dtype, copy=False)
+
+        # personal and global bests, filled by the first evaluation
+        self.best_position = self.position.copy()
+        self.best_score = np.full(num_particles, np.inf)
+        self.global_best_position = self.position[0].copy()
+        self.global_best_score = np.inf
+
+        self.generation = 0
+        self.stall_generations = 0
+        # best and mean fitness of every generation
+        self.best_history = []
+        self.mean_history = []
+
+    @property
+    def converged(self):
+        return self.stall_generations >= self.patience
+
+    # evaluates the current positions and updates the personal and global bests
+    def _update_bests(self):
+        scores = np.asarray(self.evaluate(self.position), dtype=float)
+
+        with timers.phase('pso_update_bests'):
+            improved = scores < self.best_score
+            self.best_score[improved] = scores[improved]
+            self.best_position[improved] = self.position[improved]
+
+            best_index = np.argmin(self.best_score)
+            if self.global_best_score - self.best_score[best_index] > self.tolerance:
+                self.stall_generations = 0
+            else:
+                self.stall_generations += 1
+            if self.best_score[best_index] < self.global_best_score:
+                self.global_best_score = self.best_score[best_index]
+                self.global_best_position = self.best_position[best_index].copy()
+
+            self.best_history.append(scores.min())
+            self.mean_history.append(scores.mean())
+        return scores
+
+    # PSO formula applied to the whole swarm at once, in place so large swarms need no extra full size copies
+    def _move(self):
+        shape = (self.num_particles, self.num_dimensions)
+        r1 = self.rng.random(shape, dtype=self.dtype)
+        r1 *= self.cognitive_weight
+        r1 *= self.best_position - self.position
+        r2 = self.rng.random(shape, dtype=self.dtype)
+        r2 *= self.social_weight
+        r2 *= self.global_best_position - self.position
+        self.velocities *= self.inertia_weight
+        self.velocities += r1
+        self.velocities += r2
+        self.position += self.velocities
+        np.clip(self.position, self.lower_bound, self.upper_bound, out=self.position)
+
+    # one generation: the first call scores the initial swarm, every later call moves the swarm and scores it
+    def step(self):
+        if self.generation > 0:
+            with timers.phase('pso_move'):
+                self._move()
+        scores = self._update_bests()
+        self.generation += 1
+        return scores
+
+    # runs until num_generations or until the global best has stalled for patience generations
+    # callback is called with the swarm after every generation, e.g. to write a checkpoint
+    def run(self, num_generations, callback=None):
+        while self.generation < num_generations and not self.converged:
+            self.step()
+            if callback is not None:
+                callback(self)
+        return self.global_best_position, self.global_best_score
+
+    # the n best personal bests and their scores, sent to the other islands of an island model
+    def emigrants(self, n):
+        order = np.argsort(self.best_score, kind='stable')[:n]
+        return self.best_position[order], self.best_score[order]
+
+    # replaces the particles with the worst personal bests by immigrants from other islands, they start at rest
+    def immigrate(self, positions, scores):
+        worst = np.argsort(self.best_score, kind='stable')[::-1][:len(positions)]
+        self.position[worst] = positions
+        self.best_position[worst] = positions
+        self.best_score[worst] = scores
+        self.velocities[worst] = 0
+        best_index = np.argmin(scores)
+        if scores[best_index] < self.global_best_score:
+            self.global_best_score = float(scores[best_index])
+            self.global_best_position = self.position[worst[best_index]].copy()
+
+    # everything needed to continue the run bit-exactly, as arrays and scalars
+    def state_dict(self):
+        return {'position': self.position, 'velocities': self.velocities,
+                'best_position': self.best_position, 'best_score': self.best_score,
+                'global_best_position': self.global_best_position, 'global_best_score': self.global_best_score,
+                'generation': self.generation, 'stall_generations': self.stall_generations,
+                'best_history': np.asarray(self.best_history, dtype=float),
+                'mean_history': np.asarray(self.mean_history, dtype=float),
+                'rng_state': rng_state(self.rng)}
+
+    def load_state_dict(self, state):
+        for name in ('position', 'velocities', 'best_position', 'best_score', 'global_best_position'):
+            setattr(self, name, np.array(state[name], dtype=getattr(self, name).dtype))
+        self.global_best_score = float(state['global_best_score'])
+        self.generation = int(state['generation'])
+        self.stall_generations = int(state['stall_generations'])
+        self.best_history = [float(value) for value in state['best_history']]
+        self.mean_history = [float(value) for value in state['mean_history']]
+        restore_rng(self.rng, state['rng_state'])
+
+
+class AsyncParticleSwarm(ParticleSwarm):
+    '''Steady-state PSO without a generation barrier, a particle moves on as soon as its own fitness is back.'''
+
+    # evaluator has submit(position) returning a concurrent.futures.Future and result(future, position) returning the
+    # fitness. at most max_in_flight particles are being evaluated at a time. deterministic handles the results in the
+    # order they were submitted, so the run does not depend on which worker finishes first
+    def __init__(self, evaluator, num_particles, num_dimensions, lower_bound, upper_bound, max_in_flight=None,
+                 deterministic=False, **kwargs):
+        super().__init__(None, num_particles, num_dimensions, lower_bound, upper_bound, **kwargs)
+        self.evaluator = evaluator
+        self.max_in_flight = num_particles if max_in_flight is None else max(1, min(max_in_flight, num_particles))
+        self.deterministic = deterministic
+        self.evaluations = 0
+        # particles waiting to be submitted and the Future of every submitted particle, oldest first
+        self.idle = deque(range(num_particles))
+        self.in_flight = {}
+        self._generation_scores = []
+        self._generation_start_best = np.inf
+
+    def _fill(self):
+        while self.idle and len(self.in_flight) < self.max_in_flight:
+            i = self.idle.popleft()
+            self.in_flight[self.evaluator.submit(self.position[i:i + 1])] = i
+
+    # the next finished evaluation, the oldest one when deterministic
+    def _next_done(self):
+        if self.deterministic:
+            return next(iter(self.in_flight))
+        done, _ = wait(self.in_flight, return_when=FIRST_COMPLETED)
+        return next(future for future in self.in_flight if future in done)
+
+    # PSO formula for one particle with the global best as it is right now
+    def _move_particle(self, i):
+        r1 = self.rng.random(self.num_dimensions, dtype=self.dtype)
+        r2 = self.rng.random(self.num_dimensions, dtype=self.dtype)
+        self.velocities[i] = (self.inertia_weight * self.velocities[i]
+                              + self.cognitive_weight * r1 * (self.best_position[i] - self.position[i])
+                              + self.social_weight * r2 * (self.global_best_position - self.position[i]))
+        self.position[i] += self.velocities[i]
+        np.clip(self.position[i], self.lower_bound, self.upper_bound, out=self.position[i])
+
+    def _update_particle(self, i, score):
+        if score < self.best_score[i]:
+            self.best_score[i] = score
+            self.best_position[i] = self.position[i]
+        if score < self.global_best_score:
+            self.global_best_score = score
+            self.global_best_position = self.position[i].copy()
+
+    # every num_particles evaluations count as one generation for the history, the patience and the callback
+    def _end_generation(self):
+        self.best_history.append(min(self._generation_scores))
+        self.mean_history.append(float(np.mean(self._generation_scores)))
+        self._generation_scores = []
+        if self._generation_start_best - self.global_best_score > self.tolerance:
+            self.stall_generations = 0
+        else:
+            self.stall_generations += 1
+        self._generation_start_best = self.global_best_score
+        self.generation += 1
+
+    # handles one finished evaluation: updates the bests, moves the particle and queues it again
+    def step(self):
+        self._fill()
+        with timers.phase('fitness_wait'):
+            future = self._next_done()
+        i = self.in_flight.pop(future)
+        score = self.evaluator.result(future, self.position[i:i + 1])
+        with timers.phase('pso_update_bests'):
+            self._update_particle(i, score)
+        with timers.phase('pso_move'):
+            self._move_particle(i)
+        self.idle.append(i)
+        self._generation_scores.append(score)
+        self.evaluations += 1
+        if self.evaluations % self.num_particles == 0:
+            self._end_generation()
+            return True
+        return False
+
+    # runs until num_generations generations worth of evaluations or until the global best has stalled
+    # the evaluations still in flight at the end are cancelled or left to finish unused
+    def run(self, num_generations, callback=None):
+        while self.generation < num_generations and not self.converged:
+            if self.step() and callback is not None:
+                callback(self)
+        for future in self.in_flight:
+            future.cancel()
+        self.idle.extend(self.in_flight.values())
+        self.in_flight = {}
+        return self.global_best_position, self.global_best_score
+
+
+#crossover of whole populations. row i of parents1 is paired with row i of parents2 and every pair gives two children
+#single_point and two_point swap the genes between random cut points, uniform swaps every gene with probability 0.5
+def crossover(parents1, parents2, method='single_point', rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    parents1 = np.atleast_2d(parents1)
+    parents2 = np.atleast_2d(parents2)
+    num_pairs, num_genes = parents1.shape
+    genes = np.arange(num_genes)
+
+    if method == 'single_point':
+        crossover_point = rng.integers(1, num_genes, size=(num_pairs, 1))
+        from_first = genes < crossover_point
+    elif method == 'two_point':
+        points = np.sort(rng.integers(1, num_genes, size=(num_pairs, 2)), axis=1)
+        from_first = (genes < points[:, :1]) | (genes >= points[:, 1:])
+    elif method == 'uniform':
+        from_first = rng.random((num_pairs, num_genes)) < 0.5
+    else:
+        raise ValueError(f"Unknown crossover method: {method}")
+
+    child1 = np.where(from_first, parents1, parents2)
+    child2 = np.where(from_first, parents2, parents1)
+    return child1, child2
+
+
+#mutation of a whole population, every gene is replaced by a random value with probability mutation_rate
+def mutate(population, mutation_rate, lower_bound, upper_bound, rng=None):
+    rng = np.random.default_rng() if rng is None else rng
+    mutation_mask = rng.random(population.shape) < mutation_rate
+    mutation_values = rng.uniform(lower_bound, upper_bound, size=population.shape)
+    population[mutation_mask] = mutation_values[mutation_mask]
+    return population
+
+
+class GeneticAlgorithm:
+    '''Generational GA with elitism and tournament selection, stops once the best fitness stops improving.'''
+
+    def __init__(self, evaluate, population_size, num_dimensions, lower_bound, upper_bound,
+                 mutation_rate=0.1, crossover_method='single_point', num_elites=2, tournament_size=3,
+                 initial_population=None, patience=10, tolerance=1e-6, rng=None, dtype=np.float64,
+                 surrogate=None, screen_fraction=0.25):
+        self.evaluate = evaluate
+        self.population_size = population_size
+        self.num_dimensions = num_dimensions
+        self.lower_bound = lower_bound
+        self.upper_bound = upper_bound
+        self.mutation_rate = mutation_rate
+        self.crossover_method = crossover_method
+        self.num_elites = num_elites
+        self.tournament_size = tournament_size
+        self.patience = patience
+        self.tolerance = tolerance
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.dtype = np.dtype(dtype)
+        # optional Surrogate that picks the screen_fraction of the children worth simulating
+        self.surrogate = surrogate
+        self.screen_fraction = screen_fraction
+        # children bred and individuals sent to evaluate over the run
+        self.children_bred = 0
+        self.evaluations = 0
+
+        if initial_population is None:
+            self.population = self.rng.uniform(lower_bound, upper_bound, size=(population_size, num_dimensions)).astype(self.dtype, copy=False)
+        else:
+            self.population = np.array(initial_population, dtype=self.dtype)[:population_size]
+        self.fitness_scores = None
+
+        self.best_position = self.population[0].copy()
+        self.best_score = np.inf
+
+        self.generation = 0
+        self.stall_generations = 0
+        # best and mean fitness of every generation
+        self.best_history = []
+        self.mean_history = []
+
+    @property
+    def converged(self):
+        return self.stall_generations >= self.patience
+
+    # picks num_winners parents, each one the fittest of tournament_size random individuals
+    def _tournament(self, num_winners):
+        contestants = self.rng.integers(0, len(self.population), size=(num_winners, self.tournament_size))
+        winners = np.argmin(self.fitness_scores[contestants], axis=1)
+        return contestants[np.arange(num_winners), winners]
+
+    # elites are copied unchanged, the rest of the next generation are mutated children of tournament winners
+    def _breed(self):
+        num_elites = min(self.num_elites, self.population_size)
+        elite_indices = np.argpartition(self.fitness_scores, num_elites - 1)[:num_elites] if num_elites else []
+
+        num_children = self.population_size - num_elites
+        num_pairs = (num_children + 1) // 2
+        parents = self._tournament(2 * num_pairs)
+        child1, child2 = crossover(self.population[parents[:num_pairs]], self.population[parents[num_pairs:]],
+                                   self.crossover_method, self.rng)
+        children = mutate(np.concatenate((child1, child2))[:num_children], self.mutation_rate,
+                          self.lower_bound, self.upper_bound, self.rng)
+        return np.concatenate((self.population[elite_indices], children))
+
+    # breeds the children, simulates only the fraction the surrogate ranks best and keeps the fittest of the old
+    # population and the simulated children, so every fitness in the population comes from the simulator
+    def _screened_generation(self):
+        num_elites = min(self.num_elites, self.population_size)
+        with timers.phase('ga_breed'):
+            children = self._breed()[num_elites:]
+        with timers.phase('surrogate_predict'):
+            predicted = self.surrogate.predict(children)
+        num_simulated = max(1, int(np.ceil(self.screen_fraction * len(children))))
+        chosen = np.argsort(predicted, kind='stable')[:num_simulated]
+        scores = np.asarray(self.evaluate(children[chosen]), dtype=float)
+        self.surrogate.record_accuracy(predicted[chosen], scores)
+        self.surrogate.add(children[chosen], scores)
+        self.children_bred += len(children)
+        self.evaluations += num_simulated
+
+        pool = np.concatenate((self.population, children[chosen]))
+        pool_scores = np.concatenate((self.fitness_scores, scores))
+        survivors = np.argsort(pool_scores, kind='stable')[:self.population_size]
+        self.population = pool[survivors]
+        self.fitness_scores = pool_scores[survivors]
+        return self._track_best()
+
+    def _update_best(self):
+        self.fitness_scores = np.asarray(self.evaluate(self.population), dtype=float)
+        if self.surrogate is not None:
+            self.surrogate.add(self.population, self.fitness_scores)
+        if self.generation > 0:
+            self.children_bred += self.population_size - min(self.num_elites, self.population_size)
+        self.evaluations += self.population_size
+        return self._track_best()
+
+    def _track_best(self):
+        with timers.phase('ga_update_best'):
+            best_index = np.argmin(self.fitness_scores)
+            if self.best_score - self.fitness_scores[best_index] > self.tolerance:
+                self.stall_generations = 0
+            else:
+                self.stall_generations += 1
+            if self.fitness_scores[best_index] < self.best_score:
+                self.best_score = self.fitness_scores[best_index]
+                self.best_position = self.population[best_index].copy()
+
+            self.best_history.append(self.fitness_scores[best_index])
+            self.mean_history.append(self.fitness_scores.mean())
+        return self.fitness_scores
+
+    # one generation: the first call scores the initial population, every later call breeds a new one and scores it
+    def step(self):
+        if self.generation > 0 and self.surrogate is not None and self.surrogate.ready:
+            scores = self._screened_generation()
+            self.generation += 1
+            return scores
+        if self.generation > 0:
+            with timers.phase('ga_breed'):
+                self.population = self._breed()
+        scores = self._update_best()
+        self.generation += 1
+        return scores
+
+    # runs until num_generations or until the best fitness has stalled for patience generations
+    # callback is called with the GA after every generation, e.g. to write a checkpoint
+    def run(self, num_generations, callback=None):
+        while self.generation < num_generations and not self.converged:
+            self.step()
+            if callback is not None:
+                callback(self)
+        return self.best_position, self.best_score
+
+    # the n fittest individuals and their scores, sent to the other islands of an island model
+    def emigrants(self, n):
+        order = np.argsort(self.fitness_scores, kind='stable')[:n]
+        return self.population[order], self.fitness_scores[order]
+
+    # replaces the least fit individuals by immigrants from other islands
+    def immigrate(self, positions, scores):
+        worst = np.argsort(self.fitness_scores, kind='stable')[::-1][:len(positions)]
+        self.population[worst] = positions
+        self.fitness_scores[worst] = scores
+        best_index = np.argmin(scores)
+        if scores[best_index] < self.best_score:
+            self.best_score = float(scores[best_index])
+            self.best_position = self.population[worst[best_index]].copy()
+
+    # everything needed to continue the run bit-exactly, as arrays and scalars
+    def state_dict(self):
+        return {'population': self.population, 'fitness_scores': self.fitness_scores,
+                'best_position': self.best_position, 'best_score': self.best_score,
+                'generation': self.generation, 'stall_generations': self.stall_generations,
+                'best_history': np.asarray(self.best_history, dtype=float),
+                'mean_history': np.asarray(self.mean_history, dtype=float),
+                'rng_state': rng_state(self.rng), 'children_bred': self.children_bred, 'evaluations': self.evaluations,
+                **({f'surrogate_{name}': value for name, value in self.surrogate.state_dict().items()}
+                   if self.surrogate is not None else {})}
+
+    def load_state_dict(self, state):
+        self.population = np.array(state['population'], dtype=self.dtype)
+        self.fitness_scores = np.array(state['fitness_scores'], dtype=float)
+        self.best_position = np.array(state['best_position'], dtype=self.dtype)
+        self.best_score = float(state['best_score'])
+        self.generation = int(state['generation'])
+        self.stall_generations = int(state['stall_generations'])
+        self.best_history = [float(value) for value in state['best_history']]
+        self.mean_history = [float(value) for value in state['mean_history']]
+        restore_rng(self.rng, state['rng_state'])
+        if 'children_bred' in state:
+            self.children_bred = int(state['children_bred'])
+            self.evaluations = int(state['evaluations'])
+        if self.surrogate is not None:
+            self.surrogate.load_state_dict({name[len('surrogate_'):]: value for name, value in state.items()
+                                            if name.startswith('surrogate_')})
@@ -0,0 +1,153 @@
+#Parallel fitness evaluation. Splits the population into chunks and simulates them on a process pool.
+#Every particle gets its own random stream spawned from one root seed, keyed by the evaluation call and the
+#particle index, so the results are bit-identical whatever the number of workers. With common random numbers
+#every particle of a call replays the same slip noise tape instead.
+
+import os
+from concurrent.futures import Future, ProcessPoolExecutor
+
+import numpy as np
+
+from frozen_lake_sim import build_transitions, simulate_episodes, summarize_episodes
+from large_map import build_grid_transitions
+
+# transition table of a pool worker process, the in-process evaluator keeps its own table instead
+_worker_transitions = None
+
+
+# compiles the transition table of the map, large maps are passed as a uint8 tile grid and compiled without building
+# a gym env
+def _compile_map(desc, is_slippery, grid=None):
+    if grid is not None:
+        return build_grid_transitions(grid, is_slippery)
+    import gym
+    return build_transitions(gym.make('FrozenLake-v1', desc=desc, is_slippery=is_slippery))
+
+
+# keeps the evaluator's compiled table in the worker, so every worker plays exactly the same MDP as the caller
+def _init_worker(transitions):
+    global _worker_transitions
+    _worker_transitions = transitions
+
+
+# random stream of one particle, stream_key is the evaluation call index or a tuple that extends it
+def particle_rng(seed, stream_key, particle_index):
+    stream_key = stream_key if isinstance(stream_key, tuple) else (stream_key,)
+    return np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(*stream_key, particle_index)))
+
+
+# slip noise tape shared by every particle of one evaluation call, (max_steps x num_episodes) uniform draws
+# the draws go episode by episode, so column e is the same whatever num_episodes and a wider tape only adds episodes
+def common_noise_tape(seed, call_index, max_steps, num_episodes):
+    rng = np.random.default_rng(np.random.SeedSequence(seed, spawn_key=(call_index,)))
+    return np.ascontiguousarray(rng.random((num_episodes, max_steps)).T)
+
+
+# plays a chunk of policies. with common set every policy replays episodes [episode_offset, episode_offset + num_episodes)
+# of the call's noise tape, the columns of the wider tape, so each racing round faces fresh episodes. otherwise each
+# policy draws from its own random stream
+# transitions is the table of the in-process evaluator, pool workers use the one their initializer built
+def _play_chunk(policies, seed, stream_key, first_index, num_episodes, max_steps, common=False, episode_offset=0,
+                transitions=None):
+    transitions = _worker_transitions if transitions is None else transitions
+    if common:
+        call_index = stream_key[0] if isinstance(stream_key, tuple) else stream_key
+        noise = common_noise_tape(seed, call_index, max_steps, episode_offset + num_episodes)[:, episode_offset:]
+        return simulate_episodes(transitions, policies, num_episodes, max_steps=max_steps, noise=noise)
+    rngs = [particle_rng(seed, stream_key, first_index + i) for i in range(len(policies))]
+    return simulate_episodes(transitions, policies, num_episodes, max_steps=max_steps, rng=rngs)
+
+
+# simulates a chunk of policies and reduces the episodes to per-policy statistics
+def _evaluate_chunk(policies, seed, call_index, first_index, num_episodes, max_steps, common=False, map_quantile=None,
+                    transitions=None):
+    transitions = _worker_transitions if transitions is None else transitions
+    episodes = _play_chunk(policies, seed, call_index, first_index, num_episodes, max_steps, common,
+                           transitions=transitions)
+    return summarize_episodes(episodes, max_steps, np.size(transitions.start_state), map_quantile)
+
+
+# joins the chunk results back in population order
+def _merge(chunks):
+    return type(chunks[0])(*(np.concatenate(field) for field in zip(*chunks)))
+
+
+class ParallelEvaluator:
+    '''Evaluates populations of policies on a pool of worker processes, all on one compiled transition table.'''
+
+    def __init__(self, desc, num_episodes, max_steps, seed=42, num_workers=None, is_slippery=True, chunks_per_worker=4,
+                 grid=None, common_random_numbers=False, map_quantile=None, transitions=None):
+        self.desc = desc
+        self.num_episodes = num_episodes
+        self.max_steps = max_steps
+        self.seed = seed
+        self.common_random_numbers = common_random_numbers
+        # grid can be a batch of maps, map_quantile then aggregates the per-map average steps
+        self.map_quantile = map_quantile
+        self.num_workers = os.cpu_count() if num_workers is None else num_workers
+        self.chunks_per_worker = chunks_per_worker
+        # number of evaluation calls so far
+        self.call_index = 0
+
+        # the table of the caller when given, compiled once here otherwise and sent to every pool worker
+        self.transitions = transitions if transitions is not None else _compile_map(desc, is_slippery, grid)
+        if self.num_workers > 1:
+            self.pool = ProcessPoolExecutor(max_workers=self.num_workers, initializer=_init_worker,
+                                            initargs=(self.transitions,))
+        else:
+            # a single worker runs in this process with the same code path
+            self.pool = None
+
+    # index of a new evaluation call, every call draws fresh streams
+    def next_call_index(self):
+        call_index = self.call_index
+        self.call_index += 1
+        return call_index
+
+    # runs fn on chunks of the policies, in this process or on the pool, and merges the results in order
+    def _map_chunks(self, fn, policies, stream_key, *args):
+        if self.pool is None:
+            return fn(policies, self.seed, stream_key, 0, *args, transitions=self.transitions)
+
+        num_chunks = min(len(policies), self.num_workers * self.chunks_per_worker)
+        bounds = np.linspace(0, len(policies), num_chunks + 1).astype(int)
+        futures = [self.pool.submit(fn, policies[start:end], self.seed, stream_key, start, *args)
+                   for start, end in zip(bounds[:-1], bounds[1:])]
+        return _merge([future.result() for future in futures])
+
+    # returns the BatchStats of every policy, in the same order as policies
+    def evaluate(self, policies):
+        policies = np.atleast_2d(policies)
+        return self._map_chunks(_evaluate_chunk, policies, self.next_call_index(), self.num_episodes, self.max_steps,
+                                self.common_random_numbers, self.map_quantile)
+
+    # starts the evaluation of a few policies and returns a Future of their BatchStats, without waiting for it.
+    # used by the asynchronous PSO, the Future is already done when there is no pool
+    def submit(self, policies, stream_key):
+        policies = np.atleast_2d(policies)
+        args = (policies, self.seed, stream_key, 0, self.num_episodes, self.max_steps, self.common_random_numbers,
+                self.map_quantile)
+        if self.pool is not None:
+            return self.pool.submit(_evaluate_chunk, *args)
+        future = Future()
+        future.set_result(_evaluate_chunk(*args, transitions=self.transitions))
+        return future
+
+    # plays num_episodes more episodes of every policy and returns the EpisodeResults. used by the racing evaluator,
+    # stream_key is (call_index, round) so every round of a call gets fresh streams, or replays the next
+    # episodes of the call's noise tape with common random numbers
+    def play(self, policies, stream_key, num_episodes, episode_offset=0):
+        policies = np.atleast_2d(policies)
+        return self._map_chunks(_play_chunk, policies, stream_key, num_episodes, self.max_steps,
+                                self.common_random_numbers, episode_offset)
+
+    def close(self):
+        if self.pool is not None:
+            self.pool.shutdown()
+            self.pool = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,63 @@
+#Plots of a finished run. With a path the figure is drawn on a matplotlib Figure with the Agg canvas and saved to a
+#PNG or SVG file, which needs no display and never blocks. Long series are decimated to a few thousand points first.
+
+import numpy as np
+
+# points kept of a decimated series
+MAX_PLOT_POINTS = 4000
+
+
+# function to shrink a long series for plotting. the series is cut into buckets and the minimum and maximum of each
+# bucket are kept in their original order, so spikes stay visible. returns the x indices and the values
+def decimate(values, max_points=MAX_PLOT_POINTS):
+    values = np.asarray(values)
+    num_values = len(values)
+    if num_values <= max_points:
+        return np.arange(num_values), values
+
+    num_buckets = max(1, max_points // 2)
+    bucket_size = -(-num_values // num_buckets)
+    padded = np.pad(values, (0, num_buckets * bucket_size - num_values), mode='edge').reshape(num_buckets, bucket_size)
+    offsets = np.arange(num_buckets)[:, None] * bucket_size
+    extremes = np.stack((np.argmin(padded, axis=1), np.argmax(padded, axis=1)), axis=1)
+    x = np.minimum(np.sort(extremes, axis=1) + offsets, num_values - 1).ravel()
+    return x, values[x]
+
+
+def _draw_results(fig, title, best_history, best_position):
+    ax = fig.add_subplot(1, 2, 1)
+    ax.plot(*decimate(best_history), label='Best Fitness per Generation')
+    ax.set_xlabel('Generation')
+    ax.set_ylabel('Best Fitness')
+    ax.set_title(f'{title} Best Fitness over Generations')
+    ax.legend()
+    ax.grid(True)
+    ax = fig.add_subplot(1, 2, 2)
+    ax.plot(*decimate(best_position), color='orange', label='Global Best Position')
+    ax.set_xlabel('State')
+    ax.set_ylabel('Global Best Position')
+    ax.set_title(f'{title} Best Global Position')
+    ax.legend()
+    ax.grid(True)
+    fig.tight_layout()
+
+
+# function to plot the best fitness per generation and the best position of a finished run
+# saved to path (the extension picks PNG or SVG) when given, shown in a window otherwise
+def plot_results(title, best_history, best_position, path=None):
+    if path is not None:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(12, 6))
+        FigureCanvasAgg(fig)
+        _draw_results(fig, title, best_history, best_position)
+        fig.savefig(path)
+        return path
+
+    import matplotlib.pyplot as plt
+
+    fig = plt.figure(figsize=(12, 6))
+    _draw_results(fig, title, best_history, best_position)
+    plt.show()
+    plt.close(fig)
@@ -0,0 +1,94 @@
+#Instrumentation of the hot paths. The simulator, the fitness and the optimizers wrap their phases in
+#timers.phase(name), which is a shared do-nothing context while the timers are disabled, so the hooks cost a method
+#call when nobody is looking. profiled() wraps a whole run in cProfile and tracemalloc and dumps sorted reports.
+#Phases that run in worker processes are only seen by the timers of that worker, use --workers 1 to time them.
+
+import cProfile
+import io
+import pstats
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+_DISABLED = nullcontext()
+
+
+class _Phase:
+    '''Adds the wall time of one with block to its phase.'''
+
+    __slots__ = ('timers', 'name', 'start')
+
+    def __init__(self, timers, name):
+        self.timers = timers
+        self.name = name
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+
+    def __exit__(self, *exc):
+        self.timers.add(self.name, time.perf_counter() - self.start)
+
+
+class PhaseTimers:
+    '''Wall time and call count per named phase of a run.'''
+
+    def __init__(self, enabled=False):
+        self.enabled = enabled
+        self.seconds = {}
+        self.calls = {}
+
+    def phase(self, name):
+        return _Phase(self, name) if self.enabled else _DISABLED
+
+    def add(self, name, seconds):
+        self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+        self.calls[name] = self.calls.get(name, 0) + 1
+
+    def reset(self):
+        self.seconds = {}
+        self.calls = {}
+
+    # the phases as a text table, the slowest first
+    def table(self, title='Phase timers'):
+        lines = [title, f"{'phase':<20}{'calls':>10}{'total s':>12}{'mean ms':>12}"]
+        for name, seconds in sorted(self.seconds.items(), key=lambda item: -item[1]):
+            calls = self.calls[name]
+            lines.append(f"{name:<20}{calls:>10}{seconds:>12.4f}{1000 * seconds / calls:>12.4f}")
+        return '\n'.join(lines)
+
+
+# timers shared by every module of this process, disabled until --timers turns them on
+timers = PhaseTimers()
+
+
+# runs the with block under cProfile and, with trace_memory, tracemalloc. the profile is written to path (binary,
+# for pstats or snakeviz) with a text report sorted by cumulative time next to it, or printed when path is None
+@contextmanager
+def profiled(path=None, trace_memory=False, top=25, stream=None):
+    stream = sys.stdout if stream is None else stream
+    profiler = cProfile.Profile()
+    if trace_memory:
+        tracemalloc.start()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        report = io.StringIO()
+        pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(top)
+        if path is None:
+            print(report.getvalue(), file=stream)
+        else:
+            profiler.dump_stats(path)
+            with open(path + '.txt', 'w') as f:
+                f.write(report.getvalue())
+            print("Profile written to", path, file=stream)
+
+        if trace_memory:
+            snapshot = tracemalloc.take_snapshot()
+            current, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            print(f"Traced memory: current {current / 2**20:.1f} MiB, peak {peak / 2**20:.1f} MiB", file=stream)
+            for statistic in snapshot.statistics('lineno')[:top]:
+                print(statistic, file=stream)
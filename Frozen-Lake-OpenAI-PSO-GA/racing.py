@@ -0,0 +1,84 @@
+#Adaptive evaluation budget. Candidates play their episodes in rounds of growing size and a candidate that is
+#statistically worse than the incumbent (the best mean so far) stops playing, so most of the budget goes to the
+#close contenders. Works best together with common random numbers, where the comparison is paired per episode.
+
+import numpy as np
+
+from frozen_lake_sim import BatchStats, goal_step_histogram
+
+
+# cumulative episodes after each round, doubling up to num_episodes (successive halving style budget)
+def round_schedule(num_episodes, num_rounds):
+    ends = [max(2, num_episodes >> (num_rounds - 1 - r)) for r in range(num_rounds)]
+    ends[-1] = num_episodes
+    return sorted(set(min(end, num_episodes) for end in ends))
+
+
+class RacingEvaluator:
+    '''Evaluates a population in rounds and drops candidates once they are statistically worse than the incumbent.'''
+
+    def __init__(self, evaluator, num_rounds=4, z=2.0):
+        # evaluator is a ParallelEvaluator, its num_episodes is the full budget of a candidate
+        self.evaluator = evaluator
+        self.num_rounds = num_rounds
+        # number of standard errors a candidate must be behind the incumbent before it is dropped
+        self.z = z
+        self.episodes_played = 0
+        self.episodes_budget = 0
+
+    @property
+    def savings(self):
+        return 1 - self.episodes_played / self.episodes_budget if self.episodes_budget else 0.0
+
+    # per-candidate flags of the candidates worse than the incumbent by more than z standard errors
+    def _worse_than_incumbent(self, steps, played, alive):
+        means = steps.sum(axis=1) / played
+        incumbent = np.flatnonzero(alive)[np.argmin(means[alive])]
+        n = played[incumbent]
+        if self.evaluator.common_random_numbers:
+            # the alive candidates all played the same episodes, compare them episode by episode
+            diff = steps[:, :n] - steps[incumbent, :n]
+            mean_diff = diff.mean(axis=1)
+            std_err = diff.std(axis=1, ddof=1) / np.sqrt(n)
+        else:
+            variances = steps[:, :n].var(axis=1, ddof=1)
+            mean_diff = means - means[incumbent]
+            std_err = np.sqrt((variances + variances[incumbent]) / n)
+        return alive & (mean_diff - self.z * std_err > 0)
+
+    # returns the BatchStats of every policy, the dropped ones averaged over the episodes they played
+    def evaluate(self, policies):
+        policies = np.atleast_2d(policies)
+        num_policies = len(policies)
+        num_episodes = self.evaluator.num_episodes
+        call_index = self.evaluator.next_call_index()
+
+        steps = np.zeros((num_policies, num_episodes), dtype=np.int32)
+        fell = np.zeros((num_policies, num_episodes), dtype=bool)
+        reached_goal = np.zeros((num_policies, num_episodes), dtype=bool)
+        played = np.zeros(num_policies, dtype=np.int64)
+        alive = np.ones(num_policies, dtype=bool)
+
+        start = 0
+        for round_index, end in enumerate(round_schedule(num_episodes, self.num_rounds)):
+            racing = np.flatnonzero(alive)
+            episodes = self.evaluator.play(policies[racing], (call_index, round_index), end - start, episode_offset=start)
+            steps[racing, start:end] = episodes.steps
+            fell[racing, start:end] = episodes.fell
+            reached_goal[racing, start:end] = episodes.reached_goal
+            played[racing] = end
+            start = end
+            if end < num_episodes and alive.sum() > 1:
+                alive &= ~self._worse_than_incumbent(steps, played, alive)
+
+        self.episodes_played += int(played.sum())
+        self.episodes_budget += num_policies * num_episodes
+        total_steps = steps.sum(axis=1)
+        return BatchStats(average_steps=total_steps / played,
+                          falls=fell.sum(axis=1),
+                          steps=total_steps,
+                          goal_step_counts=goal_step_histogram(steps, reached_goal, self.evaluator.max_steps))
+
+    def summary(self):
+        return {'episodes_played': self.episodes_played, 'episodes_budget': self.episodes_budget,
+                'savings': self.savings}
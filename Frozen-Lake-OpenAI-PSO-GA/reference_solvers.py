@@ -0,0 +1,249 @@
+#Reference solvers on the compiled transition table, a baseline for the PSO and GA. Value iteration sweeps every state
+#at once and finds the optimal policy in milliseconds, tabular Q-learning learns from batches of simulated episodes.
+#Both have the optimizer interface (step, run, best_position, best_score, best_history, state_dict) and score their
+#greedy policy with the same evaluate function as the optimizers, value iteration only once it has converged.
+#Q-learning keeps the greedy policy with the lowest exact cost under the objective, its sampled score is reported.
+#
+#objective 'steps' minimises the expected episode length, the same as the optimizers' fitness, and 'goal' maximises
+#the probability of reaching the goal. With a horizon value iteration solves for episodes cut off after that many
+#steps like the simulated ones, without one it solves the infinite horizon problem.
+
+import numpy as np
+
+from checkpoint import restore_rng, rng_state
+from frozen_lake_sim import horizon_expected_costs
+
+OBJECTIVES = ('steps', 'goal')
+
+
+# cost of arriving in every state, 1 per step for 'steps' and -1 for reaching the goal for 'goal'
+def arrival_costs(transitions, objective='steps'):
+    if objective == 'steps':
+        return np.ones(len(transitions.holes))
+    if objective == 'goal':
+        return -transitions.goals.astype(float)
+    raise ValueError(f"unknown objective {objective!r}, use one of {OBJECTIVES}")
+
+
+# function to compute the exact expected cost of every stationary policy from the start state when the episodes are
+# cut off after horizon steps. with objective 'steps' this is the expected average steps the simulated fitness
+# converges to
+def horizon_policy_costs(transitions, policies, horizon, objective='steps'):
+    return horizon_expected_costs(transitions, policies, horizon, arrival_costs(transitions, objective))
+
+
+def _check_single_map(transitions):
+    if np.ndim(transitions.start_state):
+        raise ValueError("the reference solvers work on a single map, not on a batch of maps")
+
+
+class ValueIteration:
+    '''Synchronous value iteration over all states and actions at once, one sweep per generation.'''
+
+    def __init__(self, evaluate, transitions, objective='steps', tolerance=1e-6, horizon=None):
+        _check_single_map(transitions)
+        self.evaluate = evaluate
+        self.transitions = transitions
+        self.objective = objective
+        # the sweeps stop once no value changes by more than tolerance
+        self.tolerance = tolerance
+        # with a horizon sweep h gives the expected cost with h steps left and the sweeps stop after horizon of them
+        self.horizon = horizon
+        self.probs = np.diff(transitions.cum_probs, axis=2, prepend=0.0)
+        self.costs = arrival_costs(transitions, objective)[transitions.next_states]
+        self.terminal = transitions.holes | transitions.goals
+
+        # expected cost to go of every state, 0 in the holes and the goal
+        self.values = np.zeros(len(self.terminal))
+        self.delta = np.inf
+        # greedy policy of the latest sweep, scored once the sweeps are done
+        self.greedy_position = np.zeros(len(self.terminal))
+        self.best_position = np.zeros(len(self.terminal))
+        self.best_score = np.inf
+        self.generation = 0
+        self.best_history = []
+        self.mean_history = []
+
+    @property
+    def converged(self):
+        return self.delta < self.tolerance or (self.horizon is not None and self.generation >= self.horizon)
+
+    # expected cost from the start state under the current values. once converged no policy does better on average,
+    # stationary or not
+    @property
+    def optimal_cost(self):
+        return float(self.values[self.transitions.start_state])
+
+    # (num_states x num_actions) expected cost of every action under the current values
+    def action_values(self):
+        q = np.sum(self.probs * (self.costs + self.values[self.transitions.next_states]), axis=2)
+        q[self.terminal] = 0.0
+        return q
+
+    # one Bellman sweep, nothing is simulated
+    def sweep(self):
+        q = self.action_values()
+        new_values = q.min(axis=1)
+        self.delta = float(np.max(np.abs(new_values - self.values)))
+        self.values = new_values
+        self.greedy_position = np.argmin(q, axis=1).astype(float)
+        self.generation += 1
+
+    # sweeps until converged or num_sweeps sweeps were made, returns the values
+    def solve(self, num_sweeps):
+        while self.generation < num_sweeps and not self.converged:
+            self.sweep()
+        return self.values
+
+    # scores the greedy policy of the latest sweep, it is the solver's answer
+    def score(self):
+        score = float(np.asarray(self.evaluate(self.greedy_position[None]), dtype=float)[0])
+        self.best_position = self.greedy_position
+        self.best_score = score
+        self.best_history.append(score)
+        self.mean_history.append(score)
+        return np.array([score])
+
+    # one Bellman sweep, the greedy policy is only simulated once the values have converged
+    def step(self):
+        self.sweep()
+        return self.score() if self.converged else np.empty(0)
+
+    def run(self, num_generations, callback=None):
+        while self.generation < num_generations and not self.converged:
+            self.step()
+            if callback is not None:
+                callback(self)
+        # a run stopped by num_generations before converging scores the policy it got to
+        if not self.converged:
+            self.score()
+        return self.best_position, self.best_score
+
+    def state_dict(self):
+        return {'values': self.values, 'delta': self.delta, 'greedy_position': self.greedy_position,
+                'best_position': self.best_position, 'best_score': self.best_score, 'generation': self.generation,
+                'best_history': np.asarray(self.best_history, dtype=float),
+                'mean_history': np.asarray(self.mean_history, dtype=float)}
+
+    def load_state_dict(self, state):
+        self.values = np.array(state['values'], dtype=float)
+        self.delta = float(state['delta'])
+        self.greedy_position = np.array(state['greedy_position'], dtype=float)
+        self.best_position = np.array(state['best_position'], dtype=float)
+        self.best_score = float(state['best_score'])
+        self.generation = int(state['generation'])
+        self.best_history = [float(value) for value in state['best_history']]
+        self.mean_history = [float(value) for value in state['mean_history']]
+
+
+class QLearning:
+    '''Tabular Q-learning where a batch of epsilon-greedy episodes shares one Q table, one batch per generation.'''
+
+    def __init__(self, evaluate, transitions, num_agents=100, max_steps=100, learning_rate=0.1, epsilon=1.0,
+                 epsilon_decay=0.9, min_epsilon=0.05, objective='steps', patience=10, tolerance=1e-6, rng=None):
+        _check_single_map(transitions)
+        self.evaluate = evaluate
+        self.transitions = transitions
+        self.num_agents = num_agents
+        self.max_steps = max_steps
+        self.learning_rate = learning_rate
+        self.epsilon = epsilon
+        self.epsilon_decay = epsilon_decay
+        self.min_epsilon = min_epsilon
+        self.patience = patience
+        self.tolerance = tolerance
+        self.rng = np.random.default_rng() if rng is None else rng
+        self.objective = objective
+        self.costs = arrival_costs(transitions, objective)
+        self.terminal = transitions.holes | transitions.goals
+
+        num_states, num_actions = transitions.next_states.shape[:2]
+        self.q = np.zeros((num_states, num_actions))
+        self.best_position = np.zeros(num_states)
+        self.best_score = np.inf
+        # exact cost of best_position under the objective within max_steps, the greedy policies are compared on it
+        self.best_cost = np.inf
+        self.generation = 0
+        self.stall_generations = 0
+        self.best_history = []
+        self.mean_history = []
+
+    @property
+    def converged(self):
+        return self.stall_generations >= self.patience
+
+    # plays one batch of episodes, every step moves Q towards the cost of the move plus the best value of the next
+    # state. agents that update the same (state, action) in the same step share one averaged update
+    def _learn(self):
+        transitions = self.transitions
+        num_states, num_actions, num_outcomes = transitions.next_states.shape
+        state = np.full(self.num_agents, transitions.start_state)
+        for _ in range(self.max_steps):
+            greedy = np.argmin(self.q[state], axis=1)
+            explore = self.rng.random(len(state)) < self.epsilon
+            action = np.where(explore, self.rng.integers(0, num_actions, size=len(state)), greedy)
+
+            u = self.rng.random(len(state))
+            k = np.minimum((u[:, None] >= transitions.cum_probs[state, action]).sum(axis=1), num_outcomes - 1)
+            next_state = transitions.next_states[state, action, k]
+            done = self.terminal[next_state]
+            target = self.costs[next_state] + np.where(done, 0.0, self.q[next_state].min(axis=1))
+
+            index = state * num_actions + action
+            counts = np.bincount(index, minlength=num_states * num_actions)
+            sums = np.bincount(index, weights=target, minlength=num_states * num_actions)
+            updated = counts > 0
+            flat_q = self.q.reshape(-1)
+            flat_q[updated] += self.learning_rate * (sums[updated] / counts[updated] - flat_q[updated])
+
+            state = next_state[~done]
+            if state.size == 0:
+                break
+        self.epsilon = max(self.min_epsilon, self.epsilon * self.epsilon_decay)
+
+    # one batch of episodes, then the greedy policy is scored. it replaces the best one when its exact cost under the
+    # objective is lower, the sampled score of evaluate only measures steps
+    def step(self):
+        self._learn()
+        position = np.argmin(self.q, axis=1).astype(float)
+        score = float(np.asarray(self.evaluate(position[None]), dtype=float)[0])
+        cost = float(horizon_policy_costs(self.transitions, position[None], self.max_steps, self.objective)[0])
+        if self.best_cost - cost > self.tolerance:
+            self.stall_generations = 0
+        else:
+            self.stall_generations += 1
+        if cost < self.best_cost:
+            self.best_cost = cost
+            self.best_score = score
+            self.best_position = position
+        self.best_history.append(score)
+        self.mean_history.append(score)
+        self.generation += 1
+        return np.array([score])
+
+    def run(self, num_generations, callback=None):
+        while self.generation < num_generations and not self.converged:
+            self.step()
+            if callback is not None:
+                callback(self)
+        return self.best_position, self.best_score
+
+    def state_dict(self):
+        return {'q': self.q, 'epsilon': self.epsilon, 'best_position': self.best_position,
+                'best_score': self.best_score, 'best_cost': self.best_cost, 'generation': self.generation,
+                'stall_generations': self.stall_generations,
+                'best_history': np.asarray(self.best_history, dtype=float),
+                'mean_history': np.asarray(self.mean_history, dtype=float),
+                'rng_state': rng_state(self.rng)}
+
+    def load_state_dict(self, state):
+        self.q = np.array(state['q'], dtype=float)
+        self.epsilon = float(state['epsilon'])
+        self.best_position = np.array(state['best_position'], dtype=float)
+        self.best_score = float(state['best_score'])
+        self.best_cost = float(state['best_cost'])
+        self.generation = int(state['generation'])
+        self.stall_generations = int(state['stall_generations'])
+        self.best_history = [float(value) for value in state['best_history']]
+        self.mean_history = [float(value) for value in state['mean_history']]
+        restore_rng(self.rng, state['rng_state'])
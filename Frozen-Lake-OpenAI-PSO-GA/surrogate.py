@@ -0,0 +1,176 @@
+#Surrogate models of the fitness, trained online on the (policy, fitness) pairs the GA already simulated. They rank
+#the offspring so only the most promising fraction is sent to the simulator. Both work on the action table the
+#positions cast to: the k nearest neighbours by number of differing actions, or a ridge regression on the one-hot
+#action table. Every screened generation compares the predictions with the simulated fitness to track accuracy.
+
+import numpy as np
+
+SURROGATES = ('knn', 'linear')
+
+# largest one-hot action table the linear surrogate accepts, it keeps a features x features matrix
+MAX_LINEAR_FEATURES = 2048
+
+
+# spearman rank correlation of two 1-d arrays, nan when it is undefined
+def rank_correlation(a, b):
+    if len(a) < 2:
+        return float('nan')
+    rank_a = np.argsort(np.argsort(a, kind='stable'), kind='stable')
+    rank_b = np.argsort(np.argsort(b, kind='stable'), kind='stable')
+    if rank_a.std() == 0 or rank_b.std() == 0:
+        return float('nan')
+    return float(np.corrcoef(rank_a, rank_b)[0, 1])
+
+
+class Surrogate:
+    '''Shared bookkeeping of the surrogates: training counts and prediction accuracy per screened generation.'''
+
+    def __init__(self, num_actions, min_samples=50):
+        self.num_actions = num_actions
+        # predictions are only trusted after this many simulated policies
+        self.min_samples = min_samples
+        self.num_samples = 0
+        self.rank_history = []
+        self.error_history = []
+
+    @property
+    def ready(self):
+        return self.num_samples >= self.min_samples
+
+    # the action table of the positions, the same cast as positions_to_policies
+    def _policies(self, positions):
+        return np.clip(np.atleast_2d(positions), 0, self.num_actions - 1).astype(np.uint8)
+
+    def add(self, positions, scores):
+        scores = np.asarray(scores, dtype=float)
+        finite = np.isfinite(scores)
+        self._add(self._policies(positions)[finite], scores[finite])
+        self.num_samples += int(finite.sum())
+
+    def predict(self, positions):
+        return self._predict(self._policies(positions))
+
+    # compares predictions with the simulated fitness of the same policies
+    def record_accuracy(self, predicted, actual):
+        actual = np.asarray(actual, dtype=float)
+        finite = np.isfinite(actual)
+        errors = np.abs(predicted[finite] - actual[finite])
+        self.rank_history.append(rank_correlation(predicted[finite], actual[finite]))
+        self.error_history.append(float(errors.mean()) if len(errors) else float('nan'))
+
+    def summary(self):
+        return {'samples': self.num_samples,
+                'rank_correlation': float(np.nanmean(self.rank_history)) if self.rank_history else float('nan'),
+                'mean_abs_error': float(np.nanmean(self.error_history)) if self.error_history else float('nan')}
+
+
+class KNNSurrogate(Surrogate):
+    '''Mean fitness of the k simulated policies with the fewest differing actions, over a bounded ring of samples.'''
+
+    def __init__(self, num_actions, k=5, capacity=5000, min_samples=50, chunk_size=64):
+        super().__init__(num_actions, min_samples)
+        self.k = k
+        self.capacity = capacity
+        self.chunk_size = chunk_size
+        self.policies = None
+        self.scores = np.zeros(capacity)
+
+    def _add(self, policies, scores):
+        if self.policies is None:
+            self.policies = np.zeros((self.capacity, policies.shape[1]), dtype=np.uint8)
+        for start in range(0, len(policies), self.capacity):
+            batch = slice(start, start + self.capacity)
+            slots = (self.num_samples + start + np.arange(len(policies[batch]))) % self.capacity
+            self.policies[slots] = policies[batch]
+            self.scores[slots] = scores[batch]
+
+    def _predict(self, policies):
+        stored = min(self.num_samples, self.capacity)
+        k = min(self.k, stored)
+        predictions = np.empty(len(policies))
+        # chunks of candidates keep the candidates x samples x states comparison small
+        for start in range(0, len(policies), self.chunk_size):
+            chunk = policies[start:start + self.chunk_size]
+            distances = (chunk[:, None, :] != self.policies[None, :stored, :]).sum(axis=2)
+            nearest = np.argpartition(distances, k - 1, axis=1)[:, :k]
+            predictions[start:start + len(chunk)] = self.scores[nearest].mean(axis=1)
+        return predictions
+
+    def state_dict(self):
+        return {'num_samples': self.num_samples, 'scores': self.scores,
+                'policies': self.policies if self.policies is not None else np.zeros((0, 0), dtype=np.uint8),
+                'rank_history': np.asarray(self.rank_history, dtype=float),
+                'error_history': np.asarray(self.error_history, dtype=float)}
+
+    def load_state_dict(self, state):
+        self.num_samples = int(state['num_samples'])
+        self.scores = np.array(state['scores'], dtype=float)
+        self.policies = np.array(state['policies'], dtype=np.uint8) if np.size(state['policies']) else None
+        self.rank_history = [float(value) for value in state['rank_history']]
+        self.error_history = [float(value) for value in state['error_history']]
+
+
+class LinearSurrogate(Surrogate):
+    '''Ridge regression of the fitness on the one-hot action table, refit from running sums when asked to predict.'''
+
+    def __init__(self, num_actions, num_states, ridge=1.0, min_samples=50):
+        super().__init__(num_actions, min_samples)
+        num_features = num_states * num_actions
+        if num_features > MAX_LINEAR_FEATURES:
+            raise ValueError(f"a linear surrogate of {num_states} states needs a {num_features} x {num_features} "
+                             f"matrix, use the knn surrogate on maps this large")
+        self.ridge = ridge
+        # running sums of the centred normal equations
+        self.xtx = np.zeros((num_features, num_features))
+        self.xty = np.zeros(num_features)
+        self.column_sums = np.zeros(num_features)
+        self.score_sum = 0.0
+        self.weights = None
+
+    # index of the one-hot feature of every (policy, state)
+    def _features(self, policies):
+        return np.arange(policies.shape[1]) * self.num_actions + policies
+
+    def _add(self, policies, scores):
+        features = self._features(policies)
+        np.add.at(self.xtx, (features[:, :, None], features[:, None, :]), 1.0)
+        np.add.at(self.xty, features, scores[:, None])
+        np.add.at(self.column_sums, features, 1.0)
+        self.score_sum += float(scores.sum())
+        self.weights = None
+
+    def _predict(self, policies):
+        n = max(self.num_samples, 1)
+        mean_score = self.score_sum / n
+        if self.weights is None:
+            mean_features = self.column_sums / n
+            # covariance of the features and of features and fitness, minus the means
+            covariance = self.xtx - n * np.outer(mean_features, mean_features)
+            target = self.xty - n * mean_score * mean_features
+            self.weights = np.linalg.solve(covariance + self.ridge * np.eye(len(target)), target)
+            self.offset = mean_score - mean_features @ self.weights
+        return self.weights[self._features(policies)].sum(axis=1) + self.offset
+
+    def state_dict(self):
+        return {'num_samples': self.num_samples, 'xtx': self.xtx, 'xty': self.xty, 'column_sums': self.column_sums,
+                'score_sum': self.score_sum, 'rank_history': np.asarray(self.rank_history, dtype=float),
+                'error_history': np.asarray(self.error_history, dtype=float)}
+
+    def load_state_dict(self, state):
+        self.num_samples = int(state['num_samples'])
+        self.xtx = np.array(state['xtx'], dtype=float)
+        self.xty = np.array(state['xty'], dtype=float)
+        self.column_sums = np.array(state['column_sums'], dtype=float)
+        self.score_sum = float(state['score_sum'])
+        self.rank_history = [float(value) for value in state['rank_history']]
+        self.error_history = [float(value) for value in state['error_history']]
+        self.weights = None
+
+
+# function to build a surrogate by name for policies of num_states states
+def make_surrogate(name, num_actions, num_states, min_samples=50):
+    if name == 'knn':
+        return KNNSurrogate(num_actions, min_samples=min_samples)
+    if name == 'linear':
+        return LinearSurrogate(num_actions, num_states, min_samples=min_samples)
+    raise ValueError(f"unknown surrogate {name!r}, use one of {SURROGATES}")
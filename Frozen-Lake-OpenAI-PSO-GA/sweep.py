@@ -0,0 +1,320 @@
+#Hyperparameter sweep of the PSO weights, the GA mutation rate and the population size. Configurations come from a
+#grid, uniform random draws or a Latin hypercube, every trial runs on a process pool and its result, config and
+#timing go to a SQLite file. A trial is keyed by a hash of its full config, so a config already in the file is never
+#run twice and an interrupted sweep picks up the trials that did not finish when the same command is run again.
+#Every trial's best policy is scored again on the same held-out episodes, so the trials are compared fairly.
+#
+#python -m sweep --algorithm pso --search lhs --trials 32 --workers 4 --db sweep.db
+
+import argparse
+import hashlib
+import itertools
+import json
+import os
+import sqlite3
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from frozen_lake_openai import FrozenLakeFitness, make_env, make_ga, make_pso
+from frozen_lake_sim import positions_to_policies, simulate_batch
+from parallel_fitness import common_noise_tape
+
+SEARCHES = ('grid', 'random', 'lhs')
+
+# (low, high) of every parameter, population is rounded to an integer
+PARAMETER_RANGES = {
+    'inertia_weight': (0.2, 1.2),
+    'cognitive_weight': (0.0, 3.0),
+    'social_weight': (0.0, 3.0),
+    'mutation_rate': (0.01, 0.5),
+    'population': (20, 200),
+}
+INTEGER_PARAMETERS = ('population',)
+
+# the parameters each algorithm uses, the others would only split identical trials apart
+ALGORITHM_PARAMETERS = {
+    'pso': ('inertia_weight', 'cognitive_weight', 'social_weight', 'population'),
+    'ga': ('mutation_rate', 'population'),
+}
+
+# sampled values are rounded so configs that only differ by float noise count as the same trial
+DECIMALS = 4
+
+# slip noise of the held-out episodes every trial's best policy is scored on
+VALIDATION_SEED = 20240601
+
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS trials (
+    key TEXT PRIMARY KEY,
+    algorithm TEXT NOT NULL,
+    config TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    best_score REAL,
+    validation_steps REAL,
+    generations INTEGER,
+    seconds REAL,
+    error TEXT,
+    created REAL,
+    finished REAL
+)
+'''
+
+
+# scales unit samples (num_configs x num_parameters) to the parameter ranges
+def _scale(unit, names, ranges):
+    configs = []
+    for row in unit:
+        config = {}
+        for name, u in zip(names, row):
+            low, high = ranges[name]
+            value = low + u * (high - low)
+            config[name] = int(round(value)) if name in INTEGER_PARAMETERS else round(float(value), DECIMALS)
+        configs.append(config)
+    return configs
+
+
+# function to build levels evenly spaced values of every parameter and all their combinations
+def grid_configs(names, levels, ranges=PARAMETER_RANGES):
+    axis = np.linspace(0.0, 1.0, levels) if levels > 1 else np.array([0.5])
+    return _scale(list(itertools.product(axis, repeat=len(names))), names, ranges)
+
+
+# function to draw num_configs configurations uniformly from the ranges
+def random_configs(names, num_configs, rng, ranges=PARAMETER_RANGES):
+    return _scale(rng.random((num_configs, len(names))), names, ranges)
+
+
+# function to draw a Latin hypercube of num_configs configurations, every parameter's range is cut into
+# num_configs strata and each stratum is sampled exactly once
+def latin_hypercube_configs(names, num_configs, rng, ranges=PARAMETER_RANGES):
+    strata = np.stack([rng.permutation(num_configs) for _ in names], axis=1)
+    return _scale((strata + rng.random((num_configs, len(names)))) / num_configs, names, ranges)
+
+
+# identity of a trial, the hash of its config with the keys sorted
+def config_key(config):
+    return hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()
+
+
+class SweepStore:
+    '''SQLite table of the trials of a sweep, one row per config, written only by the process that runs the sweep.'''
+
+    def __init__(self, path):
+        self.connection = sqlite3.connect(path)
+        self.connection.execute(SCHEMA)
+        self.connection.commit()
+
+    # adds the configs that are not in the table yet as pending trials, returns how many were new
+    def add(self, configs):
+        now = time.time()
+        before = self.connection.total_changes
+        self.connection.executemany(
+            "INSERT OR IGNORE INTO trials (key, algorithm, config, created) VALUES (?, ?, ?, ?)",
+            [(config_key(config), config['algorithm'], json.dumps(config, sort_keys=True), now) for config in configs])
+        self.connection.commit()
+        return self.connection.total_changes - before
+
+    # configs of the given keys that still have to run, failed trials only when retry_failed
+    def pending(self, keys, retry_failed=False):
+        statuses = ('pending', 'failed') if retry_failed else ('pending',)
+        rows = self.connection.execute(
+            f"SELECT key, config FROM trials WHERE status IN ({','.join('?' * len(statuses))})", statuses).fetchall()
+        wanted = set(keys)
+        return [json.loads(config) for key, config in rows if key in wanted]
+
+    def record(self, config, result):
+        self.connection.execute(
+            "UPDATE trials SET status = 'done', best_score = ?, validation_steps = ?, generations = ?, seconds = ?, "
+            "error = NULL, finished = ? WHERE key = ?",
+            (result['best_score'], result['validation_steps'], result['generations'], result['seconds'], time.time(),
+             config_key(config)))
+        self.connection.commit()
+
+    def record_failure(self, config, error):
+        self.connection.execute("UPDATE trials SET status = 'failed', error = ?, finished = ? WHERE key = ?",
+                                (error, time.time(), config_key(config)))
+        self.connection.commit()
+
+    # finished trials of an algorithm, the lowest held-out average steps first
+    def results(self, algorithm=None, limit=None):
+        query = ("SELECT config, best_score, validation_steps, generations, seconds FROM trials "
+                 "WHERE status = 'done'" + (" AND algorithm = ?" if algorithm else "") +
+                 " ORDER BY validation_steps, seconds" + (f" LIMIT {int(limit)}" if limit else ""))
+        rows = self.connection.execute(query, (algorithm,) if algorithm else ()).fetchall()
+        return [dict(json.loads(config), best_score=best_score, validation_steps=validation_steps,
+                     generations=generations, seconds=seconds)
+                for config, best_score, validation_steps, generations, seconds in rows]
+
+    def counts(self):
+        return dict(self.connection.execute("SELECT status, COUNT(*) FROM trials GROUP BY status").fetchall())
+
+    def close(self):
+        self.connection.close()
+
+
+# function to run one trial: the optimizer with the config's parameters on its map, then its best policy on the
+# held-out episodes. runs in a pool worker, the fitness itself evaluates in the worker's process
+def run_trial(config):
+    start = time.perf_counter()
+    env, desc = make_env(config['env_size'], config['map_seed'])
+    fitness = FrozenLakeFitness(env, desc, num_episodes=config['episodes'], fitness_mode=config['fitness_mode'],
+                                seed=config['seed'], cache_size=config['cache_size'])
+    try:
+        if config['algorithm'] == 'pso':
+            optimizer = make_pso(fitness, config['population'], config['seed'],
+                                 inertia_weight=config['inertia_weight'], cognitive_weight=config['cognitive_weight'],
+                                 social_weight=config['social_weight'])
+            optimizer.run(config['generations'])
+            best_position, best_score = optimizer.global_best_position, optimizer.global_best_score
+        else:
+            optimizer = make_ga(fitness, config['population'], config['seed'], mutation_rate=config['mutation_rate'])
+            optimizer.run(config['generations'])
+            best_position, best_score = optimizer.best_position, optimizer.best_score
+        seconds = time.perf_counter() - start
+
+        max_steps = env.spec.max_episode_steps
+        noise = common_noise_tape(VALIDATION_SEED, 0, max_steps, config['validation_episodes'])
+        policies = positions_to_policies(best_position, fitness.num_actions)
+        validation = simulate_batch(fitness.transitions, policies, config['validation_episodes'], max_steps=max_steps,
+                                    noise=noise)
+    finally:
+        fitness.close()
+    return {'best_score': float(best_score), 'validation_steps': float(validation.average_steps[0]),
+            'generations': optimizer.generation, 'seconds': seconds}
+
+
+# the failure of a trial as text, the trial is recorded as failed instead of stopping the sweep
+def _run_trial_safely(config):
+    try:
+        return run_trial(config), None
+    except Exception:
+        return None, traceback.format_exc()
+
+
+# function to build the trial configs of a sweep, every sampled parameter set once per seed
+def sweep_configs(algorithm, search, num_trials=20, levels=3, seeds=(42,), env_size=4, map_seed=42, generations=50,
+                  episodes=1000, validation_episodes=5000, fitness_mode='sample', cache_size=100000, sample_seed=0,
+                  ranges=PARAMETER_RANGES):
+    names = ALGORITHM_PARAMETERS[algorithm]
+    rng = np.random.default_rng(sample_seed)
+    if search == 'grid':
+        samples = grid_configs(names, levels, ranges)
+    elif search == 'random':
+        samples = random_configs(names, num_trials, rng, ranges)
+    elif search == 'lhs':
+        samples = latin_hypercube_configs(names, num_trials, rng, ranges)
+    else:
+        raise ValueError(f"unknown search {search!r}, use one of {SEARCHES}")
+
+    configs = []
+    seen = set()
+    for sample, seed in itertools.product(samples, seeds):
+        config = dict(sample, algorithm=algorithm, seed=seed, env_size=env_size, map_seed=map_seed,
+                      generations=generations, episodes=episodes, validation_episodes=validation_episodes,
+                      fitness_mode=fitness_mode, cache_size=cache_size)
+        key = config_key(config)
+        if key not in seen:
+            seen.add(key)
+            configs.append(config)
+    return configs
+
+
+# function to run the trials of configs that are not finished in the store yet, num_workers at a time.
+# every result is committed as soon as it arrives, so an interrupted sweep only loses the trials that were running
+def run_sweep(configs, store, num_workers=1, retry_failed=False, verbose=True):
+    store.add(configs)
+    pending = store.pending([config_key(config) for config in configs], retry_failed)
+    if verbose:
+        print(f"{len(configs)} configs, {len(configs) - len(pending)} already finished, {len(pending)} to run")
+
+    def finish(config, outcome, done):
+        result, error = outcome
+        if error is None:
+            store.record(config, result)
+        else:
+            store.record_failure(config, error)
+        if verbose:
+            status = (f"validation steps {result['validation_steps']:.3f} in {result['seconds']:.1f} s"
+                      if error is None else "failed: " + error.strip().splitlines()[-1])
+            params = ' '.join(f"{name}={config[name]}" for name in ALGORITHM_PARAMETERS[config['algorithm']])
+            print(f"[{done}/{len(pending)}] {config['algorithm']} seed={config['seed']} {params}  {status}")
+
+    if num_workers <= 1:
+        for done, config in enumerate(pending, 1):
+            finish(config, _run_trial_safely(config), done)
+        return len(pending)
+
+    pool = ProcessPoolExecutor(max_workers=num_workers)
+    try:
+        futures = {pool.submit(_run_trial_safely, config): config for config in pending}
+        for done, future in enumerate(as_completed(futures), 1):
+            finish(futures[future], future.result(), done)
+    except BaseException:
+        # the finished trials are already committed, the pending ones run again on the next start
+        pool.shutdown(wait=False, cancel_futures=True)
+        raise
+    pool.shutdown()
+    return len(pending)
+
+
+# the range override of --range NAME LOW HIGH
+def _parse_ranges(overrides):
+    ranges = dict(PARAMETER_RANGES)
+    for name, low, high in overrides or ():
+        if name not in ranges:
+            raise ValueError(f"unknown parameter {name!r}, use one of {tuple(ranges)}")
+        ranges[name] = (float(low), float(high))
+    return ranges
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Hyperparameter sweep of the FrozenLake PSO and GA.")
+    parser.add_argument('--algorithm', choices=tuple(ALGORITHM_PARAMETERS), default='pso')
+    parser.add_argument('--search', choices=SEARCHES, default='lhs')
+    parser.add_argument('--trials', type=int, default=20, help="configurations drawn by 'random' and 'lhs'")
+    parser.add_argument('--levels', type=int, default=3, help="values per parameter of the 'grid' search")
+    parser.add_argument('--range', nargs=3, action='append', metavar=('NAME', 'LOW', 'HIGH'),
+                        help="search NAME between LOW and HIGH instead of its default range, may be repeated")
+    parser.add_argument('--seeds', type=int, nargs='+', default=[42], help="optimizer seeds, every config runs once per seed")
+    parser.add_argument('--sample-seed', type=int, default=0, help="seed of the random and Latin hypercube draws")
+    parser.add_argument('--env-size', type=int, default=4, help="size of the square map")
+    parser.add_argument('--map-seed', type=int, default=42, help="seed of the map every trial runs on")
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--episodes', type=int, default=1000, help="episodes per fitness evaluation")
+    parser.add_argument('--validation-episodes', type=int, default=5000,
+                        help="held-out episodes every trial's best policy is scored on")
+    parser.add_argument('--fitness-mode', choices=['sample', 'exact'], default='sample')
+    parser.add_argument('--cache-size', type=int, default=100000, help="policies kept in each trial's fitness cache")
+    parser.add_argument('--workers', type=int, default=os.cpu_count(), help="trials run at once, one process each")
+    parser.add_argument('--db', default='sweep.db', help="SQLite file of the trials, reused to resume the sweep")
+    parser.add_argument('--retry-failed', action='store_true', help="run the trials that failed before again")
+    parser.add_argument('--top', type=int, default=10, help="best trials printed at the end")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    configs = sweep_configs(args.algorithm, args.search, args.trials, args.levels, args.seeds, args.env_size,
+                            args.map_seed, args.generations, args.episodes, args.validation_episodes, args.fitness_mode,
+                            args.cache_size, args.sample_seed, _parse_ranges(args.range))
+    store = SweepStore(args.db)
+    try:
+        start = time.perf_counter()
+        run_sweep(configs, store, args.workers, args.retry_failed)
+        print(f"Sweep finished in {time.perf_counter() - start:.1f} s, trials by status: {store.counts()}")
+
+        names = ALGORITHM_PARAMETERS[args.algorithm]
+        print(f"Best {args.algorithm} trials in {args.db}:")
+        for result in store.results(args.algorithm, args.top):
+            params = ' '.join(f"{name}={result[name]}" for name in names)
+            print(f"validation steps {result['validation_steps']:.3f}  best {result['best_score']:.3f}  "
+                  f"seed={result['seed']} {params}  {result['generations']} generations {result['seconds']:.1f} s")
+    finally:
+        store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,163 @@
+#Generic tabular envs on the shared tabular simulator. Any env with a gym style transition table
+#P[s][a] = [(prob, next_state, reward, done), ...] (the toy-text envs CliffWalking and Taxi, or a plain dict standing
+#in for one of our own simulators) is compiled by tabular_sim into dense arrays plus the initial state distribution,
+#and the episodes of a whole population are played by its batched step loop. This module only draws the start states
+#and turns the episodes into returns. The fitness is the negative mean return, so the optimizers minimise it like the
+#FrozenLake steps.
+#
+#python -m tabular_env --env Taxi-v3 --algorithm ga --population 100 --generations 50
+
+import argparse
+import time
+from collections import namedtuple
+
+import numpy as np
+
+from fitness_cache import PolicyCache
+from frozen_lake_sim import positions_to_policies
+from tabular_sim import compile_table, play_episodes
+
+# time limit of envs registered without one, CliffWalking has none
+DEFAULT_MAX_STEPS = 200
+
+# Per-policy statistics: mean undiscounted return, mean episode length and the fraction of episodes that ended
+# before the time limit
+ReturnStats = namedtuple('ReturnStats', ['mean_return', 'average_steps', 'terminated'])
+
+
+# function to compile a gym toy-text env, or any object with a P table and optionally an initial_state_distrib
+def compile_env(env):
+    unwrapped = getattr(env, 'unwrapped', env)
+    return compile_table(unwrapped.P, getattr(unwrapped, 'initial_state_distrib', None),
+                         getattr(unwrapped, 'start_state_index', 0))
+
+
+# function to play num_episodes of every policy together on a compiled model, returns the per-policy ReturnStats
+# noise is an optional (max_steps + 1 x num_episodes) tape of uniform draws replayed by every policy, row 0 picks the
+# start states and row t + 1 the outcome of step t, so all the policies face the same starts and slips
+def simulate_returns(model, policies, num_episodes, max_steps=DEFAULT_MAX_STEPS, rng=None, noise=None):
+    rng = np.random.default_rng() if rng is None else rng
+    policies = np.atleast_2d(policies)
+    num_policies, num_states = policies.shape
+
+    u = np.tile(noise[0], num_policies) if noise is not None else rng.random(num_policies * num_episodes)
+    starts = np.minimum(np.searchsorted(model.initial_cum_probs, u, side='right'), num_states - 1)
+    runs = play_episodes(model.next_states, model.cum_probs, model.dones, policies, starts, num_episodes, max_steps,
+                         rng, noise[1:] if noise is not None else None, rewards=model.rewards)
+
+    shape = (num_policies, num_episodes)
+    return ReturnStats(mean_return=runs.returns.reshape(shape).mean(axis=1),
+                       average_steps=runs.steps.reshape(shape).mean(axis=1),
+                       terminated=runs.terminated.reshape(shape).mean(axis=1))
+
+
+# function to find the best expected return within a time limit of horizon steps by backward induction. returns the
+# expected return from the initial distribution and the greedy policy of the first step, the best stationary guess
+def finite_horizon_optimum(model, horizon=DEFAULT_MAX_STEPS):
+    probs = np.diff(model.cum_probs, axis=2, prepend=0.0)
+    values = np.zeros(len(model.next_states))
+    q = np.zeros(model.next_states.shape[:2])
+    for _ in range(horizon):
+        q = np.sum(probs * (model.rewards + np.where(model.dones, 0.0, values[model.next_states])), axis=2)
+        values = q.max(axis=1)
+    initial_probs = np.diff(model.initial_cum_probs, prepend=0.0)
+    return float(initial_probs @ values), np.argmax(q, axis=1)
+
+
+class TabularFitness:
+    '''Population fitness of a compiled tabular env, the negative mean return, cached on the discretized policy.'''
+
+    def __init__(self, model, num_episodes=1000, max_steps=DEFAULT_MAX_STEPS, seed=42, cache_size=100000,
+                 common_random_numbers=False):
+        self.model = model
+        self.num_dimensions, self.num_actions = model.next_states.shape[:2]
+        self.num_episodes = num_episodes
+        self.max_steps = max_steps
+        self.seed = seed
+        # common_random_numbers makes every policy of one evaluation call replay the same starts and slips
+        self.common_random_numbers = common_random_numbers
+        self.call_index = 0
+        # a cache_size of 0 evaluates every policy, repeated or not
+        self.cache = PolicyCache(self.evaluate_policies, max_size=cache_size) if cache_size else None
+
+    # fitness of a gym toy-text env, its own time limit is used unless max_steps is given
+    @classmethod
+    def from_env(cls, env, num_episodes=1000, max_steps=None, seed=42, cache_size=100000, common_random_numbers=False):
+        if max_steps is None:
+            spec = getattr(env, 'spec', None)
+            max_steps = spec.max_episode_steps if spec is not None and spec.max_episode_steps else DEFAULT_MAX_STEPS
+        return cls(compile_env(env), num_episodes, max_steps, seed, cache_size, common_random_numbers)
+
+    # plays num_episodes of every policy, every call gets its own random stream spawned from the seed
+    def evaluate_policies(self, policies):
+        rng = np.random.default_rng(np.random.SeedSequence(self.seed, spawn_key=(self.call_index,)))
+        self.call_index += 1
+        noise = rng.random((self.max_steps + 1, self.num_episodes)) if self.common_random_numbers else None
+        return simulate_returns(self.model, policies, self.num_episodes, self.max_steps, rng, noise)
+
+    def population_fitness(self, positions):
+        policies = positions_to_policies(positions, self.num_actions)
+        return self.cache.evaluate(policies) if self.cache is not None else self.evaluate_policies(policies)
+
+    # the optimizers minimise the negative mean return
+    def __call__(self, positions):
+        return -self.population_fitness(positions).mean_return
+
+    def close(self):
+        pass
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Optimize policies of any gym toy-text env with PSO or a GA.")
+    parser.add_argument('--env', default='Taxi-v3', help="gym id of an env with a P transition table")
+    parser.add_argument('--algorithm', choices=('pso', 'ga'), default='ga')
+    parser.add_argument('--population', type=int, default=100)
+    parser.add_argument('--generations', type=int, default=50)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--episodes', type=int, default=1000, help="episodes per fitness evaluation")
+    parser.add_argument('--max-steps', type=int, help="episode time limit, the env's own limit by default")
+    parser.add_argument('--cache-size', type=int, default=100000, help="policies kept in the fitness cache, 0 disables it")
+    parser.add_argument('--crn', action='store_true',
+                        help="common random numbers, every policy of a generation replays the same starts and slips")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    import gym
+
+    from frozen_lake_openai import run_ga, run_pso
+
+    args = parse_args(argv)
+    env = gym.make(args.env)
+    start = time.perf_counter()
+    fitness = TabularFitness.from_env(env, num_episodes=args.episodes, max_steps=args.max_steps, seed=args.seed,
+                                      cache_size=args.cache_size, common_random_numbers=args.crn)
+    print(f"{args.env}: {fitness.num_dimensions} states, {fitness.num_actions} actions, "
+          f"compiled in {time.perf_counter() - start:.3f} s")
+
+    start = time.perf_counter()
+    if args.algorithm == 'pso':
+        optimizer = run_pso(fitness, args.population, args.generations, args.seed)
+        best_position, best_score = optimizer.global_best_position, optimizer.global_best_score
+    else:
+        optimizer = run_ga(fitness, args.population, args.generations, args.seed)
+        best_position, best_score = optimizer.best_position, optimizer.best_score
+    elapsed = time.perf_counter() - start
+
+    # the best policy and the optimum are both scored on the same fresh episodes
+    optimum, optimal_policy = finite_horizon_optimum(fitness.model, fitness.max_steps)
+    rng = np.random.default_rng(args.seed + 1)
+    noise = rng.random((fitness.max_steps + 1, 10 * args.episodes))
+    held_out = simulate_returns(fitness.model, np.stack([positions_to_policies(best_position, fitness.num_actions)[0],
+                                                         optimal_policy]), 10 * args.episodes, fitness.max_steps,
+                                noise=noise)
+    print(f"{args.algorithm.upper()} best return: {-best_score:.3f} after {optimizer.generation} generations "
+          f"in {elapsed:.2f} s")
+    print(f"{args.algorithm.upper()} held-out return: {held_out.mean_return[0]:.3f}, "
+          f"{held_out.terminated[0]:.1%} of the episodes finished")
+    print(f"Optimal expected return within {fitness.max_steps} steps: {optimum:.3f}, "
+          f"its greedy policy held-out: {held_out.mean_return[1]:.3f}")
+
+
+if __name__ == "__main__":
+    main()
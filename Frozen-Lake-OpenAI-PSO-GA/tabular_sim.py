@@ -0,0 +1,119 @@
+#Shared tabular simulator. A gym style transition table P[s][a] = [(prob, next_state, reward, done), ...] is compiled
+#once into dense (num_states x num_actions x num_outcomes) arrays and the episodes of a whole population are stepped
+#together as array operations on them, no env code runs in the loop. FrozenLake (frozen_lake_sim, large_map) and the
+#other toy-text envs (tabular_env) are backends that compile their table and read their statistics off the episodes.
+
+from collections import namedtuple
+
+import numpy as np
+
+from profiling import timers
+
+# Dense tables of a tabular env. next_states[s, a, k] is the k-th outcome of action a in state s, cum_probs[s, a, k]
+# its cumulative probability, rewards[s, a, k] and dones[s, a, k] the reward of the move and whether it ends the
+# episode. initial_cum_probs is the cumulative distribution of the start state
+TabularModel = namedtuple('TabularModel', ['next_states', 'cum_probs', 'rewards', 'dones', 'initial_cum_probs'])
+
+# Outcome of every run, flat arrays of num_policies * runs per policy: the state it ended in, the steps it took,
+# whether it ended before the time limit and its undiscounted return (None when no rewards were given)
+EpisodeArrays = namedtuple('EpisodeArrays', ['state', 'steps', 'terminated', 'returns'])
+
+
+# function to turn a transition dict P[s][a] = [(prob, next_state, reward, done), ...] into dense arrays
+# initial_distribution is the probability of starting in every state, the episodes start in start_state without one
+def compile_table(P, initial_distribution=None, start_state=0):
+    num_states = len(P)
+    num_actions = len(P[0])
+    max_outcomes = max(len(P[s][a]) for s in range(num_states) for a in range(num_actions))
+
+    next_states = np.zeros((num_states, num_actions, max_outcomes), dtype=np.int32)
+    cum_probs = np.ones((num_states, num_actions, max_outcomes))
+    rewards = np.zeros((num_states, num_actions, max_outcomes))
+    dones = np.zeros((num_states, num_actions, max_outcomes), dtype=bool)
+    for s in range(num_states):
+        for a in range(num_actions):
+            outcomes = P[s][a]
+            probs, states, outcome_rewards, outcome_dones = zip(*[outcome[:4] for outcome in outcomes])
+            # pad the unused outcomes with the last one so they can never be picked by mistake
+            padding = max_outcomes - len(outcomes)
+            next_states[s, a] = list(states) + [states[-1]] * padding
+            rewards[s, a] = list(outcome_rewards) + [outcome_rewards[-1]] * padding
+            dones[s, a] = list(outcome_dones) + [outcome_dones[-1]] * padding
+            cum_probs[s, a, :len(outcomes)] = np.cumsum(probs)
+    # guard against the cumulative sum ending slightly under 1 because of rounding
+    cum_probs[:, :, -1] = 1.0
+
+    if initial_distribution is None:
+        initial_distribution = np.zeros(num_states)
+        initial_distribution[start_state] = 1.0
+    initial_cum_probs = np.cumsum(initial_distribution, dtype=float)
+    initial_cum_probs[-1] = 1.0
+    return TabularModel(next_states=next_states, cum_probs=cum_probs, rewards=rewards, dones=dones,
+                        initial_cum_probs=initial_cum_probs)
+
+
+# function to play the runs of every policy together. policies is a (num_policies x num_policy_states) action table and
+# start_states the start of every run, runs_per_policy = len(start_states) / num_policies consecutive runs per policy.
+# a table with more states than the policies have, like a batch of maps, plays action policy[s % num_policy_states]
+# rng is either one generator shared by all the policies or a list with one generator per policy. with one generator
+# per policy the runs of a policy do not depend on which other policies are simulated in the same batch
+# noise is an optional (max_steps x num_episodes) tape of uniform draws replayed by every policy, step t of a run
+# uses noise[t, run % num_episodes] so all the policies face the same outcomes (common random numbers)
+# on_step(live, t, s, a, next_state) is called every step with the runs still going, before the ended ones are dropped
+def play_episodes(next_states, cum_probs, dones, policies, start_states, num_episodes, max_steps=100, rng=None,
+                  noise=None, rewards=None, on_step=None):
+    rng = np.random if rng is None else rng
+    per_policy_rng = isinstance(rng, (list, tuple))
+    policies = np.atleast_2d(policies)
+    num_policies, num_policy_states = policies.shape
+    num_outcomes = cum_probs.shape[2]
+    wrap_states = len(next_states) > num_policy_states
+
+    with timers.phase('env_reset'):
+        num_runs = len(start_states)
+        runs_per_policy = num_runs // num_policies
+        run_policy = np.repeat(np.arange(num_policies), runs_per_policy)
+        flat_policies = policies.ravel()
+        state = np.asarray(start_states, dtype=np.int32).copy()
+        steps = np.zeros(num_runs, dtype=np.int32)
+        terminated = np.zeros(num_runs, dtype=bool)
+        returns = np.zeros(num_runs) if rewards is not None else None
+        # runs of every policy that are still going, a per-policy generator only draws for those
+        live_counts = np.full(num_policies, runs_per_policy) if per_policy_rng else None
+
+    # indices of the runs that are still going
+    live = np.arange(num_runs)
+    for t in range(max_steps):
+        with timers.phase('env_step'):
+            s = state[live]
+            a = flat_policies[run_policy[live] * num_policy_states + (s % num_policy_states if wrap_states else s)]
+
+            # pick the outcome by comparing one uniform draw against the cumulative probabilities
+            if noise is not None:
+                u = noise[t, live % num_episodes]
+            elif per_policy_rng:
+                # live stays sorted so the running episodes of a policy are contiguous, each generator draws for
+                # them in episode order
+                u = np.concatenate([rng[p].random(live_counts[p]) for p in np.flatnonzero(live_counts)])
+            else:
+                u = rng.random(live.size)
+            k = np.minimum((u[:, None] >= cum_probs[s, a]).sum(axis=1), num_outcomes - 1)
+            next_state = next_states[s, a, k]
+
+            state[live] = next_state
+            steps[live] += 1
+            if returns is not None:
+                returns[live] += rewards[s, a, k]
+
+        with timers.phase('done_check'):
+            done = dones[s, a, k]
+            terminated[live[done]] = True
+            if on_step is not None:
+                on_step(live, t, s, a, next_state)
+            if per_policy_rng:
+                live_counts -= np.bincount(run_policy[live[done]], minlength=num_policies)
+            live = live[~done]
+        if live.size == 0:
+            break
+
+    return EpisodeArrays(state=state, steps=steps, terminated=terminated, returns=returns)
@@ -0,0 +1,63 @@
+#Tests of checkpoint and resume: a run saved part way through and resumed from the file must end exactly where the
+#uninterrupted run ends, with the evaluation cache and random streams restored.
+#
+#python -m pytest test_checkpoint.py
+
+import numpy as np
+import pytest
+
+from checkpoint import load_checkpoint, save_checkpoint
+from frozen_lake_openai import FrozenLakeFitness, make_env, run_ga, run_pso
+
+RUNNERS = {'PSO': run_pso, 'GA': run_ga}
+
+
+# every entry of two state dicts, nested one level for the sections of the fitness state, is identical
+def _assert_same_state(actual, expected):
+    assert actual.keys() == expected.keys()
+    for key, value in expected.items():
+        if isinstance(value, dict):
+            _assert_same_state(actual[key], value)
+        else:
+            np.testing.assert_array_equal(actual[key], value, err_msg=key)
+
+
+def _make_fitness(common_random_numbers):
+    env, desc = make_env(4, 42)
+    return FrozenLakeFitness(env, desc, num_episodes=32, num_workers=2,
+                             common_random_numbers=common_random_numbers)
+
+
+@pytest.mark.parametrize('name', sorted(RUNNERS))
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_resumed_run_matches_uninterrupted_run(name, common_random_numbers, tmp_path):
+    run = RUNNERS[name]
+    fitness = _make_fitness(common_random_numbers)
+    try:
+        full = run(fitness, 20, num_generations=12, patience=1000)
+        full_state = fitness.state_dict()
+    finally:
+        fitness.close()
+
+    path = str(tmp_path / 'run.npz')
+    fitness = _make_fitness(common_random_numbers)
+    try:
+        optimizer = run(fitness, 20, num_generations=5, patience=1000)
+        state = fitness.state_dict()
+        state[name] = optimizer.state_dict()
+        save_checkpoint(path, state)
+    finally:
+        fitness.close()
+
+    checkpoint = load_checkpoint(path)
+    fitness = _make_fitness(common_random_numbers)
+    try:
+        fitness.load_state_dict(checkpoint)
+        resumed = run(fitness, 20, num_generations=12, patience=1000, state=checkpoint[name])
+        resumed_state = fitness.state_dict()
+    finally:
+        fitness.close()
+
+    assert resumed.generation == full.generation == 12
+    _assert_same_state(resumed.state_dict(), full.state_dict())
+    _assert_same_state(resumed_state, full_state)
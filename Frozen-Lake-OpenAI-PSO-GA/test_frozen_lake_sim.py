@@ -0,0 +1,35 @@
+#Tests of the vectorized simulator against the exact time-limited solve of the same policies.
+#
+#python -m pytest test_frozen_lake_sim.py
+
+import numpy as np
+import pytest
+
+from frozen_lake_openai import FrozenLakeFitness, make_env
+from frozen_lake_sim import build_transitions, simulate_batch
+
+
+@pytest.fixture(scope='module')
+def slippery_env():
+    return make_env(8, 42)
+
+
+# the sampled average steps converge to the exact expected steps within the time limit
+def test_sampled_steps_match_exact_steps(slippery_env):
+    env, desc = slippery_env
+    exact = FrozenLakeFitness(env, desc, num_episodes=1, fitness_mode='exact', cache_size=0)
+    policies = np.random.default_rng(0).integers(0, 4, size=(6, 64), dtype=np.uint8)
+    sampled = simulate_batch(build_transitions(env), policies, 20000, max_steps=exact.max_steps,
+                             rng=np.random.default_rng(1)).average_steps
+    np.testing.assert_allclose(exact(policies), sampled, rtol=0.02)
+
+
+# a policy that never leaves the start is cut off at the time limit in both modes instead of scoring inf
+def test_exact_mode_caps_trapped_policies():
+    env, desc = make_env(4, 42, is_slippery=False)
+    exact = FrozenLakeFitness(env, desc, num_episodes=10, fitness_mode='exact', cache_size=0)
+    sample = FrozenLakeFitness(env, desc, num_episodes=10, cache_size=0)
+    # Left on the left column and Up on the top row never move
+    trapped = np.zeros((1, 16))
+    assert exact(trapped)[0] == pytest.approx(exact.max_steps)
+    assert sample(trapped)[0] == exact.max_steps
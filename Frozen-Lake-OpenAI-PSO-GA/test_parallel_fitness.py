@@ -0,0 +1,52 @@
+#Tests of the parallel fitness evaluation: the results must not depend on the number of worker processes and the
+#common random number rounds must replay fresh episodes.
+#
+#python -m pytest test_parallel_fitness.py
+
+import numpy as np
+import pytest
+
+from frozen_lake_openai import FrozenLakeFitness, make_env
+from parallel_fitness import common_noise_tape
+from racing import round_schedule
+
+
+# fitness of the same policies over two evaluation calls, with num_workers processes
+def _fitness_values(env, desc, num_workers, common_random_numbers, racing_rounds=0):
+    fitness = FrozenLakeFitness(env, desc, num_episodes=64, num_workers=num_workers, cache_size=0,
+                                common_random_numbers=common_random_numbers, racing_rounds=racing_rounds)
+    try:
+        policies = np.random.default_rng(3).integers(0, 4, size=(8, fitness.num_dimensions)).astype(float)
+        return np.stack([fitness(policies), fitness(policies[::-1])])
+    finally:
+        fitness.close()
+
+
+@pytest.mark.parametrize('is_slippery', [False, True])
+@pytest.mark.parametrize('common_random_numbers', [False, True])
+def test_results_do_not_depend_on_worker_count(is_slippery, common_random_numbers):
+    env, desc = make_env(4, 42, is_slippery=is_slippery)
+    single = _fitness_values(env, desc, 1, common_random_numbers)
+    pooled = _fitness_values(env, desc, 2, common_random_numbers)
+    np.testing.assert_array_equal(single, pooled)
+
+
+def test_racing_does_not_depend_on_worker_count():
+    env, desc = make_env(4, 42)
+    single = _fitness_values(env, desc, 1, True, racing_rounds=3)
+    pooled = _fitness_values(env, desc, 2, True, racing_rounds=3)
+    np.testing.assert_array_equal(single, pooled)
+
+
+# a wider tape only appends episodes, so the rounds of a racing call replay fresh columns of one tape
+def test_noise_tape_columns_do_not_depend_on_width():
+    narrow = common_noise_tape(42, 7, 100, 16)
+    wide = common_noise_tape(42, 7, 100, 64)
+    np.testing.assert_array_equal(narrow, wide[:, :16])
+
+
+def test_racing_rounds_play_fresh_noise():
+    ends = round_schedule(64, 3)
+    rounds = [common_noise_tape(42, 0, 100, end)[:, start:] for start, end in zip([0] + ends[:-1], ends)]
+    seen = np.concatenate([noise.ravel() for noise in rounds])
+    assert len(np.unique(seen)) == len(seen) == 100 * 64
@@ -0,0 +1,29 @@
+#Tests of the reference solvers: Q-learning must keep the greedy policy that is best under the chosen objective, not
+#the one with the fewest sampled steps, which on the slippery map is one that falls in a hole quickly.
+#
+#python -m pytest test_reference_solvers.py
+
+import numpy as np
+import pytest
+
+from frozen_lake_openai import FrozenLakeFitness, make_env
+from reference_solvers import QLearning, horizon_policy_costs
+
+
+@pytest.mark.parametrize('objective', ['steps', 'goal'])
+def test_qlearning_keeps_the_best_policy_under_the_objective(objective):
+    env, desc = make_env(4, 42)
+    fitness = FrozenLakeFitness(env, desc, num_episodes=50, cache_size=0)
+    solver = QLearning(fitness, fitness.transitions, num_agents=50, max_steps=fitness.max_steps, objective=objective,
+                       patience=1000, rng=np.random.default_rng(0))
+    greedy_costs = []
+
+    # exact cost of the greedy policy of every generation
+    def record(solver):
+        greedy = np.argmin(solver.q, axis=1)[None]
+        greedy_costs.append(horizon_policy_costs(fitness.transitions, greedy, fitness.max_steps, objective)[0])
+
+    solver.run(30, record)
+    best_cost = horizon_policy_costs(fitness.transitions, solver.best_position[None], fitness.max_steps, objective)[0]
+    assert best_cost == pytest.approx(min(greedy_costs))
+    assert solver.best_cost == pytest.approx(best_cost)
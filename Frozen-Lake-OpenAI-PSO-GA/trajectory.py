@@ -0,0 +1,79 @@
+#Step by step recording of played episodes. Every step is one row of five fixed size columns (episode id, step, state,
+#action, outcome) kept in memory or in memory-mapped .npy files, so a long recording never grows a Python list.
+#Once the capacity is reached the oldest rows are overwritten.
+
+import json
+import os
+
+import numpy as np
+
+# outcome of a step
+RUNNING = 0
+FELL = 1
+GOAL = 2
+TIMEOUT = 3
+
+COLUMN_TYPES = {'episode': np.int64, 'step': np.int32, 'state': np.int32, 'action': np.uint8, 'outcome': np.uint8}
+
+
+class TrajectoryRecorder:
+    '''Columnar ring buffer of episode steps, memory-mapped to directory/<column>.npy when a directory is given.'''
+
+    def __init__(self, capacity=1000000, directory=None):
+        self.capacity = capacity
+        self.directory = directory
+        if directory is None:
+            self.columns = {name: np.zeros(capacity, dtype=dtype) for name, dtype in COLUMN_TYPES.items()}
+        else:
+            os.makedirs(directory, exist_ok=True)
+            self.columns = {name: np.lib.format.open_memmap(os.path.join(directory, f'{name}.npy'), mode='w+',
+                                                            dtype=dtype, shape=(capacity,))
+                            for name, dtype in COLUMN_TYPES.items()}
+        # rows recorded so far, including the overwritten ones, and the id of the next episode
+        self.size = 0
+        self.next_episode = 0
+
+    # ids for num_episodes new episodes, the simulator numbers its episodes from the returned first id
+    def new_episodes(self, num_episodes):
+        first = self.next_episode
+        self.next_episode += num_episodes
+        return first
+
+    # records one step of every live episode. fell, reached_goal and timed_out tell how the step ended
+    def record_step(self, episodes, step, states, actions, fell, reached_goal, timed_out=False):
+        outcomes = np.where(fell, FELL, np.where(reached_goal, GOAL, TIMEOUT if timed_out else RUNNING))
+        rows = {'episode': episodes, 'step': np.broadcast_to(step, np.shape(episodes)), 'state': states,
+                'action': actions, 'outcome': outcomes}
+        num_rows = len(episodes)
+        if num_rows > self.capacity:
+            # only the newest rows fit
+            rows = {name: values[-self.capacity:] for name, values in rows.items()}
+            self.size += num_rows - self.capacity
+            num_rows = self.capacity
+        slots = (self.size + np.arange(num_rows)) % self.capacity
+        for name, values in rows.items():
+            self.columns[name][slots] = values
+        self.size += num_rows
+
+    # the recorded rows of a column that were not overwritten, oldest first
+    def column(self, name):
+        buffer = self.columns[name]
+        if self.size <= self.capacity:
+            return np.asarray(buffer[:self.size])
+        slot = self.size % self.capacity
+        return np.concatenate((buffer[slot:], buffer[:slot]))
+
+    # writes the memory-mapped columns to disk with a meta.json telling how many rows are valid
+    def flush(self):
+        if self.directory is None:
+            return
+        for buffer in self.columns.values():
+            buffer.flush()
+        with open(os.path.join(self.directory, 'meta.json'), 'w') as f:
+            json.dump({'capacity': self.capacity, 'size': self.size, 'episodes': self.next_episode}, f)
+
+    def summary(self):
+        outcomes = self.column('outcome')
+        return {'rows': self.size, 'kept': min(self.size, self.capacity), 'episodes': self.next_episode,
+                'falls': int(np.sum(outcomes == FELL)), 'goals': int(np.sum(outcomes == GOAL)),
+                'timeouts': int(np.sum(outcomes == TIMEOUT))}
@@ -0,0 +1,341 @@
+'''Blender independent geometry of the creature. Every part is returned as a MeshData of a vertex array and a face index
+array, built with NumPy only, so the shapes can be generated, checked and timed without Blender. fill_mesh loads a
+MeshData into anything with the bpy mesh foreach_set API: a bpy.types.Mesh inside Blender or the InMemoryMesh stand-in
+on a plain Python install.
+
+Run it directly to benchmark the default creature headless: python creature_geometry.py --repeats 5'''
+
+import argparse
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+
+import numpy as np
+
+'''Vertices (num_verts x 3 float) and faces (num_faces x verts_per_face int) of one mesh.'''
+MeshData = namedtuple('MeshData', ['vertices', 'faces'])
+
+'''Most templates kept at once. The body, neck and tail share one ring layout at their default resolution, so a
+creature needs only a handful.'''
+MAX_TEMPLATES = 64
+
+
+class TemplateCache:
+    '''Bounded LRU store of read-only arrays that only depend on the resolution of a part, built once per key.'''
+
+    def __init__(self, max_size=MAX_TEMPLATES):
+        self.max_size = max_size
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    # the template of key, built by build() on the first request. the arrays are shared so they are made read-only
+    def get(self, key, build):
+        entry = self.entries.get(key)
+        if entry is not None:
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return entry
+        self.misses += 1
+        entry = build()
+        for array in (entry if isinstance(entry, tuple) else (entry,)):
+            array.setflags(write=False)
+        self.entries[key] = entry
+        if len(self.entries) > self.max_size:
+            self.entries.popitem(last=False)
+            self.evictions += 1
+        return entry
+
+    def clear(self):
+        self.entries.clear()
+
+    def summary(self):
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.entries)}
+
+
+'''Templates shared by every generator of this module.'''
+templates = TemplateCache()
+
+def _build_unit_circle(num_verts):
+    angles = 2 * np.pi * np.arange(num_verts) / num_verts
+    return np.cos(angles), np.sin(angles)
+
+'''Unit circle of num_verts points, the cos and sin of 2 pi i / num_verts, computed once per num_verts.'''
+def unit_circle(num_verts):
+    return templates.get(('circle', num_verts), lambda: _build_unit_circle(num_verts))
+
+'''Vertex coordinates of a whole tube at once. Ring k is centered at centers[k] with radius radii[k]. plane 'yz' lays
+the rings across the X axis like the body, neck and tail, 'xy' across the Z axis like the legs. The rows come out ring
+by ring.'''
+def tube_ring_coords(centers, radii, num_verts=100, plane='yz'):
+    cos_table, sin_table = unit_circle(num_verts)
+    centers = np.asarray(centers, dtype=np.float64)
+    radii = np.asarray(radii, dtype=np.float64)[:, None]
+    # axis along the tube and the two axes the circle is drawn on
+    axis, cos_axis, sin_axis = (0, 1, 2) if plane == 'yz' else (2, 0, 1)
+    coords = np.empty((len(centers), num_verts, 3))
+    coords[:, :, axis] = centers[:, axis, None]
+    coords[:, :, cos_axis] = centers[:, cos_axis, None] + radii * cos_table
+    coords[:, :, sin_axis] = centers[:, sin_axis, None] + radii * sin_table
+    return coords.reshape(-1, 3)
+
+def _build_tube_triangles(num_rings, num_verts):
+    ring_start = np.arange(num_rings - 1)[:, None] * num_verts
+    i = np.arange(num_verts)
+    v1 = ring_start + i
+    v2 = ring_start + (i + 1) % num_verts
+    v3 = v1 + num_verts
+    v4 = v2 + num_verts
+    triangles = np.stack([np.stack([v1, v2, v3], axis=-1), np.stack([v2, v3, v4], axis=-1)], axis=2)
+    return triangles.reshape(-1, 3).astype(np.int32)
+
+'''Triangle indices of a tube of num_rings rings of num_verts vertices, two triangles per quad between neighbouring rings,
+[v1, v2, v3] then [v2, v3, v4]. Built once per (num_rings, num_verts) and shared read-only.'''
+def tube_triangles(num_rings, num_verts=100):
+    return templates.get(('tube', num_rings, num_verts), lambda: _build_tube_triangles(num_rings, num_verts))
+
+'''A tube through the given ring centers and radii.'''
+def tube_geometry(centers, radii, num_verts=100, plane='yz'):
+    return MeshData(tube_ring_coords(centers, radii, num_verts, plane), tube_triangles(len(centers), num_verts))
+
+'''Ring centers and radii of the body. The radius swells from start_radius to max_radius in the middle and the centers
+wave sideways along the Y axis, one ring every 0.1 along X.'''
+def body_rings(length, start_radius, max_radius, wave_amplitude, wave_frequency, step_size=0.1):
+    steps = int(length / step_size)
+    i = np.arange(steps + 1)
+    radii = start_radius + (max_radius - start_radius) * np.abs(np.sin(np.pi * i / steps))
+    wave_y = wave_amplitude * np.sin(i / wave_frequency * 2 * np.pi)
+    centers = np.stack([i * step_size, wave_y, np.zeros(steps + 1)], axis=1)
+    return centers, radii
+
+'''Ring centers and radii of the tail, going back along -X from start_center and narrowing to tip_radius.'''
+def tail_rings(start_center, start_radius, length, tip_radius, wave_amplitude, wave_frequency, num_verts=100):
+    steps = num_verts
+    step_size = length / steps
+    i = np.arange(steps + 1)
+    radii = start_radius - (start_radius - tip_radius) * (i / steps)
+    wave_x = wave_amplitude * np.sin(i / wave_frequency * 2 * np.pi)
+    centers = np.stack([start_center[0] - i * step_size, start_center[1] + wave_x,
+                        np.full(steps + 1, float(start_center[2]))], axis=1)
+    return centers, radii
+
+'''Ring centers and radii of the neck, going forward along X from start_center and waving once along Z.'''
+def neck_rings(start_center, start_radius, length, end_radius, wave_amplitude=0.3, num_verts=100):
+    steps = num_verts
+    step_size = length / steps
+    i = np.arange(steps + 1)
+    radii = start_radius + (end_radius - start_radius) * (i / steps)
+    wave_offset = wave_amplitude * np.sin(i / steps * np.pi * 2)
+    centers = np.stack([start_center[0] + i * step_size, np.full(steps + 1, float(start_center[1])),
+                        start_center[2] + wave_offset], axis=1)
+    return centers, radii
+
+'''A leg of segments rings going up the Z axis in three parts, thigh, shin and foot, each bent by its own factor.'''
+def leg_geometry(thigh_height, shin_height, foot_height, thigh_radius, shin_radius, foot_radius, segments=100,
+                 num_verts=100, thigh_bend=-0.5, shin_bend=-0.1, foot_bend=0.5):
+    i = np.arange(segments)
+    thigh = i < segments / 3
+    shin = ~thigh & (i < 2 * segments / 3)
+    radii = np.where(thigh, thigh_radius - (i / segments) * (thigh_radius - shin_radius),
+                     np.where(shin, shin_radius - ((i - segments / 3) / segments) * (shin_radius - foot_radius),
+                              foot_radius))
+    heights = np.where(thigh, (i / segments) * thigh_height,
+                       np.where(shin, thigh_height + ((i - segments / 3) / segments) * shin_height,
+                                thigh_height + shin_height + ((i - 2 * segments / 3) / segments) * foot_height))
+    # the center of every ring is shifted along X in proportion to its height
+    bends = np.where(thigh, thigh_bend, np.where(shin, shin_bend, foot_bend))
+    centers = np.stack([bends * heights, np.zeros(segments), heights], axis=1)
+    return tube_geometry(centers, radii, num_verts, plane='xy')
+
+# the layout of a head resolution: per vertex its ring, the cos and sin of its angle and the cos and sin of the
+# polar angle of its ring, plus the quads
+def _build_head_template(num_segments, num_rings):
+    i = np.arange(num_rings + 1)
+    z_angle = np.pi * i / num_rings
+    sizes = np.where(i < num_rings * 0.25, num_segments, int(num_segments * 1.5))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+
+    # vertex j of every ring, flattened ring by ring
+    ring = np.repeat(i, sizes)
+    j = np.arange(sizes.sum()) - starts[ring]
+    angle = 2 * np.pi * j / num_segments
+
+    # quad k between ring p and ring p + 1, over the segments of ring p
+    pair = np.repeat(i[:-1], sizes[:-1])
+    k = np.arange(sizes[:-1].sum()) - starts[pair]
+    upper_size, lower_size = sizes[pair], sizes[pair + 1]
+    faces = np.stack([starts[pair] + k, starts[pair] + (k + 1) % upper_size,
+                      starts[pair + 1] + (k + 1) % lower_size, starts[pair + 1] + k], axis=1).astype(np.int32)
+    return np.cos(angle), np.sin(angle), np.cos(z_angle)[ring], np.sin(z_angle)[ring], faces
+
+'''The head, an ellipsoid of num_rings + 1 rings from the top to the bottom joined by quads. The rings below the top
+quarter have 1.5 times the segments, going on around the circle past the full turn, which rounds the head. Neighbouring
+rings are joined over the segments of the upper ring. The layout is built once per resolution, only the radii and
+the center are applied here.'''
+def head_geometry(center, radii, num_segments=200, num_rings=100):
+    cos_angle, sin_angle, cos_z, sin_z, faces = templates.get(
+        ('head', num_segments, num_rings), lambda: _build_head_template(num_segments, num_rings))
+    vertices = np.empty((len(cos_angle), 3))
+    vertices[:, 0] = center[0] + radii[0] * cos_angle
+    vertices[:, 1] = center[1] + (sin_z * radii[1]) * sin_angle * 1.2  # Adjust this factor for desired roundness
+    vertices[:, 2] = center[2] + cos_z * radii[2]
+    return MeshData(vertices, faces)
+
+'''A wing, a num_verts x num_verts_w sheet of quads that widens from start_width to end_width along X, zigzags along Z
+and bulges along Y.'''
+def wing_geometry(wing_length, start_width, end_width, num_verts=20, num_verts_w=10):
+    i = np.arange(num_verts)[:, None]
+    j = np.arange(num_verts_w)[None, :]
+    width = start_width + (end_width - start_width) * (i / num_verts)
+    x = np.broadcast_to((wing_length / num_verts) * i, (num_verts, num_verts_w))
+    z = (width / num_verts_w) * j * np.where(j % 2 == 0, -1, 1)  # Zigzag pattern
+    # Apply a sine function to the y-coordinate to create irregularities
+    y = (width / 2) * np.sin((i / num_verts) * np.pi) * np.cos((j / num_verts_w) * np.pi)
+    vertices = np.stack([x, y, z], axis=-1).reshape(-1, 3)
+    faces = templates.get(('wing', num_verts, num_verts_w), lambda: _build_grid_quads(num_verts, num_verts_w))
+    return MeshData(vertices, faces)
+
+# quads of a rows x columns sheet of vertices numbered row by row
+def _build_grid_quads(rows, columns):
+    v1 = (np.arange(rows - 1)[:, None] * columns + np.arange(columns - 1)[None, :]).ravel()
+    return np.stack([v1, v1 + 1, v1 + columns + 1, v1 + columns], axis=1).astype(np.int32)
+
+'''Load a MeshData into an empty mesh in one go with foreach_set. Every face has the same number of corners.
+set_loop_total is False on Blender 4 and later, where loop_total is derived from loop_start.'''
+def fill_mesh(mesh, data, set_loop_total=True):
+    vertices = np.ascontiguousarray(data.vertices, dtype=np.float32)
+    faces = np.ascontiguousarray(data.faces, dtype=np.int32)
+    num_faces, corners = faces.shape
+
+    mesh.vertices.add(len(vertices))
+    mesh.vertices.foreach_set("co", vertices.ravel())
+    mesh.loops.add(corners * num_faces)
+    mesh.loops.foreach_set("vertex_index", faces.ravel())
+    mesh.polygons.add(num_faces)
+    mesh.polygons.foreach_set("loop_start", np.arange(0, corners * num_faces, corners, dtype=np.int32))
+    if set_loop_total:
+        mesh.polygons.foreach_set("loop_total", np.full(num_faces, corners, dtype=np.int32))
+    # the edges are derived from the faces
+    mesh.update(calc_edges=True)
+    mesh.validate()
+    return mesh
+
+
+class _Collection:
+    '''Flat per-element attribute arrays with the add and foreach_set/foreach_get calls of a bpy mesh collection.'''
+
+    def __init__(self, **fields):
+        # name -> (dtype, values per element)
+        self.fields = fields
+        self.arrays = {name: np.zeros((0, width), dtype=dtype) for name, (dtype, width) in fields.items()}
+
+    def __len__(self):
+        return len(next(iter(self.arrays.values())))
+
+    def add(self, count):
+        for name, (dtype, width) in self.fields.items():
+            self.arrays[name] = np.concatenate([self.arrays[name], np.zeros((count, width), dtype=dtype)])
+
+    def foreach_set(self, name, values):
+        array = self.arrays[name]
+        array[:] = np.asarray(values, dtype=array.dtype).reshape(array.shape)
+
+    def foreach_get(self, name, values):
+        values[:] = self.arrays[name].ravel()
+
+
+class InMemoryMesh:
+    '''Stand-in for bpy.types.Mesh holding vertices, loops, polygons and edges in NumPy arrays, for headless use.'''
+
+    def __init__(self, name="Mesh"):
+        self.name = name
+        self.clear_geometry()
+
+    # removes every vertex, face and edge but keeps the mesh itself, like bpy.types.Mesh.clear_geometry
+    def clear_geometry(self):
+        self.vertices = _Collection(co=(np.float32, 3))
+        self.loops = _Collection(vertex_index=(np.int32, 1))
+        self.polygons = _Collection(loop_start=(np.int32, 1), loop_total=(np.int32, 1))
+        self.edges = np.zeros((0, 2), dtype=np.int32)
+
+    # the polygons as lists of vertex indices
+    def polygon_vertices(self):
+        loop_vertices = self.loops.arrays['vertex_index'].ravel()
+        starts = self.polygons.arrays['loop_start'].ravel()
+        totals = self.polygons.arrays['loop_total'].ravel()
+        return [loop_vertices[start:start + total] for start, total in zip(starts, totals)]
+
+    # the unique edges of the polygons, as bpy derives them
+    def update(self, calc_edges=False):
+        if not calc_edges:
+            return
+        loop_vertices = self.loops.arrays['vertex_index'].ravel()
+        starts = self.polygons.arrays['loop_start'].ravel()
+        totals = self.polygons.arrays['loop_total'].ravel()
+        polygon = np.repeat(np.arange(len(starts)), totals)
+        corner = np.arange(len(polygon)) - np.repeat(starts, totals)
+        following = starts[polygon] + (corner + 1) % totals[polygon]
+        edges = np.sort(np.stack([loop_vertices[starts[polygon] + corner], loop_vertices[following]], axis=1), axis=1)
+        # one int64 key per edge, a 1-d unique is much faster than a row-wise one
+        num_vertices = len(self.vertices)
+        keys = np.unique(edges[:, 0].astype(np.int64) * num_vertices + edges[:, 1])
+        self.edges = np.stack(np.divmod(keys, num_vertices), axis=1).astype(np.int32)
+
+    # raises on faces that point at missing vertices, returns False like bpy when nothing had to be fixed
+    def validate(self):
+        loop_vertices = self.loops.arrays['vertex_index']
+        if len(loop_vertices) and (loop_vertices.min() < 0 or loop_vertices.max() >= len(self.vertices)):
+            raise ValueError(f"mesh {self.name!r} has faces on vertices it does not have")
+        return False
+
+    # digest of the geometry and topology, for comparing the output of two versions of the generators
+    def digest(self):
+        h = hashlib.sha1()
+        h.update(np.round(self.vertices.arrays['co'], 5).tobytes())
+        h.update(self.loops.arrays['vertex_index'].tobytes())
+        h.update(self.polygons.arrays['loop_start'].tobytes())
+        return h.hexdigest()[:12]
+
+
+'''The parts of the default creature of the add-on, body, neck, tail, four legs, the head and two wings.'''
+def default_creature():
+    body_centers, body_radii = body_rings(10.0, 0.5, 1.5, 0.3, 50)
+    top_radius = float(body_radii[-1])
+    parts = {'body': tube_geometry(body_centers, body_radii, 100),
+             'neck': tube_geometry(*neck_rings((10.0, 0, 0), top_radius, 3.5, 0.2, 0.1, 100), 100),
+             'tail': tube_geometry(*tail_rings((0, 0, 0), top_radius, 5.0, 0.01, 0.2, 50, 100), 100)}
+    for leg in range(4):
+        parts[f'leg_{leg + 1}'] = leg_geometry(1.5, 5.0, 0.5, 0.2, 0.2, 0.1)
+    parts['head'] = head_geometry((0, 0, 0), (1.0, 1.0, 1.0))
+    for wing in range(2):
+        parts[f'wing_{wing + 1}'] = wing_geometry(10.0, 2.0, 1.0)
+    return parts
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the creature geometry headless on in-memory meshes.")
+    parser.add_argument('--repeats', type=int, default=5, help="generations timed, the best is kept")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    best_geometry = best_fill = float('inf')
+    for _ in range(args.repeats):
+        start = time.perf_counter()
+        parts = default_creature()
+        best_geometry = min(best_geometry, time.perf_counter() - start)
+        start = time.perf_counter()
+        meshes = {name: fill_mesh(InMemoryMesh(name), data) for name, data in parts.items()}
+        best_fill = min(best_fill, time.perf_counter() - start)
+
+    for name, mesh in meshes.items():
+        print(f"{name:<8} {len(mesh.vertices):>7} verts {len(mesh.polygons):>7} faces {len(mesh.edges):>7} edges  "
+              f"{mesh.digest()}")
+    print(f"geometry {best_geometry * 1000:.2f} ms, mesh fill {best_fill * 1000:.2f} ms (best of {args.repeats})")
+    print("templates:", templates.summary())
+
+
+if __name__ == "__main__":
+    main()
@@ -1,141 +1,63 @@
 import bpy
-import bmesh
 from math import cos, sin, pi, radians, sqrt, acos, atan2
+import json
 import math
 from mathutils import Matrix, Vector, Euler
 import os
+import sys
+
+# Blender does not put the folder of a script run from the text editor on the import path
+_script_dir = os.path.dirname(os.path.abspath(__file__))
+if _script_dir not in sys.path:
+    sys.path.append(_script_dir)
+
+from creature_geometry import (body_rings, fill_mesh, head_geometry, leg_geometry, neck_rings, tail_rings,
+                               tube_geometry, wing_geometry)
+
+'''Commit the vertex and face arrays of a part to a bpy mesh in one go. The geometry itself is computed by
+creature_geometry without Blender, this only loads it with foreach_set.'''
+def mesh_from_arrays(mesh, data):
+    # loop_total is derived from loop_start in Blender 4 and has to be given in older versions
+    set_loop_total = not bpy.types.MeshPolygon.bl_rna.properties["loop_total"].is_readonly
+    return fill_mesh(mesh, data, set_loop_total)
+
+'''Custom property of a part object holding the inputs its geometry was last built from.'''
+PART_INPUTS_KEY = "creature_inputs"
+
+'''Get the object of a part with up to date geometry. The geometry depends only on inputs, which include the values the
+part takes from the parts it is attached to, so a part is rebuilt only when one of them changed since its last build
+or when the part does not exist yet. The existing mesh datablock is cleared and refilled in place, so regenerating
+leaves no orphan meshes behind. The inputs are kept on the object itself, which keeps them right across undo.'''
+def update_part(name, mesh_name, inputs, build_geometry):
+    signature = json.dumps(inputs)
+    obj = bpy.data.objects.get(name)
+    if obj is None or obj.type != 'MESH':
+        obj = bpy.data.objects.new(name, bpy.data.meshes.new(mesh_name))
+    if not obj.users_collection:
+        bpy.context.collection.objects.link(obj)
+
+    if obj.get(PART_INPUTS_KEY) != signature:
+        obj.data.clear_geometry()
+        mesh_from_arrays(obj.data, build_geometry())
+        obj[PART_INPUTS_KEY] = signature
+    return obj
 
-'''Generate a series of rings for the triangles to connect. The main anchor for the mesh generation.'''
-
-def create_ring(bm, center, radius, num_verts=100):
-    verts = []
-    #Loop to generate a series of connection points for the triangles.
-    for i in range(num_verts):
-        angle = 2 * pi * i / num_verts
-        #Location where the rings are generated
-        y = center[1] + radius * cos(angle)
-        z = center[2] + radius * sin(angle)
-        x = center[0]
-        vert = bm.verts.new((x, y, z))
-        verts.append(vert)
-    return verts
-
-''' Generate a series for rings for the legs as it requires different set of parameters for the leg generation'''
-def create_leg_ring(bm, center, radius, num_verts=100):
-    verts = []
-    #Loop to generate a series of connection points for the triangles.
-    for i in range(num_verts):
-        angle = 2 * pi * i / num_verts
-        x = center[0] + radius * cos(angle)
-        y = center[1] + radius * sin(angle)
-        z = center[2]
-        vert = bm.verts.new((x, y, z))
-        verts.append(vert)
-    return verts
-
-'''Generate the triangle and its faces with the rings to generate a shape'''
-def bridge_rings(bm, verts_a, verts_b):
-    #Checks if the vertices are of equal weight.
-    if len(verts_a) != len(verts_b):
-        return
-    '''Loops to connect the triangles based on the weight of each vertices and takes into consideration and swaps the vertices
-    if the weight do not match.'''
-    for i in range(len(verts_a)):
-        v1 = verts_a[i]
-        v2 = verts_a[(i + 1) % len(verts_a)]
-        v3 = verts_b[i]
-        v4 = verts_b[(i + 1) % len(verts_b)]
-        
-        '''The process of triangulation and generates a series of triangles( i.e. three vertices for triangles, change this for
-        different polygons'''
-        bm.faces.new([v1, v2, v3])
-        bm.faces.new([v2, v3, v4])
-    
-'''Generate rings for the head. A seperate function for the head as the logic behind creating a head requires more consideration
-due to different mathematical factors '''
-
-def create_head_ring(bm, center, ring_radius, ellipsoid_radius, num_verts):
-    verts = []
-    #Similar to create_ring function but with two additional parameter to consider due to the hade shape being slighlty different.
-    for i in range(num_verts):
-        angle = 2 * pi * i / num_verts
-        x = center[0] + ellipsoid_radius * cos(angle)
-        y = center[1] + ring_radius * sin(angle)
-        z = center[2]
-        vert = bm.verts.new((x, y, z))
-        verts.append(vert)
-    return verts
-
-'''Generate a series of triangles to connect each of the triangles generated based on the parameters'''
-def head_bridge_rings(bm, verts_a, verts_b):
-    for i in range(len(verts_a)):
-        v1 = verts_a[i]
-        v2 = verts_a[(i + 1) % len(verts_a)]
-        v3 = verts_b[i]
-        v4 = verts_b[(i + 1) % len(verts_b)]
-        face_verts = [v1, v2, v4, v3]
-        bm.faces.new(face_verts)
-
-'''Logical algorithm for the generation of head after the triangles are generated. 
-The head usually is an ellipsoid shape so the generation of head at the start generates a simple ellipsoid shape but changes with
-parameters provided by the user to give a more organic head.'''
-def create_head(bm, center, radii, num_segments=200, num_rings=100):
-    # Create vertex rings for the ellipsoid
-    for i in range(num_rings + 1):
-        z_angle = pi * i / num_rings
-        z = center[2] + cos(z_angle) * radii[2]
-        ring_radius = sin(z_angle) * radii[1]
-
-        # A logical statement that provides a smooth curve by adjusting the num_segments at the top.
-        if i < num_rings * 0.25:
-            num_segments_top = num_segments
-        else:
-            num_segments_top = int(num_segments * 1.5)
-
-        verts = []
-        # Loops over to generate the head by adjusting the shape and othedr factors of the head.
-        for j in range(num_segments_top):
-            angle = 2 * pi * j / num_segments
-            x = center[0] + radii[0] * cos(angle)
-
-            # Adjust the y-coordinate for the top vertices to create a rounded shape
-            y = center[1] + ring_radius * sin(angle) * 1.2  # Adjust this factor for desired roundness
-
-            vert = bm.verts.new((x, y, z))
-            verts.append(vert)
-        #Checks to see if the num_rings is not 0. If it is, the generation of triangles fails.
-        if i > 0:
-            head_bridge_rings(bm, prev_verts, verts)
-        prev_verts = verts
-
-'''Properties and parameters for the head shape and assigning an empty mesh to the head.'''
-def create_head_mesh(head_radii):
-    # Create a new mesh
-    mesh = bpy.data.meshes.new("HeadMesh")
-    bm = bmesh.new()
-
-    # Define the center and radii of the head
-    center = (0, 0, 0)
-
-    # Create the head mesh using the defined parameters
-    create_head(bm, center, head_radii)
-
-    # Assign the mesh data to the bmesh
-    bm.to_mesh(mesh)
-    bm.free()
-
-    return mesh
+'''Remove the objects name_1, name_2, ... after the first keep of them together with their meshes, e.g. the legs
+left over when the number of legs goes down.'''
+def remove_extra_parts(name, keep):
+    for obj in list(bpy.data.objects):
+        prefix, _, index = obj.name.partition("_")
+        if prefix == name and index.isdigit() and int(index) > keep:
+            mesh = obj.data
+            bpy.data.objects.remove(obj)
+            if mesh is not None and mesh.users == 0:
+                bpy.data.meshes.remove(mesh)
 
 '''Attach the head mesh to the body'''
 def create_and_attach_head(body_obj, neck_length, head_radii):
-    # Check if the 'Head' object already exists in the scene collection
-    head_obj = bpy.data.objects.get("Head")
-
-    if head_obj is None:
-        # Create the head mesh only if it doesn't exist
-        head_mesh = create_head_mesh(head_radii)
-        head_obj = bpy.data.objects.new("Head", head_mesh)
-        bpy.context.collection.objects.link(head_obj)
+    # Reuse the 'Head' object and only rebuild its mesh when the radii changed
+    head_radii = [float(radius) for radius in head_radii]
+    head_obj = update_part("Head", "HeadMesh", head_radii, lambda: head_geometry((0, 0, 0), head_radii))
 
     # Position the head object at the end of the neck
     head_tip_position = Vector((neck_length, 0, 0))
@@ -148,74 +70,29 @@ def create_and_attach_head(body_obj, neck_length, head_radii):
 
 '''Generate the body mesh based on the parameters'''
 def create_body(length, start_radius, max_radius, wave_amplitude, wave_frequency, num_verts=100):
-    # Create a new mesh
-    mesh = bpy.data.meshes.new("BodyMesh")
-    bm = bmesh.new()
-
-    step_size = 0.1
-    steps = int(length / step_size)
-
-    prev_ring_verts = None
-    last_center = (0, 0, 0)
-    last_radius = start_radius
     top_center = (length, 0, 0)
     bottom_center = (0, 0, 0)
-    #Loop to generate the body mesh after the parameters are provided by the user.
-    for i in range(steps + 1):
-        radius = start_radius + (max_radius - start_radius) * abs(sin(pi * i / steps))
-        wave_y = wave_amplitude * sin(i / wave_frequency * 2 * pi)
-        
-        center = (i * step_size, wave_y, 0)
-        last_center = center
-        last_radius = radius
-        ring_verts = create_ring(bm, center, radius, num_verts)
-        
-        if prev_ring_verts:
-            bridge_rings(bm, prev_ring_verts, ring_verts)
-
-        prev_ring_verts = ring_verts
-    
-    # Assign the mesh data to the bmesh
-    bm.to_mesh(mesh)
-    bm.free()
+    #Radius and center of every ring of the body at once after the parameters are provided by the user.
+    centers, radii = body_rings(length, start_radius, max_radius, wave_amplitude, wave_frequency)
+    last_center = tuple(float(c) for c in centers[-1])
+    last_radius = float(radii[-1])
 
-    # Create a new body object and link it to the scene
-    obj = bpy.data.objects.new("Body", mesh)
-    bpy.context.collection.objects.link(obj)
+    # Assign the ring vertices and the triangles between them to the body mesh when any of its inputs changed
+    obj = update_part("Body", "BodyMesh", [length, start_radius, max_radius, wave_amplitude, wave_frequency, num_verts],
+                      lambda: tube_geometry(centers, radii, num_verts))
 
     # Return the object
     return obj, top_center, bottom_center, last_center, last_radius
 
 '''Generate the tail for the creature based on the parameters provided'''
 def create_tail(body_obj, start_center, start_radius, length, tip_radius, wave_amplitude, wave_frequency, num_verts=100):
-    # Create a new mesh
-    mesh = bpy.data.meshes.new("TailMesh")
-    bm = bmesh.new()
-
-    step_size = length / num_verts
-    steps = num_verts
-
-    prev_ring_verts = None
-    #Loop to generate the tail mesh after the parameters are provided by the user.
-    for i in range(steps + 1):
-        radius = start_radius - (start_radius - tip_radius) * (i / steps)
-        wave_x = wave_amplitude * sin(i / wave_frequency * 2 * pi)
-        
-        center = (start_center[0] - i * step_size, start_center[1] + wave_x, start_center[2])
-        ring_verts = create_ring(bm, center, radius, num_verts)
-        
-        if prev_ring_verts:
-            bridge_rings(bm, prev_ring_verts, ring_verts)
-
-        prev_ring_verts = ring_verts
-
-    # Assign the mesh data to the bmesh
-    bm.to_mesh(mesh)
-    bm.free()
+    #Radius and center of every ring of the tail at once after the parameters are provided by the user.
+    centers, radii = tail_rings(start_center, start_radius, length, tip_radius, wave_amplitude, wave_frequency, num_verts)
 
-    # Create a new tail object and link it to the scene
-    obj = bpy.data.objects.new("Tail", mesh)
-    bpy.context.collection.objects.link(obj)
+    # Assign the ring vertices and the triangles between them to the tail mesh when any of its inputs changed
+    obj = update_part("Tail", "TailMesh", [list(start_center), start_radius, length, tip_radius, wave_amplitude,
+                                           wave_frequency, num_verts],
+                      lambda: tube_geometry(centers, radii, num_verts))
     obj.parent = body_obj
 
     # Return the object
@@ -223,34 +100,13 @@ def create_tail(body_obj, start_center, start_radius, length, tip_radius, wave_a
 
 '''Generate the neck for the creature based on the parameters provided'''
 def create_neck(body_obj, start_center, start_radius, length, end_radius, orientation='x', wave_amplitude=0.3, wave_frequency=30, num_verts=100):
-    # Create a new mesh
-    mesh = bpy.data.meshes.new("NeckMesh")
-    bm = bmesh.new()
-
-    step_size = length / num_verts
-    steps = num_verts
-
-    prev_ring_verts = None
-    #Loop to generate the tail mesh after the parameters are provided by the user.
-    for i in range(steps + 1):
-        radius = start_radius + (end_radius - start_radius) * (i / steps)
-        wave_offset = wave_amplitude * math.sin(i / steps * math.pi * 2)
-        
-        center = (start_center[0] + i * step_size, start_center[1], start_center[2] + wave_offset)
-        ring_verts = create_ring(bm, center, radius, num_verts)
-        
-        if prev_ring_verts:
-            bridge_rings(bm, prev_ring_verts, ring_verts)
-
-        prev_ring_verts = ring_verts
-
-    # Assign the mesh data to the bmesh
-    bm.to_mesh(mesh)
-    bm.free()
+    #Radius and center of every ring of the neck at once after the parameters are provided by the user.
+    centers, radii = neck_rings(start_center, start_radius, length, end_radius, wave_amplitude, num_verts)
 
-    # Create a new object and link it to the scene
-    obj = bpy.data.objects.new("Neck", mesh)
-    bpy.context.collection.objects.link(obj)
+    # Assign the ring vertices and the triangles between them to the neck mesh when any of its inputs changed
+    obj = update_part("Neck", "NeckMesh", [list(start_center), start_radius, length, end_radius, wave_amplitude,
+                                           num_verts],
+                      lambda: tube_geometry(centers, radii, num_verts))
     obj.parent = body_obj
 
     # Rotate the neck along the Z-axis if necessary
@@ -262,62 +118,18 @@ def create_neck(body_obj, start_center, start_radius, length, end_radius, orient
 
 '''Generate the neck for the creature based on the parameters provided. Legs have additional parameters due to the 
 nature of the leg as it has more elements'''
-def create_leg(start_point, end_point, radius, position, thigh_height, shin_height, foot_height, thigh_radius, shin_radius, foot_radius, num_segments=20):
-    # Create a new mesh and object
-    mesh = bpy.data.meshes.new("AnimalLeg")
-    obj = bpy.data.objects.new("AnimalLeg", mesh)
+def create_leg(start_point, end_point, radius, position, thigh_height, shin_height, foot_height, thigh_radius, shin_radius, foot_radius, num_segments=20, name="AnimalLeg"):
+    # Thigh, shin and foot rings, each part bent by its own factor, and the triangles between them, rebuilt only
+    # when the leg inputs changed
+    inputs = [thigh_height, shin_height, foot_height, thigh_radius, shin_radius, foot_radius]
+    obj = update_part(name, "AnimalLeg", inputs, lambda: leg_geometry(*inputs))
 
-    # Link the object to the scene
-    bpy.context.collection.objects.link(obj)
     bpy.context.view_layer.objects.active = obj
     obj.select_set(True)
 
     # Set the position of the leg object
     obj.location = position
 
-    # Initialize a bmesh object and start with the thigh
-    bm = bmesh.new()
-
-    # Parameters for the leg parts
-    segments = 100  # Number of segments per part of the leg
-
-    prev_verts = None
-
-    # New bending parameters
-    thigh_bend = -0.5
-    shin_bend = -0.1
-    foot_bend = 0.5
-
-    for i in range(segments):
-        # Calculate the radius and center for this segment with bending
-        if i < segments / 3:
-            # Thigh with bend
-            radius = thigh_radius - (i / segments) * (thigh_radius - shin_radius)
-            height = (i / segments) * thigh_height
-            center_offset = thigh_bend  # bend for thigh
-        elif i < 2 * segments / 3:
-            # Shin with bend
-            radius = shin_radius - ((i - segments / 3) / segments) * (shin_radius - foot_radius)
-            height = thigh_height + ((i - segments / 3) / segments) * shin_height
-            center_offset = shin_bend  # bend for shin
-        else:
-            # Foot with bend
-            radius = foot_radius
-            height = thigh_height + shin_height + ((i - 2 * segments / 3) / segments) * foot_height
-            center_offset = foot_bend  # bend for foot
-
-        # Apply bending to the center offset based on the segment's height
-        center = (center_offset * height, 0, height)
-        new_verts = create_leg_ring(bm, center, radius)
-
-        if prev_verts:
-            bridge_rings(bm, prev_verts, new_verts)
-        prev_verts = new_verts
-
-    # Assign the mesh data to the bmesh
-    bm.to_mesh(mesh)
-    bm.free()
-
     return obj
 
 def visualize_leg_points(body_obj, num_legs=8, leg_distance=0.5, leg_height=0.5, thigh_height=1.5, shin_height=1.0, foot_height=0.5, thigh_radius=0.2, shin_radius=0.2, foot_radius=0.1):
@@ -350,8 +162,7 @@ def visualize_leg_points(body_obj, num_legs=8, leg_distance=0.5, leg_height=0.5,
 
         # Create leg object with a unique name based on its position
         leg_name = f"Leg_{i+1}" 
-        leg_obj = create_leg(Vector((x_offset, 0, leg_z)), Vector((x_offset, 0, leg_z - leg_height)), radius=0.1, position=Vector((x_offset, 0, leg_z)), thigh_height=thigh_height, shin_height=shin_height, foot_height=foot_height, thigh_radius=thigh_radius, shin_radius=shin_radius, foot_radius=foot_radius)
-        leg_obj.name = leg_name  # Assign unique name to the leg object
+        leg_obj = create_leg(Vector((x_offset, 0, leg_z)), Vector((x_offset, 0, leg_z - leg_height)), radius=0.1, position=Vector((x_offset, 0, leg_z)), thigh_height=thigh_height, shin_height=shin_height, foot_height=foot_height, thigh_radius=thigh_radius, shin_radius=shin_radius, foot_radius=foot_radius, name=leg_name)
 
         # Set rotation for the leg
 
@@ -377,45 +188,10 @@ def visualize_leg_points(body_obj, num_legs=8, leg_distance=0.5, leg_height=0.5,
 
 '''Generate the wings for the creature based on the parameters provided by the user.'''
 
-def create_wing(body_obj, position, wing_length, wing_thickness, start_width, end_width, num_verts=20, num_verts_w=10):
-    bm = bmesh.new()
-    verts = []
-
-    for i in range(num_verts):
-        for j in range(num_verts_w):
-            # Calculate the width of the wing at this position based on the start and end widths
-            width = start_width + (end_width - start_width) * (i / num_verts)
-
-            # Calculate the position of each vertex relative to the origin
-            x = (wing_length / num_verts) * i
-            z = (width / num_verts_w) * j * (-1 if j % 2 == 0 else 1)  # Zigzag pattern
-
-            # Apply a sine function to the y-coordinate to create irregularities
-            y_offset = (width / 2) * math.sin((i / num_verts) * math.pi) * math.cos((j / num_verts_w) * math.pi)
-
-            # Create the vertex
-            vert = bm.verts.new((x, y_offset, z))
-            verts.append(vert)
-
-    # Bridge vertices to create faces
-    for i in range(num_verts - 1):
-        for j in range(num_verts_w - 1):
-            v1 = verts[i * num_verts_w + j]
-            v2 = verts[i * num_verts_w + (j + 1)]
-            v3 = verts[(i + 1) * num_verts_w + (j + 1)]
-            v4 = verts[(i + 1) * num_verts_w + j]
-            face_verts = [v1, v2, v3, v4]
-            bm.faces.new(face_verts)
-
-    # Create a new mesh
-    mesh = bpy.data.meshes.new("WingMesh")
-    # Assign the mesh data to the bmesh
-    bm.to_mesh(mesh)
-    bm.free()
-
-    # Create a new object and link it to the scene
-    obj = bpy.data.objects.new("Wing", mesh)
-    bpy.context.collection.objects.link(obj)
+def create_wing(body_obj, position, wing_length, wing_thickness, start_width, end_width, num_verts=20, num_verts_w=10, name="Wing"):
+    # The zigzag sheet of quads of the wing, rebuilt only when the wing inputs changed
+    inputs = [wing_length, start_width, end_width, num_verts, num_verts_w]
+    obj = update_part(name, "WingMesh", inputs, lambda: wing_geometry(*inputs))
     obj.parent = body_obj
     obj.location = position
 
@@ -450,8 +226,7 @@ def visualize_wing_points(body_obj, num_wings=2, wing_distance=0.1, wing_height=
     for i in range(num_wings):
         # Create wing object with a unique name based on its position
         wing_name = f"Wing_{i+1}" 
-        wing_obj = create_wing(body_obj, Vector((x_offset, wing_y, wing_z)), wing_length, wing_thickness, start_width, end_width)
-        wing_obj.name = wing_name  # Assign unique name to the wing object
+        wing_obj = create_wing(body_obj, Vector((x_offset, wing_y, wing_z)), wing_length, wing_thickness, start_width, end_width, name=wing_name)
 
         # Apply rotation for odd and even numbered wings
         if (i + 1) % 2 == 1:
@@ -519,6 +294,16 @@ def create_painted_texture_material(image_path, tex_coord_location=(-600, 0),
 
     return material
 
+'''Reuse the material of an image that was already loaded, a new material and image are only created when the image
+path changed.'''
+def painted_texture_material(image_path):
+    for material in bpy.data.materials:
+        if material.get("image_path") == image_path:
+            return material
+    material = create_painted_texture_material(image_path)
+    material["image_path"] = image_path
+    return material
+
 '''Assigning the materail to the creature and checks if the materials has been assigned properly. Also replaces the materials
 if it is alread assigned with the new material'''
 def assign_material_to_objects(material):
@@ -671,9 +456,12 @@ class OBJECT_OT_GenerateCreature(bpy.types.Operator):
     bl_options = {'REGISTER', 'UNDO'}
 
     def execute(self, context):
-        # Clear the scene and delete all existing objects
+        # Clear the scene of the mesh objects that are not parts of the creature. The parts are kept and only the ones
+        # whose inputs changed are regenerated below, in their existing meshes
         bpy.ops.object.select_all(action='DESELECT')
-        bpy.ops.object.select_by_type(type='MESH')
+        for obj in context.scene.objects:
+            if obj.type == 'MESH' and PART_INPUTS_KEY not in obj:
+                obj.select_set(True)
         bpy.ops.object.delete()
 
         # Get the creature properties
@@ -688,7 +476,9 @@ class OBJECT_OT_GenerateCreature(bpy.types.Operator):
             wave_frequency=props.body_wave_frequency,
             num_verts=props.body_num_verts
         )
-        
+        # the legs and wings are placed from the body dimensions, which have to include a body mesh refilled in place
+        context.view_layer.update()
+
         neck_obj = create_neck(body_obj,
             start_center=top_center,
             start_radius=top_radius,
@@ -732,6 +522,8 @@ class OBJECT_OT_GenerateCreature(bpy.types.Operator):
                 shin_radius=shin_radius,
                 foot_radius=foot_radius,
         )
+        # the legs beyond num_legs, or all of them when legs are off, are removed with their meshes
+        remove_extra_parts("Leg", props.num_legs if props.generate_legs else 0)
 
         # Attach head to the body
         head_obj = create_and_attach_head(body_obj, props.body_length + props.neck_length, 
@@ -746,6 +538,7 @@ class OBJECT_OT_GenerateCreature(bpy.types.Operator):
                 start_width = props.wing_start_width, 
                 end_width = props.wing_end_width
             )
+        remove_extra_parts("Wing", props.num_wings if props.generate_wings else 0)
 
         # Rotate objects as needed
         body_obj.rotation_euler = (math.radians(-90), 0, 0)
@@ -756,10 +549,11 @@ class OBJECT_OT_GenerateCreature(bpy.types.Operator):
         
         
         material_path = bpy.path.abspath(props.material_path)
-        material = create_painted_texture_material(material_path)
+        material = painted_texture_material(material_path)
         if material:
             for obj in bpy.data.objects:
-                if obj.type == 'MESH':
+                # meshes refilled in place keep their material, only new meshes or a new material need assigning
+                if obj.type == 'MESH' and list(obj.data.materials) != [material]:
                     obj.data.materials.clear()
                     obj.data.materials.append(material)
         else: